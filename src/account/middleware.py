@@ -10,29 +10,44 @@
 
 from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
 from django.shortcuts import render
 
 from account.models import UserProfile
 
 from laas_dashboard.settings import SITE_CONTACT
 
+class UserProfileMiddleware(MiddlewareMixin):
+    """
+    Attach the user's profile to the request as request.user_profile.
+
+    The profile is loaded lazily and at most once per request, so middleware and views
+    can share it instead of each querying UserProfile.objects.get(user=request.user).
+    It is None for anonymous users.
+    Must come after AuthenticationMiddleware.
+    """
+
+    def process_request(self, request):
+        request.user_profile = SimpleLazyObject(lambda: get_user_profile(request))
+
+
+def get_user_profile(request):
+    if not request.user.is_authenticated:
+        return None
+    return UserProfile.for_user(request.user)
+
+
 class TimezoneMiddleware(MiddlewareMixin):
     """
     Manage user's Timezone preference.
 
-    Activate the timezone from request.user.userprofile if user is authenticated,
+    Activate the timezone from request.user_profile if user is authenticated,
     deactivate the timezone otherwise and use default (UTC)
     """
 
     def process_request(self, request):
         if request.user.is_authenticated:
-            try:
-                tz = request.user.userprofile.timezone
-                timezone.activate(tz)
-            except UserProfile.DoesNotExist:
-                UserProfile.objects.create(user=request.user)
-                tz = request.user.userprofile.timezone
-                timezone.activate(tz)
+            timezone.activate(request.user_profile.timezone)
         else:
             timezone.deactivate()
 
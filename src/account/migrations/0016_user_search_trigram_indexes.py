@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-19 14:02
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# The user search endpoint filters with icontains / istartswith, which Django
+# compiles to UPPER("column"::text) LIKE UPPER(...) on postgres, so the indexes
+# are built over that same expression.
+INDEXES = [
+    ("auth_user_username_upper_trgm", "auth_user", "username"),
+    ("user_profile_full_name_upper_trgm", "user_profile", "full_name"),
+    ("user_profile_email_addr_upper_trgm", "user_profile", "email_addr"),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0015_remove_lab_contact_phone_alter_lab_lab_logo_link'),
+    ]
+
+    operations = [TrigramExtension()] + [
+        migrations.RunSQL(
+            sql=f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" USING gin (UPPER("{column}"::text) gin_trgm_ops);',
+            reverse_sql=f'DROP INDEX IF EXISTS "{name}";',
+        )
+        for name, table, column in INDEXES
+    ]
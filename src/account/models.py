@@ -17,7 +17,8 @@ from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 from collections import Counter
@@ -61,6 +62,31 @@ class UserProfile(models.Model):
 
     def __str__(self):
         return self.user.username
+
+    @staticmethod
+    def cache_key(user_id: int) -> str:
+        return f"user_profile:{user_id}"
+
+    @staticmethod
+    def for_user(user: User):
+        """
+        Returns the profile for the given user, creating one if it does not exist yet.
+
+        If USER_PROFILE_CACHE_TIMEOUT is set, profiles are also cached across requests
+        and invalidated whenever a profile is saved or deleted.
+        The returned profile shares the given user object, so profile.user does not cause another query.
+        """
+        timeout = settings.USER_PROFILE_CACHE_TIMEOUT
+        profile = cache.get(UserProfile.cache_key(user.id)) if timeout else None
+
+        if profile is None:
+            profile, _ = UserProfile.objects.get_or_create(user_id=user.id)
+            if timeout:
+                cache.set(UserProfile.cache_key(user.id), profile, timeout)
+
+        profile.user = user
+        return profile
+
     @staticmethod
     def create_tokens_for_all():
         for user in User.objects.all():
@@ -131,3 +157,14 @@ class Downtime(models.Model):
             raise ValueError('Overlapping Downtime')
 
         return super(Downtime, self).save(*args, **kwargs)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def on_profile_change_invalidate_cache(sender, instance, **kwargs):
+    """
+    Drops the cached copy of a profile whenever it changes, see UserProfile.for_user().
+
+    NOTE - QuerySet.update() does not send these signals, so it will not invalidate the cache.
+    """
+    cache.delete(UserProfile.cache_key(instance.user_id))
@@ -1,7 +1,9 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory, override_settings
+from django.core.cache import cache
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
 from account.models import UserProfile, Lab, LabStatus
+from account.middleware import UserProfileMiddleware
 from django.db.models import QuerySet
 from django.db.utils import IntegrityError
 
@@ -115,3 +117,102 @@ class SchemaTests(TestCase):
         self.assertEqual(lab.lab_home_link, None)
         
 
+
+class UserSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@email.com", "testpass")
+        UserProfile.objects.create(user=cls.owner, public_user=True, ipa_username="owner")
+
+        for i in range(30):
+            UserProfile.objects.create(
+                user=User.objects.create_user(f"searchuser{i:02}", f"searchuser{i}@email.com", "testpass"),
+                full_name=f"Search User {i}",
+                email_addr=f"searchuser{i}@email.com",
+                public_user=True,
+                ipa_username=f"searchuser{i:02}",
+            )
+
+        # private users and users without a linked ipa account are never returned
+        UserProfile.objects.create(user=User.objects.create_user("searchprivate"), ipa_username="searchprivate")
+        UserProfile.objects.create(user=User.objects.create_user("searchunlinked"), public_user=True)
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def search(self, **params):
+        return self.client.get("/accounts/users/search/", params).json()
+
+    def test_search_requires_login(self):
+        self.client.logout()
+        response = self.client.get("/accounts/users/search/", {"q": "search"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_search_is_paginated(self):
+        first = self.search(q="searchuser")
+        self.assertEqual(len(first["items"]), 20)
+        self.assertTrue(first["has_next"])
+
+        second = self.search(q="searchuser", page=2)
+        self.assertEqual(len(second["items"]), 10)
+        self.assertFalse(second["has_next"])
+
+        usernames = [i["small_name"] for i in first["items"] + second["items"]]
+        self.assertEqual(usernames, sorted(f"searchuser{i:02}" for i in range(30)))
+
+    def test_search_matches_name_and_email(self):
+        by_name = self.search(q="User 7")
+        self.assertEqual([i["small_name"] for i in by_name["items"]], ["searchuser07"])
+
+        by_email = self.search(q="searchuser12@")
+        self.assertEqual([i["small_name"] for i in by_email["items"]], ["searchuser12"])
+
+    def test_search_excludes_requester_and_hidden_users(self):
+        usernames = [i["small_name"] for i in self.search(q="s", page=1)["items"]]
+        usernames += [i["small_name"] for i in self.search(q="s", page=2)["items"]]
+        self.assertNotIn("searchprivate", usernames)
+        self.assertNotIn("searchunlinked", usernames)
+        self.assertEqual(len(self.search(q="owner")["items"]), 0)
+
+
+class UserProfileMemoizationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("memo", "memo@email.com", "testpass")
+        UserProfile.objects.create(user=cls.user, timezone="America/New_York")
+
+    def setUp(self):
+        cache.clear()
+
+    def make_request(self):
+        request = RequestFactory().get("/")
+        request.user = User.objects.get(id=self.user.id)
+        UserProfileMiddleware(lambda r: None).process_request(request)
+        return request
+
+    def test_profile_loaded_once_per_request(self):
+        request = self.make_request()
+        with self.assertNumQueries(1):
+            self.assertEqual(request.user_profile.timezone, "America/New_York")
+            self.assertEqual(request.user_profile.user.username, "memo")
+            self.assertEqual(str(request.user_profile), "memo")
+
+    def test_profile_created_if_missing(self):
+        user = User.objects.create_user("noprofile")
+        profile = UserProfile.for_user(user)
+        self.assertEqual(profile.user, user)
+        self.assertTrue(UserProfile.objects.filter(user=user).exists())
+
+    @override_settings(USER_PROFILE_CACHE_TIMEOUT=60)
+    def test_profile_cached_across_requests_until_saved(self):
+        UserProfile.for_user(self.user)
+        with self.assertNumQueries(0):
+            profile = UserProfile.for_user(self.user)
+
+        profile.timezone = "UTC"
+        profile.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(UserProfile.for_user(self.user).timezone, "UTC")
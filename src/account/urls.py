@@ -34,7 +34,8 @@ from account.views import (
     account_booking_view,
     account_detail_view,
     account_settings_view,
-    account_dev_login_view
+    account_dev_login_view,
+    account_user_search_view
 )
 
 app_name = 'account'
@@ -47,4 +48,5 @@ urlpatterns = [
     path('my/bookings/', account_booking_view, name='my-bookings'),
     path('my/', account_detail_view, name='my-account'),
     path('dev_login/', account_dev_login_view, name='dev-login'),
+    path('users/search/', account_user_search_view, name='user-search'),
 ]
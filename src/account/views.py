@@ -16,12 +16,13 @@ from django.utils import timezone
 from django.contrib.auth import logout, authenticate,login as django_login
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
+from django.db.models import Q
 from django.urls import reverse
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
 from django.views.generic import RedirectView
 from django.shortcuts import render
-from booking.lib import attempt_end_booking
+from booking.lib import attempt_end_booking, search_user_items
 from mozilla_django_oidc.auth import OIDCAuthenticationBackend
 from laas_dashboard.settings import PROJECT, AUTH_SETTING, SITE_CONTACT
 
@@ -37,7 +38,7 @@ def account_settings_view(request):
         if not request.user.is_authenticated:
             return login(request)
 
-        profile = UserProfile.objects.get(user=request.user)
+        profile = request.user_profile
 
         ipa_user = user_get_user(profile.ipa_username)
         template = "account/settings.html"
@@ -63,7 +64,7 @@ def account_update_settings(request):
         return HttpResponse(status=405)
 
     data = json.loads(request.body.decode('utf-8'))
-    profile = UserProfile.objects.get(user=request.user)
+    profile = request.user_profile
     profile.public_user = data["public_user"]
 
     if data["timezone"] in pytz.common_timezones:
@@ -152,7 +153,7 @@ def account_resource_view(request):
             return render(request, "dashboard/login.html", {'title': 'Authentication Required'})
         template = "account/resource_list.html"
 
-        profile = UserProfile.objects.get(user=request.user)
+        profile = request.user_profile
         if (not profile or profile.ipa_username == None):
             return redirect("dashboard:index")
 
@@ -177,7 +178,7 @@ def account_delete_resource(request):
     data = json.loads(request.body.decode('utf-8'))
     template_id = data["template_id"]
 
-    if not canDeleteTemplate(template_id, UserProfile.objects.get(user=request.user).ipa_username):
+    if not canDeleteTemplate(template_id, request.user_profile.ipa_username):
         return HttpResponse(status=401)
 
     response = template_delete_template(template_id)
@@ -200,15 +201,17 @@ def account_booking_view(request):
         if not request.user.is_authenticated:
             return render(request, "dashboard/login.html", {'title': 'Authentication Required'})
 
-        profile = UserProfile.objects.get(user=request.user)
+        profile = request.user_profile
         if (not profile or profile.ipa_username == None):
             return redirect("dashboard:index")
 
         template = "account/booking_list.html"
         bookings = list(Booking.objects.filter(owner=request.user, end__gt=timezone.now()).order_by("-start"))
-        my_old_bookings = Booking.objects.filter(owner=request.user, end__lt=timezone.now()).order_by("-start")
-        collab_old_bookings = request.user.collaborators.filter(end__lt=timezone.now()).order_by("-start")
-        expired_bookings = list(my_old_bookings.union(collab_old_bookings))
+        expired_bookings = list(
+            Booking.objects.filter(Q(owner=request.user) | Q(collaborators=request.user), end__lt=timezone.now())
+            .distinct()
+            .order_by("-start")
+        )
         collab_bookings = list(request.user.collaborators.filter(end__gt=timezone.now()).order_by("-start"))
         context = {
             "title": "My Bookings",
@@ -243,6 +246,35 @@ def account_cancel_booking(request):
 
 
 
+def account_user_search_view(request):
+    """
+    Paginated typeahead search over public users, used by the collaborator selection widget.
+    Query parameters: q (search text), page (1-indexed).
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        return HttpResponse(status=400)
+
+    items, has_next = search_user_items(
+        request.GET.get("q", ""),
+        exclude=request.user,
+        page=page,
+    )
+
+    return JsonResponse({
+        "items": items,
+        "page": page,
+        "has_next": has_next,
+    })
+
+
 def account_dev_login_view(request):
     dev_login = True if AUTH_SETTING == 'DEV_NORMAL' else False
     if not dev_login:
@@ -0,0 +1,190 @@
+##############################################################################
+# Copyright (c) 2020 Sean Smith and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Full dumps of bookings (live and archived), their collaborators and API logs for reporting.
+# Rows are read with iterator(), which uses a server side cursor on postgres, and written out a chunk at a time,
+# so an export uses the same memory however big the table is.
+
+import csv
+import json
+from datetime import date, datetime
+from typing import Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.models import APILog
+from booking.models import ArchivedBooking, Booking
+from laas_dashboard.settings import EXPORT_CHUNK_SIZE
+
+FORMATS = ["csv", "ndjson"]
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def booking_rows(start: datetime = None, end: datetime = None, project: str = None):
+    # bookings that overlap the range
+    bookings = Booking.objects.all()
+    if start is not None:
+        bookings = bookings.filter(end__gt=start)
+    if end is not None:
+        bookings = bookings.filter(start__lt=end)
+    if project is not None:
+        bookings = bookings.filter(project=project)
+    return bookings
+
+
+BOOKING_FIELDS = [
+    "id",
+    "owner__username",
+    "purpose",
+    "project",
+    "details",
+    "lab__name",
+    "start",
+    "end",
+    "ext_days",
+    "aggregateId",
+    "complete",
+]
+ARCHIVED_BOOKING_FIELDS = [
+    "id",
+    "owner__username",
+    "collaborator_ids",
+    "purpose",
+    "project",
+    "lab_name",
+    "start",
+    "end",
+    "aggregateId",
+    "archived",
+]
+COLLABORATOR_FIELDS = ["booking_id", "user__username"]
+APILOG_FIELDS = ["id", "user__username", "call_time", "method", "endpoint", "ip_addr", "body"]
+
+
+def bookings(start=None, end=None, project=None):
+    return booking_rows(start, end, project).order_by("id").values(*BOOKING_FIELDS)
+
+
+def archived_bookings(start=None, end=None, project=None):
+    archived = ArchivedBooking.objects.all()
+    if start is not None:
+        archived = archived.filter(end__gt=start)
+    if end is not None:
+        archived = archived.filter(start__lt=end)
+    if project is not None:
+        archived = archived.filter(project=project)
+    return archived.order_by("id").values(*ARCHIVED_BOOKING_FIELDS)
+
+
+def collaborators(start=None, end=None, project=None):
+    return Booking.collaborators.through.objects.filter(
+        booking__in=booking_rows(start, end, project)
+    ).order_by("id").values(*COLLABORATOR_FIELDS)
+
+
+def apilogs(start=None, end=None, project=None):
+    if project is not None:
+        raise ValueError("API logs can't be filtered by project")
+    logs = APILog.objects.all()
+    if start is not None:
+        logs = logs.filter(call_time__gte=start)
+    if end is not None:
+        logs = logs.filter(call_time__lt=end)
+    return logs.order_by("id").values(*APILOG_FIELDS)
+
+
+# name -> (columns, rows)
+DATASETS = {
+    "bookings": (BOOKING_FIELDS, bookings),
+    "archived_bookings": (ARCHIVED_BOOKING_FIELDS, archived_bookings),
+    "collaborators": (COLLABORATOR_FIELDS, collaborators),
+    "apilogs": (APILOG_FIELDS, apilogs),
+}
+
+
+def parse_time(value: str | None) -> datetime | None:
+    """
+    Parses an ISO 8601 date or datetime, naive ones are taken to be in the dashboard's timezone.
+    Raises ValueError if it isn't one.
+    """
+    if value is None:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        parsed = datetime.combine(date.fromisoformat(value), datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Echo:
+    """
+    A file-like object that hands back what is written to it, so csv.writer can format a row without buffering it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def csv_lines(fields: list[str], rows) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([csv_cell(row[field]) for field in fields])
+
+
+def ndjson_lines(fields: list[str], rows) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+WRITERS = {
+    "csv": csv_lines,
+    "ndjson": ndjson_lines,
+}
+
+
+def export(dataset: str, format: str, start: datetime = None, end: datetime = None, project: str = None,
+           chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yields the given dataset in the given format, chunk_size rows at a time.
+    Raises ValueError for an unknown dataset or format, or a filter the dataset doesn't support.
+    """
+    if dataset not in DATASETS:
+        raise ValueError("dataset must be one of " + ", ".join(DATASETS))
+    if format not in WRITERS:
+        raise ValueError("format must be one of " + ", ".join(FORMATS))
+
+    fields, rows = DATASETS[dataset]
+    lines = WRITERS[format](fields, rows(start, end, project).iterator(chunk_size=chunk_size))
+    return chunked(lines, chunk_size)
+
+
+def chunked(lines: Iterator[str], size: int) -> Iterator[str]:
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
@@ -0,0 +1,75 @@
+##############################################################################
+# Copyright (c) 2020 Sean Smith and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from analytics.utilization import concurrency
+
+YEAR = 365 * 24 * 3600
+
+
+def naive_active(starts, ends, edges, resolution) -> np.ndarray:
+    # per bucket overlap count, what the sweep line replaces
+    return np.array([np.count_nonzero((starts < edge + resolution) & (ends > edge)) for edge in edges])
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the utilization sweep line on synthetic bookings, without touching the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bookings", type=int, default=1_000_000)
+        parser.add_argument("--resolution", type=int, default=3600, help="bucket size in seconds")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--naive-sample", type=int, default=200,
+                            help="buckets to time the per bucket approach on, it is extrapolated to the full range")
+        parser.add_argument("--json", action="store_true", help="print the results as json")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        n = options["bookings"]
+        resolution = options["resolution"]
+
+        # bookings over a year, mostly a few days long with a long tail, like real ones
+        starts = rng.integers(0, YEAR, n, dtype=np.int64)
+        ends = starts + np.minimum(rng.exponential(5 * 24 * 3600, n).astype(np.int64) + 3600, 42 * 24 * 3600)
+
+        timings = []
+        for _ in range(options["repeat"]):
+            begin = time.perf_counter()
+            result = concurrency(starts, ends, 0, YEAR, resolution)
+            timings.append(time.perf_counter() - begin)
+
+        edges = result["buckets"]
+        sample = edges[:options["naive_sample"]]
+        begin = time.perf_counter()
+        expected = naive_active(starts, ends, sample, resolution)
+        naive_seconds = (time.perf_counter() - begin) * len(edges) / max(len(sample), 1)
+
+        if not np.array_equal(expected, result["active"][:len(sample)]):
+            self.stderr.write("Sweep line and per bucket counts disagree!")
+
+        report = {
+            "bookings": n,
+            "buckets": len(edges),
+            "sweep_seconds_best": round(min(timings), 4),
+            "sweep_seconds_median": round(float(np.median(timings)), 4),
+            "naive_seconds_estimated": round(naive_seconds, 2),
+            "max_peak": int(result["peak"].max()),
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+        else:
+            for key, value in report.items():
+                self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,48 @@
+##############################################################################
+# Copyright (c) 2020 Sean Smith and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.exports import DATASETS, FORMATS, export, parse_time
+from laas_dashboard.settings import EXPORT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Writes a full dump of bookings, collaborators or API logs as CSV or NDJSON, in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", choices=list(DATASETS))
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--start", help="ISO 8601 date or datetime, only bookings overlapping / API calls made after it")
+        parser.add_argument("--end", help="ISO 8601 date or datetime, only bookings overlapping / API calls made before it")
+        parser.add_argument("--project", help="only bookings of this project, and their collaborators")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+        parser.add_argument("--output", "-o", help="file to write to, defaults to stdout")
+
+    def handle(self, *args, **options):
+        try:
+            lines = export(
+                options["dataset"],
+                options["format"],
+                start=parse_time(options["start"]),
+                end=parse_time(options["end"]),
+                project=options["project"],
+                chunk_size=options["chunk_size"],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        if options["output"] is None:
+            for chunk in lines:
+                self.stdout.write(chunk, ending="")
+            return
+
+        with open(options["output"], "w", newline="") as f:
+            for chunk in lines:
+                f.write(chunk)
@@ -0,0 +1,58 @@
+# Generated by Django 5.0 on 2026-10-19 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('analytics', '0003_delete_activevpnuser'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSnapshot',
+            fields=[
+                ('booking_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'analytics_booking_snapshot',
+            },
+        ),
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('value', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'analytics_watermark',
+            },
+        ),
+        migrations.CreateModel(
+            name='BookingRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('dimension', models.CharField(choices=[('all', 'All'), ('project', 'Project'), ('purpose', 'Purpose'), ('lab', 'Lab')], max_length=20)),
+                ('value', models.CharField(blank=True, default='', max_length=300)),
+                ('started', models.IntegerField(default=0)),
+                ('ended', models.IntegerField(default=0)),
+                ('active', models.IntegerField(default=0)),
+                ('users', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'analytics_booking_rollup',
+                'indexes': [models.Index(fields=['granularity', 'dimension', 'bucket'], name='analytics_b_granula_8527f3_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookingrollup',
+            constraint=models.UniqueConstraint(fields=('granularity', 'dimension', 'value', 'bucket'), name='unique_booking_rollup'),
+        ),
+    ]
@@ -6,3 +6,93 @@
 # which accompanies this distribution, and is available at
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
+
+from django.db import models
+
+
+class Granularity(object):
+    """
+    A Poor man's enum for the bucket size of a BookingRollup.
+    """
+
+    HOUR = "hour"
+    DAY = "day"
+
+    CHOICES = [(HOUR, "Hour"), (DAY, "Day")]
+
+
+class Dimension(object):
+    """
+    A Poor man's enum for what a BookingRollup is grouped by.
+    ALL rollups cover every booking, the others have one rollup per distinct value of that booking field.
+    """
+
+    ALL = "all"
+    PROJECT = "project"
+    PURPOSE = "purpose"
+    LAB = "lab"
+
+    CHOICES = [(ALL, "All"), (PROJECT, "Project"), (PURPOSE, "Purpose"), (LAB, "Lab")]
+
+
+class BookingRollup(models.Model):
+    """
+    Booking activity within one hour or day, for one project / purpose / lab (or for every booking).
+    Maintained by analytics.rollups.update_rollups(), the stats page reads these instead of scanning the booking table.
+    """
+
+    granularity = models.CharField(max_length=10, choices=Granularity.CHOICES)
+    # start of the bucket
+    bucket = models.DateTimeField()
+    dimension = models.CharField(max_length=20, choices=Dimension.CHOICES)
+    # project / purpose / lab name, empty for Dimension.ALL
+    value = models.CharField(max_length=300, blank=True, default="")
+
+    # bookings that started / ended within the bucket
+    started = models.IntegerField(default=0)
+    ended = models.IntegerField(default=0)
+    # bookings that were active at any point within the bucket
+    active = models.IntegerField(default=0)
+    # distinct owners and collaborators of the active bookings
+    users = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'analytics_booking_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'dimension', 'value', 'bucket'], name='unique_booking_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'dimension', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket} {self.dimension}={self.value}"
+
+
+class BookingSnapshot(models.Model):
+    """
+    The interval of a booking as it was when it was last rolled up.
+    If the booking changes, the buckets it used to cover are recomputed too.
+    """
+
+    booking_id = models.IntegerField(primary_key=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    class Meta:
+        db_table = 'analytics_booking_snapshot'
+
+
+class Watermark(models.Model):
+    """
+    How far a rollup has processed its source table.
+    """
+
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.DateTimeField()
+
+    class Meta:
+        db_table = 'analytics_watermark'
+
+    def __str__(self):
+        return f"{self.name} at {self.value}"
@@ -0,0 +1,196 @@
+##############################################################################
+# Copyright (c) 2020 Sean Smith and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Incremental hourly and daily booking rollups.
+# Each run only looks at bookings changed since the last run (Booking.updated) and recomputes the buckets they cover,
+# plus the buckets time has moved through since then.
+
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from analytics.models import BookingRollup, BookingSnapshot, Dimension, Granularity, Watermark
+from booking.models import ArchivedBooking, Booking
+from laas_dashboard.settings import ANALYTICS_HOURLY_RETENTION, ANALYTICS_WATERMARK_LAG
+
+WATERMARK = "booking_rollups"
+
+STEPS = {
+    Granularity.HOUR: timedelta(hours=1),
+    Granularity.DAY: timedelta(days=1),
+}
+
+
+def floor_bucket(dt: datetime, granularity: str) -> datetime:
+    dt = dt.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == Granularity.DAY:
+        dt = dt.replace(hour=0)
+    return dt
+
+
+def ceil_bucket(dt: datetime, granularity: str) -> datetime:
+    floored = floor_bucket(dt, granularity)
+    return floored if floored == dt else floored + STEPS[granularity]
+
+
+def buckets(start: datetime, end: datetime, granularity: str):
+    """
+    Yields the start of every bucket that overlaps [start, end).
+    """
+    bucket = floor_bucket(start, granularity)
+    while bucket < end:
+        yield bucket
+        bucket += STEPS[granularity]
+
+
+def merge_intervals(intervals: list[tuple[datetime, datetime]]) -> list[tuple[datetime, datetime]]:
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def booking_keys(booking: dict) -> list[tuple[str, str]]:
+    return [
+        (Dimension.ALL, ""),
+        (Dimension.PROJECT, booking["project"] or ""),
+        (Dimension.PURPOSE, booking["purpose"] or ""),
+        (Dimension.LAB, booking["lab__name"] or ""),
+    ]
+
+
+def compute_rollups(granularity: str, start: datetime, end: datetime, now: datetime) -> list[BookingRollup]:
+    """
+    Computes every rollup of the given granularity for the buckets in [start, end), which must be bucket aligned.
+    Only what has happened by now is counted.
+    """
+    bookings = list(
+        Booking.objects.filter(start__lt=end, end__gt=start, start__lte=now)
+        .values("id", "start", "end", "project", "purpose", "lab__name", "owner_id")
+    )
+    users = defaultdict(set)
+    for booking_id, user_id in Booking.collaborators.through.objects.filter(
+        booking_id__in=[b["id"] for b in bookings]
+    ).values_list("booking_id", "user_id"):
+        users[booking_id].add(user_id)
+
+    # bookings moved out of the booking table by dashboard.retention still count
+    for archived in ArchivedBooking.objects.filter(start__lt=end, end__gt=start, start__lte=now).values(
+        "id", "start", "end", "project", "purpose", "lab_name", "owner_id", "collaborator_ids"
+    ):
+        users[archived["id"]].update(archived.pop("collaborator_ids"))
+        archived["lab__name"] = archived.pop("lab_name")
+        bookings.append(archived)
+
+    counts = defaultdict(lambda: {"started": 0, "ended": 0, "active": 0, "users": set()})
+    for booking in bookings:
+        keys = booking_keys(booking)
+        booking_users = users[booking["id"]] | {booking["owner_id"]}
+
+        for bucket in buckets(max(booking["start"], start), min(booking["end"], end, now), granularity):
+            for key in keys:
+                counts[(bucket, key)]["active"] += 1
+                counts[(bucket, key)]["users"] |= booking_users
+
+        if start <= booking["start"] < end:
+            for key in keys:
+                counts[(floor_bucket(booking["start"], granularity), key)]["started"] += 1
+
+        if start <= booking["end"] < end and booking["end"] <= now:
+            for key in keys:
+                counts[(floor_bucket(booking["end"], granularity), key)]["ended"] += 1
+
+    return [
+        BookingRollup(
+            granularity=granularity,
+            bucket=bucket,
+            dimension=dimension,
+            value=value,
+            started=c["started"],
+            ended=c["ended"],
+            active=c["active"],
+            users=len(c["users"]),
+        )
+        for (bucket, (dimension, value)), c in counts.items()
+    ]
+
+
+def update_rollups(now: datetime = None) -> dict:
+    """
+    Brings the booking rollups up to date and returns what was done.
+
+    Bookings changed since the last run (minus ANALYTICS_WATERMARK_LAG, to catch transactions that committed late) have
+    every bucket they cover, now or when they were last rolled up, recomputed. Hourly rollups are only kept for
+    ANALYTICS_HOURLY_RETENTION. The first run rolls up every booking.
+    """
+    started_at = time.monotonic()
+    now = now or timezone.now()
+    rollups = 0
+
+    with transaction.atomic():
+        # locked, so only one run at a time
+        watermark, first_run = Watermark.objects.select_for_update().get_or_create(name=WATERMARK, defaults={"value": now})
+
+        changed = Booking.objects.all()
+        if not first_run:
+            since = watermark.value - ANALYTICS_WATERMARK_LAG
+            changed = changed.filter(updated__gt=since)
+        changed = list(changed.values("id", "start", "end"))
+
+        snapshots = BookingSnapshot.objects.in_bulk([b["id"] for b in changed])
+        dirty = []
+        for booking in changed:
+            start, end = booking["start"], booking["end"]
+            snapshot = snapshots.get(booking["id"])
+            if snapshot is not None:
+                start, end = min(start, snapshot.start), max(end, snapshot.end)
+            dirty.append((start, end))
+        if not first_run:
+            dirty.append((since, now))
+
+        hourly_cutoff = floor_bucket(now - ANALYTICS_HOURLY_RETENTION, Granularity.HOUR)
+        for granularity in (Granularity.DAY, Granularity.HOUR):
+            aligned = []
+            for start, end in dirty:
+                if granularity == Granularity.HOUR:
+                    start = max(start, hourly_cutoff)
+                end = min(end, now)
+                if start < end:
+                    aligned.append((floor_bucket(start, granularity), ceil_bucket(end, granularity)))
+
+            for start, end in merge_intervals(aligned):
+                BookingRollup.objects.filter(granularity=granularity, bucket__gte=start, bucket__lt=end).delete()
+                rollups += len(BookingRollup.objects.bulk_create(
+                    compute_rollups(granularity, start, end, now), batch_size=1000
+                ))
+
+        BookingRollup.objects.filter(granularity=Granularity.HOUR, bucket__lt=hourly_cutoff).delete()
+
+        BookingSnapshot.objects.bulk_create(
+            [BookingSnapshot(booking_id=b["id"], start=b["start"], end=b["end"]) for b in changed],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["booking_id"],
+            update_fields=["start", "end"],
+        )
+
+        watermark.value = now
+        watermark.save()
+
+    return {
+        "bookings": len(changed),
+        "rollups": rollups,
+        "seconds": round(time.monotonic() - started_at, 3),
+    }
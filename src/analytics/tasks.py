@@ -0,0 +1,17 @@
+##############################################################################
+# Copyright (c) 2020 Sean Smith and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+from celery import shared_task
+
+from analytics.rollups import update_rollups
+
+
+@shared_task
+def update_booking_rollups():
+    return update_rollups()
@@ -7,4 +7,310 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
 
-# from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase
+
+from account.models import Lab
+from analytics.exports import export
+from analytics.models import BookingRollup, Dimension, Granularity
+from analytics.rollups import update_rollups
+from analytics.utilization import concurrency, utilization
+from api.models import APILog
+from booking.models import Booking
+
+T0 = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class RollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@email.com", "testpassword")
+        cls.collab = User.objects.create_user("collab", "collab@email.com", "testpassword")
+        cls.lab = Lab.objects.create(name="UNH_IOL", lab_user=cls.owner)
+
+    def book(self, start_day, end_day, project="anuket"):
+        booking = Booking.objects.create(
+            owner=self.owner,
+            start=T0 + timedelta(days=start_day),
+            end=T0 + timedelta(days=end_day),
+            purpose="test",
+            project=project,
+            lab=self.lab,
+        )
+        return booking
+
+    def daily(self, day, dimension=Dimension.ALL, value=""):
+        return BookingRollup.objects.filter(
+            granularity=Granularity.DAY, bucket=T0 + timedelta(days=day), dimension=dimension, value=value
+        ).first()
+
+    def test_daily_rollups(self):
+        first = self.book(0, 3)
+        first.collaborators.add(self.collab)
+        self.book(2, 5, project="other")
+
+        update_rollups(now=T0 + timedelta(days=10))
+
+        self.assertEqual(self.daily(0).active, 1)
+        self.assertEqual(self.daily(0).started, 1)
+        self.assertEqual(self.daily(0).users, 2)
+        self.assertEqual(self.daily(2).active, 2)
+        self.assertEqual(self.daily(3).ended, 1)
+        # the first booking ends at midnight, so it isn't active on day 3
+        self.assertEqual(self.daily(3).active, 1)
+        self.assertEqual(self.daily(2, Dimension.PROJECT, "other").active, 1)
+        self.assertEqual(self.daily(2, Dimension.LAB, "UNH_IOL").active, 2)
+        self.assertIsNone(self.daily(6))
+
+    def test_only_counts_what_has_happened(self):
+        self.book(0, 5)
+
+        update_rollups(now=T0 + timedelta(days=2, hours=12))
+        self.assertEqual(self.daily(2).active, 1)
+        self.assertIsNone(self.daily(3))
+        self.assertEqual(sum(r.ended for r in BookingRollup.objects.filter(granularity=Granularity.DAY)), 0)
+
+        # time passing fills in the later buckets without the booking changing
+        update_rollups(now=T0 + timedelta(days=8))
+        self.assertEqual(self.daily(4).active, 1)
+        self.assertEqual(self.daily(5).ended, 1)
+
+    def test_changed_bookings_are_recomputed(self):
+        booking = self.book(0, 5)
+        update_rollups(now=T0 + timedelta(days=10))
+        self.assertEqual(self.daily(4).active, 1)
+
+        # shortening the booking has to clear the buckets it no longer covers
+        booking.end = T0 + timedelta(days=2)
+        booking.save()
+        result = update_rollups(now=T0 + timedelta(days=10, hours=1))
+
+        self.assertEqual(result["bookings"], 1)
+        self.assertIsNone(self.daily(4))
+        self.assertEqual(self.daily(2).ended, 1)
+
+    def test_unchanged_bookings_are_skipped(self):
+        self.book(0, 5)
+        Booking.objects.update(updated=T0)
+        update_rollups(now=T0 + timedelta(days=10))
+
+        result = update_rollups(now=T0 + timedelta(days=10, hours=1))
+        self.assertEqual(result["bookings"], 0)
+        self.assertEqual(self.daily(1).active, 1)
+
+    def test_hourly_rollups_are_only_kept_recently(self):
+        self.book(0, 40)
+        update_rollups(now=T0 + timedelta(days=40))
+
+        hourly = BookingRollup.objects.filter(granularity=Granularity.HOUR, dimension=Dimension.ALL)
+        self.assertEqual(hourly.count(), 30 * 24)
+        self.assertTrue(all(r.active == 1 for r in hourly))
+
+
+class BookingStatsTests(TestCase):
+
+    def test_booking_stats(self):
+        response = self.client.get("/analytics/bookings/", {"days": 7})
+        self.assertEqual(response.status_code, 200)
+
+        data = response.json()
+        self.assertEqual(len(data["booking"][0]), 8)
+        self.assertEqual(data["booking"][1], [0] * 8)
+
+        self.assertEqual(self.client.get("/analytics/bookings/", {"granularity": "week"}).status_code, 400)
+
+
+class ConcurrencyTests(TestCase):
+
+    def brute_force(self, starts, ends, edges, resolution):
+        active, peak = [], []
+        for edge in edges:
+            active.append(sum(1 for s, e in zip(starts, ends) if s < edge + resolution and e > edge))
+            instants = [edge] + [t for t in list(starts) + list(ends) if edge <= t < edge + resolution]
+            peak.append(max(sum(1 for s, e in zip(starts, ends) if s <= t < e) for t in instants))
+        return active, peak
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(1)
+        starts = rng.integers(0, 1000, 200)
+        ends = starts + rng.integers(1, 100, 200)
+
+        for resolution in (7, 50, 333):
+            result = concurrency(starts, ends, 100, 1000, resolution)
+            active, peak = self.brute_force(starts, ends, result["buckets"], resolution)
+            self.assertEqual(result["active"].tolist(), active)
+            self.assertEqual(result["peak"].tolist(), peak)
+
+    def test_touching_bookings_do_not_overlap(self):
+        result = concurrency([0, 10], [10, 20], 0, 20, 20)
+        self.assertEqual(result["active"].tolist(), [2])
+        self.assertEqual(result["peak"].tolist(), [1])
+
+    def test_no_bookings(self):
+        result = concurrency([], [], 0, 100, 10)
+        self.assertEqual(result["active"].tolist(), [0] * 10)
+        self.assertEqual(result["peak"].tolist(), [0] * 10)
+
+    def test_empty_buckets_after_events(self):
+        starts = [46, 58, 30, 10, 8, 62, 17, 32, 59, 63]
+        ends = [50, 83, 67, 33, 9, 94, 32, 37, 75, 88]
+        self.assertEqual(concurrency(starts, ends, 9, 29, 10)["peak"].tolist(), [2, 2])
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        for _ in range(500):
+            count = rng.integers(0, 12)
+            starts = rng.integers(0, 100, count)
+            ends = starts + rng.integers(1, 40, count)
+            range_start, resolution = int(rng.integers(0, 60)), int(rng.integers(1, 20))
+            range_end = range_start + int(rng.integers(1, 80))
+
+            result = concurrency(starts, ends, range_start, range_end, resolution)
+
+            for i, edge in enumerate(range(range_start, range_end, resolution)):
+                moments = range(edge, edge + resolution)
+                counts = [int(((starts <= t) & (ends > t)).sum()) for t in moments]
+                self.assertEqual(result["peak"][i], max(counts))
+                self.assertEqual(result["active"][i], int(((starts < edge + resolution) & (ends > edge)).sum()))
+
+
+class UtilizationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user("owner", "owner@email.com", "testpassword")
+        lab = Lab.objects.create(name="UNH_IOL", lab_user=owner)
+        for project, start_day, end_day in [("a", 0, 2), ("a", 1, 3), ("b", 1, 2)]:
+            Booking.objects.create(
+                owner=owner,
+                start=T0 + timedelta(days=start_day),
+                end=T0 + timedelta(days=end_day),
+                purpose="test",
+                project=project,
+                lab=lab,
+            )
+
+    def setUp(self):
+        caches["snapshots"].clear()
+
+    def test_utilization(self):
+        result = utilization(T0, T0 + timedelta(days=4), 86400)
+        self.assertEqual(result["bookings"], 3)
+        self.assertEqual(result["series"]["peak"], [1, 3, 1, 0])
+
+        grouped = utilization(T0, T0 + timedelta(days=4), 86400, group_by="project")
+        self.assertEqual(grouped["series"]["a"]["max_peak"], 2)
+        self.assertEqual(grouped["series"]["b"]["active"], [0, 1, 0, 0])
+
+        filtered = utilization(T0, T0 + timedelta(days=4), 86400, filters={"project": "b"})
+        self.assertEqual(filtered["bookings"], 1)
+
+    def test_utilization_is_cached(self):
+        utilization(T0, T0 + timedelta(days=4), 86400)
+        Booking.objects.all().delete()
+        self.assertEqual(utilization(T0, T0 + timedelta(days=4), 86400)["bookings"], 3)
+
+    def test_utilization_range_is_floored(self):
+        # as when the range ends now, a few seconds apart
+        first = utilization(T0 + timedelta(hours=5), T0 + timedelta(days=4, seconds=10), 86400)
+        Booking.objects.all().delete()
+        second = utilization(T0 + timedelta(hours=7), T0 + timedelta(days=4, seconds=40), 86400)
+
+        self.assertEqual(second, first)
+        self.assertEqual(first["buckets"][0], T0.isoformat())
+        self.assertEqual(first["series"]["peak"], [1, 3, 1, 0])
+
+    def test_api(self):
+        response = self.client.get("/analytics/utilization/", {
+            "start": T0.isoformat(), "end": (T0 + timedelta(days=4)).isoformat(), "resolution": "day", "group_by": "lab",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["series"]["UNH_IOL"]["max_peak"], 3)
+
+        too_fine = self.client.get("/analytics/utilization/", {"start": T0.isoformat(), "resolution": "1"})
+        self.assertEqual(too_fine.status_code, 400)
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@email.com", "testpassword")
+        cls.owner = User.objects.create_user("owner", "owner@email.com", "testpassword")
+        cls.lab = Lab.objects.create(name="UNH_IOL", lab_user=cls.owner)
+        for day, project in enumerate(["anuket", "onap", "anuket"]):
+            booking = Booking.objects.create(
+                owner=cls.owner,
+                start=T0 + timedelta(days=day),
+                end=T0 + timedelta(days=day + 1),
+                purpose="test",
+                project=project,
+                lab=cls.lab,
+            )
+            booking.collaborators.add(cls.admin)
+        APILog.objects.create(user=cls.owner, method="GET", endpoint="/api/booking", ip_addr="127.0.0.1", body={"a": 1})
+
+    def read(self, *args, **kwargs) -> str:
+        return "".join(export(*args, **kwargs))
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.read("bookings", "csv", chunk_size=2))))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["owner__username"], "owner")
+        self.assertEqual(rows[0]["lab__name"], "UNH_IOL")
+        self.assertEqual(rows[0]["start"], T0.isoformat())
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.read("apilogs", "ndjson").splitlines()]
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["body"], {"a": 1})
+        self.assertEqual(rows[0]["user__username"], "owner")
+
+    def test_filters(self):
+        rows = list(csv.DictReader(io.StringIO(self.read("bookings", "csv", start=T0 + timedelta(hours=36)))))
+        self.assertEqual([row["project"] for row in rows], ["onap", "anuket"])
+
+        rows = list(csv.DictReader(io.StringIO(self.read("collaborators", "csv", project="onap"))))
+        self.assertEqual(len(rows), 1)
+
+        with self.assertRaises(ValueError):
+            export("apilogs", "csv", project="onap")
+        with self.assertRaises(ValueError):
+            export("users", "csv")
+
+    def test_export_view(self):
+        self.assertEqual(self.client.get("/analytics/export/bookings/").status_code, 401)
+
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get("/analytics/export/bookings/").status_code, 403)
+
+        self.client.force_login(self.admin)
+        response = self.client.get("/analytics/export/bookings/", {"format": "ndjson", "project": "anuket", "end": "2024-01-02"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+
+        self.assertEqual(self.client.get("/analytics/export/bookings/", {"format": "xml"}).status_code, 400)
+        self.assertEqual(self.client.get("/analytics/export/bookings/", {"start": "yesterday"}).status_code, 400)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bookings.csv")
+            call_command("export", "bookings", "--project", "anuket", "--output", path)
+            with open(path) as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 2)
@@ -0,0 +1,19 @@
+##############################################################################
+# Copyright (c) 2020 Sean Smith and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+from django.urls import path
+
+from analytics.views import booking_stats, booking_utilization, export_dataset
+
+app_name = 'analytics'
+urlpatterns = [
+    path('bookings/', booking_stats, name='booking_stats'),
+    path('utilization/', booking_utilization, name='booking_utilization'),
+    path('export/<str:dataset>/', export_dataset, name='export'),
+]
@@ -0,0 +1,148 @@
+##############################################################################
+# Copyright (c) 2020 Sean Smith and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Booking concurrency over arbitrary ranges and resolutions, computed with a vectorized sweep line.
+# Every booking is a +1 event at its start and a -1 event at its end. Sorting the events and taking the
+# cumulative sum gives the number of concurrent bookings after each event, so a whole series is a sort and a
+# few passes over arrays rather than a loop over buckets and bookings.
+
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.core.cache import caches
+
+from booking.models import ArchivedBooking, Booking
+from laas_dashboard.settings import ANALYTICS_UTILIZATION_CACHE_TIMEOUT
+
+GROUP_FIELDS = {
+    "project": "project",
+    "purpose": "purpose",
+    "lab": "lab__name",
+}
+FILTER_FIELDS = {
+    "project": "project",
+    "lab": "lab__name",
+}
+# the same fields on ArchivedBooking
+ARCHIVE_FIELDS = {
+    "start": "start",
+    "end": "end",
+    "project": "project",
+    "purpose": "purpose",
+    "lab__name": "lab_name",
+}
+
+
+def concurrency(starts: np.ndarray, ends: np.ndarray, range_start: int, range_end: int, resolution: int) -> dict:
+    """
+    Computes booking concurrency over [range_start, range_end) in buckets of resolution seconds.
+    starts and ends are the booking intervals as epoch seconds, a booking ending at the moment another starts doesn't overlap it.
+
+    Returns a dict of arrays, one entry per bucket:
+        buckets - start of the bucket (epoch seconds)
+        active - bookings active at any point within the bucket
+        peak - most bookings active at the same moment within the bucket
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    edges = np.arange(range_start, range_end, resolution, dtype=np.int64)
+
+    sorted_starts = np.sort(starts)
+    sorted_ends = np.sort(ends)
+
+    # bookings that started before the bucket ends, minus those that ended before (or as) it started
+    active = np.searchsorted(sorted_starts, edges + resolution, side="left") - np.searchsorted(sorted_ends, edges, side="right")
+
+    # concurrency at the start of each bucket
+    at_edge = np.searchsorted(sorted_starts, edges, side="right") - np.searchsorted(sorted_ends, edges, side="right")
+
+    # sweep over the start (+1) and end (-1) events in time order
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(len(starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)])
+    order = np.lexsort((deltas, times))
+    times = times[order]
+    running = np.cumsum(deltas[order])
+
+    # only the count after the last event at each instant is real, the ones in between are partway through it
+    last_at_time = np.append(times[1:] != times[:-1], True) if len(times) else np.zeros(0, dtype=bool)
+    times = times[last_at_time]
+    running = running[last_at_time]
+
+    # the highest concurrency reached by an event inside each bucket
+    peak = at_edge.copy()
+    in_range = (times >= range_start) & (times < range_start + len(edges) * resolution)
+    np.maximum.at(peak, (times[in_range] - range_start) // resolution, running[in_range])
+
+    return {"buckets": edges, "active": active, "peak": peak}
+
+
+def to_epoch(values) -> np.ndarray:
+    return np.fromiter((int(v.timestamp()) for v in values), dtype=np.int64, count=len(values))
+
+
+def floor(moment: datetime, seconds: int) -> datetime:
+    return datetime.fromtimestamp(int(moment.timestamp()) // seconds * seconds, tz=dt_timezone.utc)
+
+
+def utilization(start: datetime, end: datetime, resolution: int, filters: dict = None, group_by: str = None) -> dict:
+    """
+    Booking concurrency between start and end, see concurrency().
+    filters limits the bookings by project and/or lab. group_by ("project", "purpose" or "lab") gives a series per value.
+    Results are cached for ANALYTICS_UTILIZATION_CACHE_TIMEOUT seconds per range, resolution, filter and grouping.
+    start is floored to the resolution, so buckets line up from one request to the next, and end to the resolution or the
+    cache timeout, whichever is shorter, so ranges ending now share the cached series until it expires.
+    """
+    start = floor(start, resolution)
+    end = max(floor(end, min(resolution, ANALYTICS_UTILIZATION_CACHE_TIMEOUT)), start + timedelta(seconds=resolution))
+    filters = {k: v for k, v in (filters or {}).items() if v}
+    key = "analytics:utilization:" + hashlib.sha1(json.dumps(
+        [start.isoformat(), end.isoformat(), resolution, sorted(filters.items()), group_by]
+    ).encode()).hexdigest()
+
+    result = caches["snapshots"].get(key)
+    if result is not None:
+        return result
+
+    bookings = Booking.objects.filter(start__lt=end, end__gt=start)
+    archived = ArchivedBooking.objects.filter(start__lt=end, end__gt=start)
+    for name, value in filters.items():
+        bookings = bookings.filter(**{FILTER_FIELDS[name]: value})
+        archived = archived.filter(**{ARCHIVE_FIELDS[FILTER_FIELDS[name]]: value})
+
+    fields = ["start", "end"] + ([GROUP_FIELDS[group_by]] if group_by else [])
+    rows = list(bookings.values_list(*fields).iterator(chunk_size=10000))
+    rows += archived.values_list(*[ARCHIVE_FIELDS[field] for field in fields]).iterator(chunk_size=10000)
+
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row[2] or "") if group_by else ""].append(row)
+
+    range_start, range_end = int(start.timestamp()), int(end.timestamp())
+    series = {}
+    for name, group in groups.items() if groups else [("", [])]:
+        computed = concurrency(
+            to_epoch([r[0] for r in group]), to_epoch([r[1] for r in group]), range_start, range_end, resolution
+        )
+        series[name] = {
+            "active": computed["active"].tolist(),
+            "peak": computed["peak"].tolist(),
+            "max_peak": int(computed["peak"].max()) if len(computed["peak"]) else 0,
+        }
+
+    result = {
+        "buckets": [datetime.fromtimestamp(b, tz=dt_timezone.utc).isoformat() for b in range(range_start, range_end, resolution)],
+        "resolution": resolution,
+        "bookings": len(rows),
+        "series": series if group_by else series.get("", {}),
+    }
+    caches["snapshots"].set(key, result, ANALYTICS_UTILIZATION_CACHE_TIMEOUT)
+    return result
@@ -7,4 +7,162 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
 
-# from django.shortcuts import render
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from analytics.exports import CONTENT_TYPES, export, parse_time
+from analytics.models import BookingRollup, Dimension, Granularity
+from analytics.rollups import STEPS, buckets, floor_bucket
+from analytics.utilization import FILTER_FIELDS, GROUP_FIELDS, utilization
+from laas_dashboard.settings import ANALYTICS_HOURLY_RETENTION
+
+CHART_COLORS = ["#007bff", "#6c757d", "#ffc107", "#28a745", "#dc3545", "#17a2b8", "#6610f2", "#fd7e14"]
+LABEL_FORMATS = {
+    Granularity.HOUR: "%Y-%m-%d %H:00",
+    Granularity.DAY: "%Y-%m-%d",
+}
+MAX_DAYS = 366
+TOP_PROJECTS = 10
+RESOLUTIONS = {"hour": 3600, "day": 86400}
+MAX_BUCKETS = 10000
+
+
+def series(rows, labels: list, field: str) -> list[int]:
+    values = {row.bucket: getattr(row, field) for row in rows}
+    return [values.get(bucket, 0) for bucket in labels]
+
+
+def booking_stats(request) -> HttpResponse:
+    """
+    Data for the charts on the booking stats page, read from the precomputed rollups (see analytics.rollups).
+
+    Query parameters:
+        granularity - "day" (default) or "hour"
+        days - how far back to go, defaults to 30
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+
+    granularity = request.GET.get("granularity", Granularity.DAY)
+    if granularity not in STEPS:
+        return JsonResponse(status=400, data={"message": "granularity must be day or hour"})
+
+    try:
+        days = int(request.GET.get("days", 30))
+    except ValueError:
+        return JsonResponse(status=400, data={"message": "days must be a number"})
+    max_days = ANALYTICS_HOURLY_RETENTION.days if granularity == Granularity.HOUR else MAX_DAYS
+    days = max(1, min(days, max_days))
+
+    now = timezone.now()
+    start = floor_bucket(now - timedelta(days=days), granularity)
+    bucket_starts = list(buckets(start, now, granularity))
+    labels = [bucket.strftime(LABEL_FORMATS[granularity]) for bucket in bucket_starts]
+
+    rollups = BookingRollup.objects.filter(granularity=granularity, bucket__gte=start)
+
+    totals = list(rollups.filter(dimension=Dimension.ALL))
+
+    by_lab = defaultdict(list)
+    for row in rollups.filter(dimension=Dimension.LAB):
+        by_lab[row.value or "Unknown"].append(row)
+
+    projects = (
+        rollups.filter(dimension=Dimension.PROJECT)
+        .exclude(value="")
+        .values("value")
+        .annotate(bookings=Sum("started"))
+        .order_by("-bookings")[:TOP_PROJECTS]
+    )
+
+    return JsonResponse(status=200, data={
+        "granularity": granularity,
+        "booking": [labels, series(totals, bucket_starts, "active")],
+        "user": [labels, series(totals, bucket_starts, "users")],
+        "started": [labels, series(totals, bucket_starts, "started")],
+        "ended": [labels, series(totals, bucket_starts, "ended")],
+        "projects": [[p["value"] for p in projects], [p["bookings"] for p in projects]],
+        "resources": {lab: [labels, series(rows, bucket_starts, "active")] for lab, rows in by_lab.items()},
+        "colors": CHART_COLORS,
+    })
+
+
+def booking_utilization(request) -> HttpResponse:
+    """
+    Booking concurrency over any range and resolution, see analytics.utilization.
+
+    Query parameters:
+        start, end - ISO 8601 datetimes, default to the last 30 days
+        resolution - "hour", "day" or a number of seconds, defaults to hour
+        project, lab - only count bookings of this project / lab
+        group_by - "project", "purpose" or "lab" for one series per value
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+
+    now = timezone.now()
+    try:
+        end = parse_datetime(request.GET["end"]) if "end" in request.GET else now
+        start = parse_datetime(request.GET["start"]) if "start" in request.GET else end - timedelta(days=30)
+        resolution = request.GET.get("resolution", "hour")
+        resolution = RESOLUTIONS[resolution] if resolution in RESOLUTIONS else int(resolution)
+    except (ValueError, TypeError):
+        return JsonResponse(status=400, data={"message": "start and end must be ISO 8601 datetimes, resolution hour, day or seconds"})
+
+    if start is None or end is None:
+        return JsonResponse(status=400, data={"message": "start and end must be ISO 8601 datetimes"})
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end)
+    if resolution <= 0 or start >= end:
+        return JsonResponse(status=400, data={"message": "start must be before end and resolution positive"})
+    if (end - start).total_seconds() / resolution > MAX_BUCKETS:
+        return JsonResponse(status=400, data={"message": f"At most {MAX_BUCKETS} buckets, use a coarser resolution"})
+
+    group_by = request.GET.get("group_by")
+    if group_by is not None and group_by not in GROUP_FIELDS:
+        return JsonResponse(status=400, data={"message": "group_by must be one of " + ", ".join(GROUP_FIELDS)})
+
+    filters = {name: request.GET.get(name) for name in FILTER_FIELDS}
+
+    return JsonResponse(status=200, data=utilization(start, end, resolution, filters=filters, group_by=group_by))
+
+
+def export_dataset(request, dataset: str) -> HttpResponse:
+    """
+    Streams a full dump of bookings, archived_bookings, collaborators or apilogs, see analytics.exports. Superusers only.
+
+    Query parameters:
+        format - "csv" (default) or "ndjson"
+        start, end - ISO 8601 dates or datetimes, only bookings overlapping / API calls made in the range
+        project - only bookings of this project, and their collaborators
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    if not request.user.is_superuser:
+        return HttpResponse(status=403)
+
+    format = request.GET.get("format", "csv")
+    try:
+        lines = export(
+            dataset,
+            format,
+            start=parse_time(request.GET.get("start")),
+            end=parse_time(request.GET.get("end")),
+            project=request.GET.get("project"),
+        )
+    except ValueError as e:
+        return JsonResponse(status=400, data={"message": str(e)})
+
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[format])
+    filename = f"{dataset}-{timezone.now():%Y%m%d-%H%M%S}.{format}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -12,7 +12,8 @@ from django.apps import AppConfig
 from django.contrib import admin
 
 from api.models import (
-    APILog
+    APILog,
+    APILogSummary,
 )
 
 
@@ -20,3 +21,4 @@ class ApiConfig(AppConfig):
     name = 'apiJobs'
 
 admin.site.register(APILog)
+admin.site.register(APILogSummary)
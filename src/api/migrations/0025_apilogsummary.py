@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-19 13:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_alter_apilog_body'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APILogSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('method', models.CharField(blank=True, default='', max_length=6)),
+                ('endpoint', models.CharField(blank=True, default='', max_length=300)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='apilogsummary',
+            constraint=models.UniqueConstraint(fields=('day', 'user', 'method', 'endpoint'), name='unique_apilog_summary'),
+        ),
+    ]
@@ -139,6 +139,26 @@ class APILog(models.Model):
         )
 
 
+class APILogSummary(models.Model):
+    """
+    The number of calls a user made to an endpoint on a day.
+    APILog rows are rolled up into these once they are older than RETENTION_APILOG_DAYS (see dashboard.retention).
+    """
+    day = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.PROTECT)
+    method = models.CharField(blank=True, default="", max_length=6)
+    endpoint = models.CharField(blank=True, default="", max_length=300)
+    calls = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "user", "method", "endpoint"], name="unique_apilog_summary"),
+        ]
+
+    def __str__(self):
+        return f"{self.calls} calls to {self.method} {self.endpoint} by {self.user_id} on {self.day}"
+
+
 class AutomationAPIManager:
     @staticmethod
     def serialize_booking(booking):
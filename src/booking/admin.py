@@ -11,6 +11,6 @@
 
 from django.contrib import admin
 
-from booking.models import Booking, ExpiringBookingNotification
+from booking.models import ArchivedBooking, Booking, ExpiringBookingNotification
 
-admin.site.register([Booking, ExpiringBookingNotification])
+admin.site.register([Booking, ExpiringBookingNotification, ArchivedBooking])
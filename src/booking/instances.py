@@ -0,0 +1,166 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Local copy of the instances of each booking's LibLaaS aggregate.
+# Rows are written from the aggregate status whenever the dashboard fetches it anyway (the booking detail page and
+# its polling), and by the sync_booking_instances task until every host of a booking is provisioned.
+# Only instances whose fields changed are written, so refreshing a provisioned booking is a single read.
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from booking.models import Booking, BookingInstance
+from liblaas.views import booking_booking_status, booking_ipmi_fqdn
+from resource_inventory.availability import flavor_counts, record_allocations
+from resource_inventory.models import FlavorAllocation
+
+SYNCED_FIELDS = ["host_alias", "hostname", "flavor_id", "image_id", "provisioned"]
+
+
+def instance_fields(status: dict) -> dict[str, dict]:
+    """
+    Maps each instance id in the given aggregate status to its BookingInstance fields.
+    """
+    template_hosts = {host.get("hostname"): host for host in status.get("template", {}).get("hosts", [])}
+
+    fields = {}
+    for instance_id, instance in status.get("instances", {}).items():
+        alias = instance.get("host_alias") or ""
+        template_host = template_hosts.get(alias, {})
+        logs = instance.get("logs") or []
+        fields[instance_id] = {
+            "host_alias": alias,
+            "hostname": (instance.get("assigned_host_info") or {}).get("hostname") or "",
+            "flavor_id": template_host.get("flavor") or "",
+            "image_id": template_host.get("image") or "",
+            "provisioned": bool(logs) and "Success" in (logs[-1].get("status") or ""),
+        }
+    return fields
+
+
+def sync_instances(booking: Booking, status: dict = None) -> list[BookingInstance] | None:
+    """
+    Brings the booking's instances in line with its aggregate status, fetching the status if it isn't given.
+    The IPMI FQDN of each assigned host is looked up once.
+    The host allocations of the booking are recorded from its instances the first time they are all known.
+    Returns the booking's instances, or None if the status couldn't be fetched.
+    """
+    if not booking.aggregateId:
+        return []
+
+    if status is None:
+        status = booking_booking_status(booking.aggregateId)
+    if not status or "instances" not in status:
+        return None
+
+    fields = instance_fields(status)
+    existing = {instance.instance_id: instance for instance in booking.instances.all()}
+
+    created = [
+        BookingInstance(booking=booking, instance_id=instance_id, **values)
+        for instance_id, values in fields.items() if instance_id not in existing
+    ]
+
+    now = timezone.now()
+    changed = []
+    for instance_id, values in fields.items():
+        instance = existing.get(instance_id)
+        if instance is None:
+            continue
+        if instance.image_id:
+            # the status keeps the template's image, reimages are recorded by record_reimage()
+            values = {field: value for field, value in values.items() if field != "image_id"}
+        if any(getattr(instance, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(instance, field, value)
+            # bulk_update() doesn't apply auto_now
+            instance.updated = now
+            changed.append(instance)
+
+    instances = list(existing.values()) + created
+    if created or changed:
+        with transaction.atomic():
+            BookingInstance.objects.bulk_create(created)
+            if changed:
+                BookingInstance.objects.bulk_update(changed, SYNCED_FIELDS + ["updated"])
+
+            if not FlavorAllocation.objects.filter(booking=booking).exists():
+                flavors = [instance.flavor_id for instance in instances]
+                if flavors and all(flavors):
+                    record_allocations(booking, flavor_counts(flavors))
+
+    missing_fqdn = [instance for instance in instances if instance.hostname and not instance.ipmi_fqdn]
+    for instance in missing_fqdn:
+        response = booking_ipmi_fqdn(instance.instance_id)
+        if response and response.get("ipmi_fqdn"):
+            instance.ipmi_fqdn = response["ipmi_fqdn"]
+            BookingInstance.objects.filter(id=instance.id).update(ipmi_fqdn=instance.ipmi_fqdn)
+
+    return sorted(instances, key=lambda instance: instance.host_alias)
+
+
+def bookings_to_sync():
+    """
+    Active bookings with an aggregate that have no instances yet, or whose hosts aren't all provisioned.
+    """
+    instances = BookingInstance.objects.filter(booking=OuterRef("id"))
+    return (
+        Booking.objects.filter(complete=False)
+        .exclude(aggregateId="")
+        .filter(Q(~Exists(instances)) | Q(Exists(instances.filter(provisioned=False))))
+    )
+
+
+def sync_pending(limit: int = 50) -> int:
+    """
+    Syncs the instances of up to limit bookings that are still provisioning. Returns the number synced.
+    """
+    synced = 0
+    for booking in bookings_to_sync().order_by("id")[:limit]:
+        if sync_instances(booking) is not None:
+            synced += 1
+    return synced
+
+
+def record_reimage(instance_id: str, image_id: str):
+    """
+    Called when a host is reimaged: it has a new image and is provisioning again until the next sync says otherwise.
+    """
+    BookingInstance.objects.filter(instance_id=instance_id).update(image_id=image_id, provisioned=False)
+
+
+def bookings_on_host(hostname: str, active: bool = True):
+    """
+    The bookings that hold (or held) the given host, newest first.
+    """
+    bookings = Booking.objects.filter(instances__hostname=hostname)
+    if active:
+        bookings = bookings.filter(complete=False)
+    return bookings.distinct().order_by("-start")
+
+
+def bookings_with_flavor(flavor_id: str, active: bool = True):
+    """
+    The bookings that use hosts of the given flavor, newest first.
+    """
+    bookings = Booking.objects.filter(instances__flavor_id=flavor_id)
+    if active:
+        bookings = bookings.filter(complete=False)
+    return bookings.distinct().order_by("-start")
+
+
+def active_host_bookings(hostnames: list[str]) -> dict[str, int]:
+    """
+    Maps each of the given hosts that is held by an active booking to that booking's id.
+    """
+    return dict(
+        BookingInstance.objects.filter(hostname__in=hostnames, booking__complete=False)
+        .values_list("hostname", "booking_id")
+    )
@@ -7,11 +7,23 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
 
-from account.models import UserProfile
+from account.models import Lab, UserProfile
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+import logging
 import os
 
 from booking.models import Booking
-from liblaas.views import booking_end_booking
+from laas_dashboard.settings import PROJECT, BOOKING_LAB
+from laas_dashboard.timing import timed
+from laas_dashboard.tracing import annotate, span
+from liblaas.outbox import enqueue, booking_key
+from liblaas.utils import find_invalid_collaborators
+
+logger = logging.getLogger(__name__)
 
 def get_user_field_opts():
     return {
@@ -21,29 +33,68 @@ def get_user_field_opts():
         'selectable_limit': -1,
         'placeholder': 'Search for other users',
         'name': 'users',
-        'disabled': False
+        'disabled': False,
+        'search_url': reverse('account:user-search'),
+    }
+
+
+def serialize_user_item(up: UserProfile) -> dict:
+    return {
+        'id': up.id,
+        'expanded_name': up.full_name if up.full_name else up.user.username,
+        'small_name': up.user.username,
+        'string': up.email_addr if up.email_addr else up.user.username,
     }
 
 
-def get_user_items(exclude=None):
+def get_user_items(exclude=None, ids=None):
+    """
+    Returns the searchable widget items for public users, keyed by UserProfile id.
+    If ids is given, only those profiles are resolved (in a single query).
+    """
+    if ids is not None and len(ids) == 0:
+        return {}
+
     qs = UserProfile.objects.filter(public_user=True).filter(ipa_username__startswith='').select_related('user').exclude(user=exclude)
-    items = {}
-    for up in qs:
-        item = {
-            'id': up.id,
-            'expanded_name': up.full_name if up.full_name else up.user.username,
-            'small_name': up.user.username,
-            'string': up.email_addr if up.email_addr else up.user.username,
-        }
-        items[up.id] = item
-    return items
+    if ids is not None:
+        qs = qs.filter(id__in=ids)
+
+    return {up.id: serialize_user_item(up) for up in qs}
+
+
+def search_user_items(query: str, exclude=None, page: int = 1, page_size: int = 20) -> tuple[list[dict], bool]:
+    """
+    Searches public users by username, full name and email.
+    Short queries match on prefix, longer ones on substring (both are backed by the trigram indexes on those columns).
+    Returns a page of widget items and whether there is a next page.
+    """
+    query = query.strip()
+    page = max(page, 1)
+
+    qs = UserProfile.objects.filter(public_user=True).filter(ipa_username__startswith='').select_related('user').exclude(user=exclude)
+    if query:
+        lookup = 'icontains' if len(query) >= 3 else 'istartswith'
+        qs = qs.filter(
+            Q(**{f'user__username__{lookup}': query})
+            | Q(**{f'full_name__{lookup}': query})
+            | Q(**{f'email_addr__{lookup}': query})
+        )
+
+    offset = (page - 1) * page_size
+    # fetch one extra row to know whether there is another page without a COUNT(*)
+    profiles = list(qs.order_by('user__username')[offset:offset + page_size + 1])
+
+    return [serialize_user_item(up) for up in profiles[:page_size]], len(profiles) > page_size
 
+
+@timed("dns")
+@span("dns", "client")
 def resolve_hostname(server_address) -> dict[str, str]:
     '''
     Resolves the given host ip from address using the host command.
     Returns string output of "host -st A <server_address>".
     '''
-    print(f"trying to resolve {server_address}")
+    logger.debug(f"Resolving {server_address}", extra={"fields": {"host": server_address}})
     process = os.popen(f"host -R 1 -W 1 -st A {server_address}")
     v4_data = process.read()
     v4_result = process.close()
@@ -74,40 +125,125 @@ def resolve_hostname(server_address) -> dict[str, str]:
     
     return f"Unable to resolve any IP for {server_address}"
 
+@span("booking.end")
 def attempt_end_booking(booking: Booking) -> tuple[bool, str]:
     """
     Attempts to end the given booking.
-    If there is an aggregate id associated with the booking, it will make a request to LibLaaS to end the booking.
-    If the request fails or returns an error, the booking will not be marked as complete. Otherwise, it is marked as complete.
-    If there is no aggregate id associated with the booking, it is marked as complete.
-    Returns True if successfully ended. Otherwise, False.
+    The booking is marked as complete and, in the same transaction, a request to end its aggregate is queued in the LibLaaS outbox.
+    LibLaaS is not contacted directly, the outbox relay delivers the request (and retries it if LibLaaS is unavailable).
+    Returns True if the booking was ended. Otherwise, False.
     """
 
     if booking is None:
-        print("Attempted to end Booking but booking was None!")
+        logger.warning("Attempted to end a booking that doesn't exist")
         return (False, "Booking not found.")
 
     if booking.complete:
-        print("Attempted to end booking with booking id " + str(booking.id) + ", but was already complete!")
+        logger.info(f"Booking {booking.id} is already complete", extra={"fields": {"booking_id": booking.id, "aggregate_id": booking.aggregateId}})
         return (False, "Booking already complete.")
 
-    if not booking.aggregateId:
-        print("expiring booking " + str(booking.id) + " has no agg id: ending without hitting LibLaaS")
+    annotate({"booking.id": booking.id})
+    logger.info(f"Ending booking {booking.id}", extra={"fields": {"booking_id": booking.id, "aggregate_id": booking.aggregateId}})
+    with transaction.atomic():
         booking.complete = True
         booking.save()
-    else:
-        message = "Unable to end booking"
-        print("ending booking " + str(booking.id) + " with agg id: ", booking.aggregateId)
-        result: dict = booking_end_booking(booking.aggregateId)
-        if result is None:
-            print("failed to end booking - no response from LibLaaS!")
-        elif result["success"] is True:
-            print("ended booking successfully")
-            booking.complete = True
-            booking.save()
-            message = "Success"
-        else:
-            print("Failed to end booking with reason " + result["details"])
-            message = result["details"]
-
-    return (booking.complete, message)
+        enqueue(
+            booking_key(booking.id),
+            "booking_end_booking",
+            {"booking_id": booking.id},
+            idempotency_key=f"booking_end_booking:{booking.id}",
+        )
+
+    return (booking.complete, "Success")
+
+
+@span("booking.create")
+def create_booking(
+    owner_profile: UserProfile,
+    template_id: str,
+    collaborators: list[str],
+    global_cifile: str,
+    purpose: str,
+    project: str,
+    length: int,
+    details: str = "",
+    validate_collaborators: bool = True,
+    send_unknown_users: bool = False,
+) -> tuple[Booking, list[str]]:
+    """
+    Creates a booking in the dashboard and provisions it in LibLaaS. Used by both the booking workflow and the booking API.
+
+    collaborators is a list of dashboard usernames. All of them are resolved in a single query and added in one bulk insert.
+    Unknown usernames are skipped and reported as warnings, as are collaborators without an SSH key if validate_collaborators is set.
+    With send_unknown_users, unknown usernames are still sent to LibLaaS as IPA usernames, as the booking API always has.
+
+    The booking, its collaborators, its expiring notifications and the LibLaaS outbox entry that provisions it are written
+    in one transaction, so this returns as soon as that commits. The aggregate id is filled in once the outbox relay has
+    delivered the booking to LibLaaS.
+    The hosts the booking holds are recorded for the availability calendar by the first sync of its instances, see
+    booking.instances.sync_instances().
+    Returns the booking and a list of warnings for the user.
+    """
+    # Warnings are issues that won't affect the booking's ability to provision, but may lead to unexpected behavior for the user
+    warnings: list[str] = []
+
+    collab_profiles = list(UserProfile.objects.filter(user__username__in=collaborators).select_related('user'))
+
+    found = {p.user.username for p in collab_profiles}
+    for username in collaborators:
+        if username not in found:
+            warnings.append(f"Unable to find user {username}. They were not added as a collaborator.")
+
+    if validate_collaborators and collab_profiles:
+        for ic in find_invalid_collaborators(collab_profiles):
+            warnings.append(f"Unable to find SSH key for {str(ic)}. VPN access will be added, but no user will be created on the booked resource(s).")
+
+    # Assume there is an ipa username linked, the owner is always allowed
+    ipa_users = [p.ipa_username for p in collab_profiles] + [owner_profile.ipa_username]
+    if send_unknown_users:
+        ipa_users += [username for username in collaborators if username not in found]
+    ipa_users = list(dict.fromkeys(ipa_users))
+
+    booking_blob = {
+        "template_id": template_id,
+        "allowed_users": ipa_users,
+        "global_cifile": global_cifile,
+        "metadata": {
+            "booking_id": None,  # fill in after creating django object
+            "owner": owner_profile.ipa_username,
+            "lab": PROJECT,
+            "purpose": purpose,
+            "project": project,
+            "details": details,
+            "length": int(length),
+        },
+        "origin": PROJECT,
+    }
+
+    now = timezone.now()
+    with transaction.atomic():
+        booking = Booking.objects.create(
+            purpose=purpose,
+            project=project,
+            details=details,
+            lab=Lab.objects.filter(name=BOOKING_LAB).first(),
+            owner=owner_profile.user,
+            start=now,
+            end=now + timedelta(days=int(length)),
+        )
+        annotate({"booking.id": booking.id})
+        booking.collaborators.add(*[p.user for p in collab_profiles])
+
+        booking_blob["metadata"]["booking_id"] = str(booking.id)
+        enqueue(
+            booking_key(booking.id),
+            "booking_create_booking",
+            {"booking_id": booking.id, "blob": booking_blob},
+            user=owner_profile.user,
+        )
+
+    logger.info(
+        f"Created booking {booking.id}",
+        extra={"fields": {"booking_id": booking.id, "template_id": template_id, "collaborators": len(collab_profiles), "warnings": len(warnings)}},
+    )
+    return (booking, warnings)
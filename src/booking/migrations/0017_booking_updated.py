@@ -0,0 +1,20 @@
+# Generated by Django 5.0 on 2026-10-19 13:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0016_alter_booking_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
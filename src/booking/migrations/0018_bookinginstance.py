@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-19 13:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0017_booking_updated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='aggregateId',
+            field=models.CharField(blank=True, db_index=True, max_length=36),
+        ),
+        migrations.CreateModel(
+            name='BookingInstance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('instance_id', models.CharField(max_length=36, unique=True)),
+                ('host_alias', models.CharField(blank=True, max_length=100)),
+                ('hostname', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('flavor_id', models.CharField(blank=True, db_index=True, max_length=36)),
+                ('image_id', models.CharField(blank=True, max_length=36)),
+                ('ipmi_fqdn', models.CharField(blank=True, max_length=255)),
+                ('provisioned', models.BooleanField(default=False)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='instances', to='booking.booking')),
+            ],
+            options={
+                'ordering': ['host_alias'],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0 on 2026-10-19 13:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0018_bookinginstance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('collaborator_ids', models.JSONField(default=list)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField(db_index=True)),
+                ('purpose', models.CharField(max_length=300)),
+                ('project', models.CharField(blank=True, default='', max_length=100, null=True)),
+                ('lab_name', models.CharField(blank=True, default='', max_length=200)),
+                ('aggregateId', models.CharField(blank=True, max_length=36)),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_bookings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'booking_archive',
+            },
+        ),
+    ]
@@ -10,18 +10,23 @@
 
 
 from abc import abstractmethod
+import logging
 from datetime import timedelta
 from account.models import Lab
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 from django.db.models.query import QuerySet
 from django.utils import timezone
-from liblaas.views import booking_notify_aggregate_expiring
-from django.db.models. signals import pre_save, post_save
+from liblaas.outbox import enqueue, booking_key
+from laas_dashboard.metrics import NOTIFICATION_LAG
+from laas_dashboard.tracing import annotate, span
+from django.db.models. signals import pre_save, post_save, m2m_changed
 from django.dispatch import receiver
 from datetime import datetime
 from typing import Self
 
+logger = logging.getLogger(__name__)
+
 class Booking(models.Model):
     id = models.AutoField(primary_key=True)
     # All bookings are owned by the user who requested it
@@ -42,9 +47,11 @@ class Booking(models.Model):
     pdf = models.TextField(blank=True, default="")
     idf = models.TextField(blank=True, default="")
     # Associated LibLaaS aggregate
-    aggregateId = models.CharField(blank=True, max_length=36)
+    aggregateId = models.CharField(blank=True, max_length=36, db_index=True)
 
     complete = models.BooleanField(default=False)
+    # last time the booking (or its collaborators) changed, analytics rollups pick up changes from here
+    updated = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         db_table = 'booking'
@@ -78,11 +85,69 @@ class Booking(models.Model):
         )
 
         if "collaborators" in kwargs:
-            for c in kwargs["collaborators"]:
-                booking.collaborators.add(c)
+            booking.collaborators.add(*kwargs["collaborators"])
 
         return booking
-        
+
+
+class BookingInstance(models.Model):
+    """
+    A host of a booking's LibLaaS aggregate, mirrored from the aggregate status (see booking.instances).
+    Lets the dashboard find which booking holds a host, or which bookings use a flavor, without asking LibLaaS.
+    """
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name="instances")
+    instance_id = models.CharField(max_length=36, unique=True)
+    # the host's name in the template
+    host_alias = models.CharField(max_length=100, blank=True)
+    # the physical host LibLaaS assigned, empty until it has been assigned
+    hostname = models.CharField(max_length=100, blank=True, db_index=True)
+    flavor_id = models.CharField(max_length=36, blank=True, db_index=True)
+    image_id = models.CharField(max_length=36, blank=True)
+    ipmi_fqdn = models.CharField(max_length=255, blank=True)
+    provisioned = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["host_alias"]
+
+    def __str__(self):
+        return f"{self.host_alias} ({self.hostname or 'unassigned'}) for booking {self.booking_id}"
+
+    def to_dict(self) -> dict:
+        return {
+            "instance_id": self.instance_id,
+            "host_alias": self.host_alias,
+            "hostname": self.hostname,
+            "flavor_id": self.flavor_id,
+            "image_id": self.image_id,
+            "ipmi_fqdn": self.ipmi_fqdn,
+            "provisioned": self.provisioned,
+        }
+
+
+class ArchivedBooking(models.Model):
+    """
+    A completed booking moved out of the booking table once it is older than RETENTION_BOOKING_DAYS (see dashboard.retention).
+    Keeps what reporting needs and drops the rest (details, pdf, idf, instances and notifications).
+    """
+    # the id the booking had
+    id = models.IntegerField(primary_key=True)
+    owner = models.ForeignKey(User, on_delete=models.PROTECT, related_name='archived_bookings')
+    collaborator_ids = models.JSONField(default=list)
+    start = models.DateTimeField()
+    end = models.DateTimeField(db_index=True)
+    purpose = models.CharField(max_length=300)
+    project = models.CharField(max_length=100, default="", blank=True, null=True)
+    lab_name = models.CharField(max_length=200, blank=True, default="")
+    aggregateId = models.CharField(blank=True, max_length=36)
+    archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'booking_archive'
+
+    def __str__(self):
+        return str(self.purpose) + ' from ' + str(self.start) + ' until ' + str(self.end) + ' (archived)'
+
 
 class AbstractScheduledNotification(models.Model):
     """
@@ -101,6 +166,7 @@ class AbstractScheduledNotification(models.Model):
     def get_all_unsent_and_ready_notifications() -> list[QuerySet]:
         return [subclass.objects.filter(sent=False, when__lte=timezone.now()) for subclass in AbstractScheduledNotification.__subclasses__()]
 
+    @span("notification.send")
     def send(self) -> bool:
         """
         Attempts to send the notification to the proper destination based on notification type. Will not send if already sent.
@@ -110,16 +176,20 @@ class AbstractScheduledNotification(models.Model):
         If successful, marks as sent.
         Returns True if notification was sent, else False.
         """
+        annotate({"notification.type": type(self).__name__, "notification.id": self.id})
         if self.sent:
-            print("Notification", self, "already sent!")
+            logger.info(f"Notification {self} was already sent", extra={"fields": {"notification_id": self.id}})
             return False
         
-        success = self._send()
+        with transaction.atomic():
+            success = self._send()
 
-        if success:
-            self.sent = True
-            self.save()
+            if success:
+                self.sent = True
+                self.save()
 
+        if success:
+            NOTIFICATION_LAG.labels(type(self).__name__).observe(max((timezone.now() - self.when).total_seconds(), 0))
         return success
 
     @abstractmethod
@@ -132,15 +202,21 @@ class AbstractScheduledNotification(models.Model):
         Checking / updating the "sent" field is handled in the send() method.
         Return 'True' if the notification was sent successfully, else 'False'
         """
-        print("Abstract notification can't send!")
+        logger.error("Abstract notification can't send!")
         return False
     
 class ExpiringBookingNotification(AbstractScheduledNotification):
     for_booking = models.ForeignKey(Booking, null=False, blank=False, on_delete=models.CASCADE)
 
     def _send(self) -> bool:
-
-        return booking_notify_aggregate_expiring(self.for_booking.aggregateId, self.for_booking.end)
+        # LibLaaS sends the notification once the outbox relay delivers this
+        enqueue(
+            booking_key(self.for_booking_id),
+            "booking_notify_aggregate_expiring",
+            {"booking_id": self.for_booking_id},
+            idempotency_key=f"notify_expiring:{self.id}",
+        )
+        return True
 
     @staticmethod
     def schedule_expiring_booking_notifications(for_booking: Booking, warning_days: list[int]=[1,3,7]) -> list[Self]:
@@ -159,12 +235,13 @@ class ExpiringBookingNotification(AbstractScheduledNotification):
         booking_remaining_days: int = (for_booking.end - timezone.now()).days
         for day in warning_days:
             if day < booking_remaining_days:
-                newly_created.append(ExpiringBookingNotification.objects.create(for_booking=for_booking, when=(for_booking.end - timedelta(day))))
+                newly_created.append(ExpiringBookingNotification(for_booking=for_booking, when=(for_booking.end - timedelta(day))))
 
-        return newly_created
+        return ExpiringBookingNotification.objects.bulk_create(newly_created)
 
 
 @receiver(pre_save, sender=Booking)
+@span("booking.pre_save")
 def on_booking_save_update_notifications(sender, instance, **kwargs):
     """
     When an existing booking is updated and the end date is changed, mark all existing ExpiringBookingNotifications as read and schedule new ones.
@@ -185,6 +262,7 @@ def on_booking_save_update_notifications(sender, instance, **kwargs):
         ExpiringBookingNotification.schedule_expiring_booking_notifications(for_booking=instance)
 
 @receiver(post_save, sender=Booking)
+@span("booking.post_save")
 def on_booking_creation_schedule_notifications(sender, instance, created, **kwargs):
     """
     Creates scheduled notifications when a booking is created
@@ -192,4 +270,17 @@ def on_booking_creation_schedule_notifications(sender, instance, created, **kwar
     NOTE - Creating an object using the admin site WILL call save() (unlike updating) and create notifications
     """
     if created:
-        ExpiringBookingNotification.schedule_expiring_booking_notifications(instance)
\ No newline at end of file
+        ExpiringBookingNotification.schedule_expiring_booking_notifications(instance)
+
+@receiver(m2m_changed, sender=Booking.collaborators.through)
+def on_collaborators_change_touch_booking(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Adding or removing collaborators doesn't save the booking, so bump its updated timestamp here.
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        Booking.objects.filter(id=instance.id).update(updated=timezone.now())
+    elif pk_set:
+        Booking.objects.filter(id__in=pk_set).update(updated=timezone.now())
@@ -6,6 +6,14 @@ from django.contrib.auth.models import User
 from account.models import Lab
 from django.utils import timezone
 from datetime import timedelta
+from unittest.mock import patch
+from booking.instances import bookings_on_host, bookings_to_sync, bookings_with_flavor, record_reimage, sync_instances, sync_pending
+from booking.lib import attempt_end_booking, create_booking
+from booking.models import BookingInstance
+from resource_inventory.models import FlavorAllocation
+from laas_dashboard.settings import OUTBOX_MAX_ATTEMPTS
+from liblaas.models import OutboxEntry, OutboxStatus
+from liblaas.outbox import booking_key, deliver, enqueue, relay
 
 class SchemaTests(TestCase):
 
@@ -124,4 +132,269 @@ class SchemaTests(TestCase):
         self.assertEqual(len(ExpiringBookingNotification.objects.filter(for_booking=shortest)), 0)
         self.assertEqual(len(ExpiringBookingNotification.objects.filter(for_booking=short)), 1)
         self.assertEqual(len(ExpiringBookingNotification.objects.filter(for_booking=medium)), 2)
-        self.assertEqual(len(ExpiringBookingNotification.objects.filter(for_booking=long)), 3)
\ No newline at end of file
+        self.assertEqual(len(ExpiringBookingNotification.objects.filter(for_booking=long)), 3)
+
+
+class CreateBookingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = UserProfile.objects.create(
+            user=User.objects.create_user("owner", "owner@email.com", "testpassword"),
+            ipa_username="owner_ipa",
+        )
+        cls.collabs = [
+            UserProfile.objects.create(
+                user=User.objects.create_user(f"collab{i}", f"collab{i}@email.com", "testpassword"),
+                ipa_username=f"collab{i}_ipa",
+            )
+            for i in range(3)
+        ]
+        cls.lab = Lab.objects.create(name="UNH_IOL", lab_user=User.objects.create_user("lab"))
+
+    def create(self, **kwargs):
+        args = {
+            "owner_profile": self.owner,
+            "template_id": "template",
+            "collaborators": [c.user.username for c in self.collabs],
+            "global_cifile": "",
+            "purpose": "test",
+            "project": "test",
+            "length": 10,
+            "details": "test details",
+            "validate_collaborators": False,
+        }
+        args.update(kwargs)
+        return create_booking(**args)
+
+    @patch("liblaas.outbox.booking_create_booking")
+    def test_create_booking(self, mock_create):
+        mock_create.return_value = "aggregate"
+        booking, warnings = self.create()
+
+        self.assertEqual(warnings, [])
+        self.assertEqual(booking.lab, self.lab)
+        self.assertEqual(set(booking.collaborators.all()), {c.user for c in self.collabs})
+        self.assertEqual(ExpiringBookingNotification.objects.filter(for_booking=booking).count(), 3)
+
+        # nothing is sent to LibLaaS until the outbox is relayed
+        mock_create.assert_not_called()
+        entry = OutboxEntry.objects.get(aggregate_key=booking_key(booking.id))
+        self.assertEqual(entry.operation, "booking_create_booking")
+        self.assertEqual(entry.status, OutboxStatus.PENDING)
+
+        self.assertEqual(relay(), 1)
+        booking.refresh_from_db()
+        entry.refresh_from_db()
+        self.assertEqual(booking.aggregateId, "aggregate")
+        self.assertEqual(entry.status, OutboxStatus.DELIVERED)
+
+        blob = mock_create.call_args[0][0]
+        self.assertEqual(blob["metadata"]["booking_id"], str(booking.id))
+        self.assertEqual(blob["allowed_users"], ["collab0_ipa", "collab1_ipa", "collab2_ipa", "owner_ipa"])
+        self.assertEqual(mock_create.call_args[1]["idempotency_key"], entry.idempotency_key)
+
+    @patch("booking.instances.booking_ipmi_fqdn", return_value=None)
+    @patch("booking.instances.booking_booking_status")
+    @patch("liblaas.outbox.booking_create_booking")
+    def test_allocations_recorded_after_delivery(self, mock_create, mock_status, _):
+        mock_create.return_value = "aggregate"
+        mock_status.return_value = aggregate_status(provisioned=False)
+        booking, _ = self.create()
+
+        # neither creating nor delivering the booking waits on anything else from LibLaaS
+        relay()
+        mock_status.assert_not_called()
+        self.assertFalse(FlavorAllocation.objects.filter(booking=booking).exists())
+
+        # the next sync_booking_instances run
+        self.assertEqual(sync_pending(), 1)
+        allocation = FlavorAllocation.objects.get(booking=booking)
+        self.assertEqual((allocation.flavor_id, allocation.count), ("flavor-1", 1))
+
+    def test_unknown_collaborators_are_warned_about(self):
+        booking, warnings = self.create(collaborators=["collab0", "nobody"])
+
+        self.assertEqual(len(warnings), 1)
+        self.assertIn("nobody", warnings[0])
+        self.assertEqual(list(booking.collaborators.all()), [self.collabs[0].user])
+
+    @patch("liblaas.outbox.booking_end_booking")
+    @patch("liblaas.outbox.booking_create_booking")
+    def test_end_is_delivered_after_create(self, mock_create, mock_end):
+        mock_create.return_value = "aggregate"
+        mock_end.return_value = {"success": True}
+        booking, _ = self.create()
+
+        # ended before LibLaaS ever saw the booking
+        self.assertEqual(attempt_end_booking(booking), (True, "Success"))
+        self.assertEqual(relay(), 2)
+        mock_end.assert_called_once()
+        self.assertEqual(mock_end.call_args[0][0], "aggregate")
+
+    @patch("liblaas.outbox.booking_end_booking")
+    @patch("liblaas.outbox.booking_create_booking")
+    def test_later_entries_wait_for_a_failing_create(self, mock_create, mock_end):
+        mock_create.return_value = None
+        booking, _ = self.create()
+        attempt_end_booking(booking)
+
+        self.assertEqual(relay(), 0)
+        mock_end.assert_not_called()
+        entry = OutboxEntry.objects.get(operation="booking_create_booking")
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+
+    @patch("liblaas.outbox.booking_create_booking")
+    def test_leased_entries_are_skipped(self, mock_create):
+        mock_create.return_value = "aggregate"
+        booking, _ = self.create()
+        entry = OutboxEntry.objects.get(aggregate_key=booking_key(booking.id))
+
+        # another relay is delivering it
+        OutboxEntry.objects.filter(id=entry.id).update(leased_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(relay(), 0)
+        self.assertFalse(deliver(entry.id))
+        mock_create.assert_not_called()
+
+        # that relay died, so the entry is delivered once its lease is up
+        OutboxEntry.objects.filter(id=entry.id).update(leased_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(relay(), 1)
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts, entry.leased_until), (OutboxStatus.DELIVERED, 1, None))
+
+    @patch("liblaas.outbox.booking_create_booking")
+    def test_failed_provisioning_completes_booking(self, mock_create):
+        mock_create.return_value = None
+        booking, _ = self.create()
+
+        for _ in range(OUTBOX_MAX_ATTEMPTS):
+            deliver(OutboxEntry.objects.get(aggregate_key=booking_key(booking.id)).id)
+
+        booking.refresh_from_db()
+        self.assertTrue(booking.complete)
+        self.assertEqual(OutboxEntry.objects.get(aggregate_key=booking_key(booking.id)).status, OutboxStatus.FAILED)
+
+    @patch("liblaas.outbox.booking_end_booking")
+    @patch("liblaas.outbox.booking_create_booking")
+    def test_failed_end_reopens_booking(self, mock_create, mock_end):
+        mock_create.return_value = "aggregate"
+        mock_end.return_value = None
+        booking, _ = self.create()
+        relay()
+        booking.refresh_from_db()
+        attempt_end_booking(booking)
+
+        end = OutboxEntry.objects.get(operation="booking_end_booking")
+        for _ in range(OUTBOX_MAX_ATTEMPTS):
+            deliver(end.id)
+
+        # left incomplete, so the next end_expired_bookings run ends it again
+        booking.refresh_from_db()
+        end.refresh_from_db()
+        self.assertFalse(booking.complete)
+        self.assertEqual(end.status, OutboxStatus.FAILED)
+
+        self.assertEqual(attempt_end_booking(booking), (True, "Success"))
+        end.refresh_from_db()
+        self.assertEqual((end.status, end.attempts), (OutboxStatus.PENDING, 0))
+
+    @patch("liblaas.outbox.booking_request_extension")
+    def test_extension_without_aggregate(self, mock_extension):
+        booking, _ = self.create()
+        entry = enqueue(booking_key(booking.id), "booking_request_extension", {"booking_id": booking.id, "reason": "", "date": ""})
+        # the create entry ahead of it never got an aggregate
+        OutboxEntry.objects.filter(operation="booking_create_booking").update(status=OutboxStatus.FAILED)
+
+        self.assertTrue(deliver(entry.id))
+        mock_extension.assert_not_called()
+
+
+def aggregate_status(provisioned=True, hostname="host-1"):
+    return {
+        "instances": {
+            "inst-1": {
+                "instance": "inst-1",
+                "host_alias": "node1",
+                "assigned_host_info": {"hostname": hostname} if hostname else None,
+                "logs": [{"status": "Provisioning"}] + ([{"status": "Success"}] if provisioned else []),
+            },
+        },
+        "config": {},
+        "template": {"hosts": [{"hostname": "node1", "flavor": "flavor-1", "image": "image-1"}]},
+    }
+
+
+class BookingInstanceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@email.com", "testpassword")
+
+    def setUp(self):
+        self.booking = Booking.objects.create(
+            owner=self.owner,
+            start=timezone.now(),
+            end=timezone.now() + timedelta(days=1),
+            purpose="test",
+            project="anuket",
+            aggregateId="agg-1",
+        )
+
+    @patch("booking.instances.booking_ipmi_fqdn", return_value={"ipmi_fqdn": "host-1-ipmi.example.com"})
+    def test_sync_instances(self, fqdn):
+        sync_instances(self.booking, aggregate_status(provisioned=False, hostname=None))
+        instance = BookingInstance.objects.get(booking=self.booking)
+        self.assertEqual((instance.host_alias, instance.hostname, instance.flavor_id), ("node1", "", "flavor-1"))
+        self.assertFalse(instance.provisioned)
+        fqdn.assert_not_called()
+        self.assertIn(self.booking, bookings_to_sync())
+
+        sync_instances(self.booking, aggregate_status())
+        instance.refresh_from_db()
+        self.assertEqual(instance.hostname, "host-1")
+        self.assertEqual(instance.ipmi_fqdn, "host-1-ipmi.example.com")
+        self.assertTrue(instance.provisioned)
+        self.assertNotIn(self.booking, bookings_to_sync())
+
+        # nothing changed, so nothing is written or fetched again
+        with self.assertNumQueries(1):
+            sync_instances(self.booking, aggregate_status())
+        fqdn.assert_called_once()
+
+    @patch("booking.instances.booking_ipmi_fqdn", return_value=None)
+    def test_allocations_recorded_from_instances(self, _):
+        sync_instances(self.booking, aggregate_status())
+
+        allocation = FlavorAllocation.objects.get(booking=self.booking)
+        self.assertEqual((allocation.flavor_id, allocation.count), ("flavor-1", 1))
+
+    @patch("booking.instances.booking_ipmi_fqdn", return_value=None)
+    def test_reimage_keeps_new_image(self, _):
+        sync_instances(self.booking, aggregate_status())
+
+        record_reimage("inst-1", "image-2")
+        self.assertIn(self.booking, bookings_to_sync())
+
+        sync_instances(self.booking, aggregate_status())
+        instance = BookingInstance.objects.get(instance_id="inst-1")
+        self.assertEqual(instance.image_id, "image-2")
+        self.assertTrue(instance.provisioned)
+
+    @patch("booking.instances.booking_ipmi_fqdn", return_value=None)
+    def test_lookups(self, _):
+        sync_instances(self.booking, aggregate_status())
+
+        self.assertEqual(list(bookings_on_host("host-1")), [self.booking])
+        self.assertEqual(list(bookings_with_flavor("flavor-1")), [self.booking])
+        self.assertEqual(list(bookings_with_flavor("flavor-2")), [])
+
+        self.booking.complete = True
+        self.booking.save()
+        self.assertEqual(list(bookings_on_host("host-1")), [])
+        self.assertEqual(list(bookings_on_host("host-1", active=False)), [self.booking])
+
+    @patch("booking.instances.booking_booking_status", return_value=None)
+    def test_sync_without_liblaas(self, _):
+        self.assertIsNone(sync_instances(self.booking))
+        self.assertFalse(BookingInstance.objects.exists())
@@ -35,7 +35,8 @@ from booking.views import (
     get_host_ip,
     manage_collaborators,
     extend_booking,
-    request_extend_booking
+    request_extend_booking,
+    BookingStatsView,
 )
 
 app_name = 'booking'
@@ -49,6 +50,7 @@ urlpatterns = [
     path('resolve/', get_host_ip, name='get_host_ip'),
     path('collaborators/<int:booking_id>/', manage_collaborators, name='collaborators'),
     path('extend/<int:booking_id>/', extend_booking, name='extend'),
-    path('request-extend/<int:booking_id>/', request_extend_booking, name='extend')
+    path('request-extend/<int:booking_id>/', request_extend_booking, name='extend'),
+    path('stats/', BookingStatsView.as_view(), name='stats'),
 
 ]
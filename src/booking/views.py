@@ -20,18 +20,18 @@ from workflow.forms import BookingMetaForm
 
 from account.models import Downtime, Lab, UserProfile
 from booking.models import Booking
+from django.db import transaction
 from liblaas.views import (
     booking_booking_status,
     flavor_list_flavors,
-    user_add_users,
-    booking_request_extension,
 )
+from liblaas.outbox import enqueue, booking_key
 from django.http import HttpResponse, JsonResponse, HttpRequest
 from django.contrib.auth.models import User
 
-from liblaas.views import booking_ipmi_fqdn
+from booking.instances import sync_instances
 
-from laas_dashboard.settings import HOST_DOMAIN, PROJECT, EVE_DOCS_URL
+from laas_dashboard.settings import HOST_DOMAIN, PROJECT, EVE_DOCS_URL, BOOKING_LAB
 from booking.lib import resolve_hostname
 from datetime import timedelta
 import logging
@@ -96,12 +96,12 @@ class BookingListView(TemplateView):
     template_name = "booking/booking_list.html"
 
     def get_context_data(self, **kwargs):
-        bookings = Booking.objects.filter(end__gte=timezone.now())
+        bookings = Booking.objects.filter(end__gte=timezone.now()).select_related("owner").prefetch_related("instances")
         title = "Search Booking"
         context = super(BookingListView, self).get_context_data(**kwargs)
 
         if (self.request.user.is_authenticated):
-            tz_label = UserProfile.objects.get(user=self.request.user).timezone
+            tz_label = self.request.user_profile.timezone
         else:
             tz_label = 'UTC'
 
@@ -113,6 +113,15 @@ class BookingListView(TemplateView):
         return context
 
 
+class BookingStatsView(TemplateView):
+    template_name = "booking/stats.html"
+
+    def get_context_data(self, **kwargs):
+        context = super(BookingStatsView, self).get_context_data(**kwargs)
+        context.update({"title": "Booking Statistics"})
+        return context
+
+
 def get_flavor_name(flavor_list, flavor_id):
     """
     Return the human-readable flavor name for a given flavor_id.
@@ -163,7 +172,7 @@ def booking_detail_view(request, booking_id):
                 request, "dashboard/login.html", {"title": "This page is private"}
             )
 
-        statuses = []
+        statuses = {}
         if booking.aggregateId:
             # json returned by `booking/agg_id/status`
             # {
@@ -171,7 +180,7 @@ def booking_detail_view(request, booking_id):
             #   config: { ... }
             #   template: { ... }
             # }
-            statuses = booking_booking_status(booking.aggregateId)
+            statuses = booking_booking_status(booking.aggregateId) or {}
 
         template_hosts = []
         hosts_data = statuses.get("template", {}).get("hosts", []) if statuses else []
@@ -196,20 +205,13 @@ def booking_detail_view(request, booking_id):
                 }
             )
 
-        # build map of host_alias -> IPMI FQDN
+        # refresh the local copy of the booking's instances, which also keeps their IPMI FQDNs
+        # so they are only asked from LibLaaS once per host
         host_ipmi_fqdns = {}
-
-        for instance_id, inst_data in statuses.get("instances", {}).items():
-            log.debug("Instance %s data: %r", instance_id, inst_data)
-
-            host_alias = inst_data.get("host_alias")
-            if not host_alias:
-                continue
-
-            # fetch IPMI FQDN for this instance
-            ipmi_resp = booking_ipmi_fqdn(instance_id)
-            if ipmi_resp and ipmi_resp.get("ipmi_fqdn"):
-                host_ipmi_fqdns[host_alias] = ipmi_resp["ipmi_fqdn"]
+        if statuses:
+            for instance in sync_instances(booking, statuses) or []:
+                if instance.host_alias and instance.ipmi_fqdn:
+                    host_ipmi_fqdns[instance.host_alias] = instance.ipmi_fqdn
 
         # a host is either an ssh host or an eve host
         has_eve_host = any(
@@ -222,7 +224,7 @@ def booking_detail_view(request, booking_id):
         )
 
         # get user profile to get timezone label in context
-        up: UserProfile = UserProfile.objects.get(user=request.user)
+        up: UserProfile = request.user_profile
 
         context = {
             "title": "Booking Details",
@@ -230,7 +232,7 @@ def booking_detail_view(request, booking_id):
             "status": statuses,
             "tz_label" : zoneinfo.ZoneInfo(up.timezone),
             "collab_string": ", ".join(map(str, booking.collaborators.all())),
-            "contact_email": Lab.objects.filter(name="UNH_IOL").first().contact_email,
+            "contact_email": Lab.objects.filter(name=BOOKING_LAB).first().contact_email,
             "templatehosts": template_hosts,
             "ipmi_fqdns": host_ipmi_fqdns,
             "host_domain": HOST_DOMAIN,
@@ -256,9 +258,16 @@ def update_booking_status(request):
     data = json.loads(request.body.decode("utf-8"))
     agg_id = data["agg_id"]
 
+    # the booking hasn't been delivered to LibLaaS yet, so there is no status to show
+    if not agg_id:
+        return JsonResponse(status=200, data={})
+
     response = booking_booking_status(agg_id)
 
     if response:
+        booking = Booking.objects.filter(aggregateId=agg_id).first()
+        if booking is not None:
+            sync_instances(booking, response)
         return JsonResponse(status=200, data=response)
 
     return HttpResponse(status=500)
@@ -299,12 +308,15 @@ def manage_collaborators(request, booking_id) -> HttpResponse:
             map(lambda profile: profile.ipa_username, profiles)
         )
 
-        liblaas_collabs = user_add_users(booking.aggregateId, ipa_usernames)
-
-        if liblaas_collabs:
-            for profile in profiles:
-                booking.collaborators.add(profile.user)
-            booking.save()
+        # LibLaaS is updated by the outbox relay once this commits
+        with transaction.atomic():
+            booking.collaborators.add(*[profile.user for profile in profiles])
+            enqueue(
+                booking_key(booking.id),
+                "user_add_users",
+                {"booking_id": booking.id, "users": ipa_usernames},
+                user=request.user,
+            )
         return JsonResponse(
             {"collaborators": ", ".join(map(str, booking.collaborators.all()))},
             status=200,
@@ -360,9 +372,14 @@ def request_extend_booking(
         reason: str = post_data["reason"]
         date: str = post_data["date"]
 
-        if booking_request_extension(booking.aggregateId, reason, date) == True:
-            return HttpResponse(status=200)
-        else:
-            return HttpResponse(status=500)
+        with transaction.atomic():
+            enqueue(
+                booking_key(booking.id),
+                "booking_request_extension",
+                {"booking_id": booking.id, "reason": reason, "date": date},
+                user=request.user,
+            )
+
+        return HttpResponse(status=200)
 
     return HttpResponse(status=405)
@@ -1,3 +1,5 @@
 from django.contrib import admin
 
-# Register your models here.
+from booking_api.models import IdempotencyKey
+
+admin.site.register(IdempotencyKey)
@@ -0,0 +1,133 @@
+# Idempotency-Key support for the mutating booking_api endpoints.
+# A client that retries a request (i.e. after a timeout) sends the same Idempotency-Key header,
+# and gets the response of the first request replayed instead of running it again.
+
+import hashlib
+import time
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from booking_api.models import IdempotencyKey
+from laas_dashboard.settings import IDEMPOTENCY_IN_FLIGHT_TIMEOUT, IDEMPOTENCY_KEY_LIFETIME, IDEMPOTENCY_WAIT_TIMEOUT
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+POLL_INTERVAL = 0.2
+
+
+def request_fingerprint(request) -> str:
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def claim_key(user, key: str, fingerprint: str) -> tuple[IdempotencyKey, bool]:
+    """
+    Records that a request with the given key is in flight.
+    Returns the record and whether it was created by this call.
+    Records older than IDEMPOTENCY_KEY_LIFETIME are dropped, so the key can be reused. So are requests still in flight
+    after IDEMPOTENCY_IN_FLIGHT_TIMEOUT: the process handling them died without cleaning up, so they are claimed again.
+    """
+    now = timezone.now()
+    IdempotencyKey.objects.filter(user=user, key=key).filter(
+        Q(created__lt=now - IDEMPOTENCY_KEY_LIFETIME) | Q(complete=False, created__lt=now - IDEMPOTENCY_IN_FLIGHT_TIMEOUT)
+    ).delete()
+
+    try:
+        # committed on its own, so concurrent requests with the same key can see it
+        with transaction.atomic():
+            return (IdempotencyKey.objects.create(user=user, key=key, fingerprint=fingerprint), True)
+    except IntegrityError:
+        return (IdempotencyKey.objects.get(user=user, key=key), False)
+
+
+def wait_for_completion(record: IdempotencyKey) -> IdempotencyKey | None:
+    """
+    Waits for the request that claimed the key first to finish.
+    Returns the completed record, or None if it is still running after IDEMPOTENCY_WAIT_TIMEOUT seconds
+    or was abandoned (it failed, so the key is free to be tried again).
+    """
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+    while not record.complete:
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(id=record.id).first()
+        if record is None:
+            return None
+    return record
+
+
+def replay(record: IdempotencyKey) -> Response:
+    response = Response(data=record.response_data, status=record.response_status)
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def idempotent(view_method):
+    """
+    Decorator for ViewSet methods that honours the Idempotency-Key header.
+
+    Without the header the request is handled as usual.
+    With it, the first request is handled and its response stored. Retries with the same key and the same
+    method, path and body get that response back, and retries that arrive while the first request is still
+    running wait for it. Reusing a key for a different request is rejected with 422.
+    Server errors are not stored, so a request that failed that way can be retried with the same key.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, *args, **kwargs):
+        request = self.request
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, *args, **kwargs)
+
+        if len(key) > 255:
+            return Response(data=f"{HEADER} is too long", status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record, created = claim_key(request.user, key, fingerprint)
+
+        if not created:
+            if record.fingerprint != fingerprint:
+                return Response(
+                    data=f"{HEADER} was already used for a different request",
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            completed = wait_for_completion(record)
+            if completed is None:
+                return Response(
+                    data=f"A request with this {HEADER} is still in progress",
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return replay(completed)
+
+        try:
+            response = view_method(self, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            record.delete()
+            return response
+
+        record.complete = True
+        record.response_status = response.status_code
+        record.response_data = getattr(response, "data", None)
+        record.save()
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys() -> int:
+    deleted, _ = IdempotencyKey.objects.filter(created__lt=timezone.now() - IDEMPOTENCY_KEY_LIFETIME).delete()
+    return deleted
@@ -1,3 +1,29 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class IdempotencyKey(models.Model):
+    """
+    A request made to booking_api with an Idempotency-Key header, and the response it got.
+
+    Retries with the same key are answered from here instead of running the request again.
+    See booking_api.idempotency.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # sha256 of the method, path and body of the first request made with this key
+    fingerprint = models.CharField(max_length=64)
+    # False while the first request is still being handled
+    complete = models.BooleanField(default=False)
+    response_status = models.IntegerField(null=True, blank=True)
+    response_data = models.JSONField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} for {self.user}"
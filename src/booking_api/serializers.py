@@ -5,6 +5,15 @@ from booking.models import Booking
 # class UserSerializer(serializers.Serializer):
 
 
+class BookingInstanceSerializer(serializers.Serializer):
+    instance_id = serializers.CharField()
+    host_alias = serializers.CharField()
+    hostname = serializers.CharField()
+    flavor_id = serializers.CharField()
+    image_id = serializers.CharField()
+    provisioned = serializers.BooleanField()
+
+
 class BookingSerializer(serializers.Serializer):
     # all fields below or serializer
     id = serializers.IntegerField()
@@ -17,6 +26,7 @@ class BookingSerializer(serializers.Serializer):
     project = serializers.CharField()
     aggregateId = serializers.CharField()
     complete = serializers.BooleanField()
+    instances = BookingInstanceSerializer(source="instances.all", many=True)
 
     class Meta:
         model = Booking
@@ -31,5 +41,6 @@ class BookingSerializer(serializers.Serializer):
             "project",
             "aggreegateId",
             "complete",
+            "instances",
         }
 
@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from booking_api.idempotency import purge_expired_keys
+
+
+@shared_task
+def purge_idempotency_keys():
+    purge_expired_keys()
@@ -8,6 +8,9 @@ from datetime import timedelta
 from rest_framework.authtoken.models import Token
 import json
 from unittest.mock import patch
+from booking_api.models import IdempotencyKey
+from liblaas.jobs import run
+from liblaas.models import Job, OutboxEntry
 
 class BookingViewSetTestCase(TestCase):
     # NOTE: Set up test data only runs once where set up runs for each test
@@ -35,7 +38,7 @@ class BookingViewSetTestCase(TestCase):
         self.booking = Booking.objects.get(owner=self.user)
 
     # endpoint /booking
-    @patch("booking_api.views.booking_create_booking")
+    @patch("liblaas.outbox.booking_create_booking")
     def test_booking(self, booking_create_booking_mock):
         response: Response = self.client.get(
             "http://127.0.0.1:8000/booking_api/booking/"
@@ -120,6 +123,26 @@ class BookingViewSetTestCase(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_unknown_allowed_users_sent_to_liblaas(self):
+        booking_blob = {
+            "template_id": " ",
+            "allowed_users": ["collaborator", "ipa-only"],
+            "global_cifile": "",
+            "metadata": {"purpose": "test", "project": "test", "length": "1"},
+        }
+        response: Response = self.client.post(
+            "http://127.0.0.1:8000/booking_api/booking/",
+            data=json.dumps(booking_blob),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        booking = Booking.objects.get(id=int(response.data))
+        # only dashboard users become collaborators, IPA users without one are still let onto the resources
+        self.assertEqual([user.username for user in booking.collaborators.all()], ["collaborator"])
+        entry = OutboxEntry.objects.get(operation="booking_create_booking", payload__booking_id=booking.id)
+        self.assertIn("ipa-only", entry.payload["blob"]["allowed_users"])
+
     # endpoint /booking/booking_id/extend
     def test_booking_id_extend(self):
         json_string = {"data": "1 "}
@@ -218,3 +241,131 @@ class BookingViewSetTestCase(TestCase):
         )
         self.assertEqual(response_delete.status_code, status.HTTP_200_OK)
 
+
+
+    def test_get_job(self):
+        job = Job.objects.create(
+            kind="reimage", instance_id="instance", payload={"booking_id": self.booking.id}, dedupe_key="job"
+        )
+        other_booking = Booking.objects.create(
+            owner=self.user, start=self.booking.start, end=self.booking.end, purpose="test", project="test", lab=self.booking.lab
+        )
+        url = f"http://127.0.0.1:8000/booking_api/booking/{{}}/job/{job.id}/"
+
+        response = self.client.get(url.format(self.booking.id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.data)["id"], str(job.id))
+
+        # the job belongs to another booking
+        response = self.client.get(url.format(other_booking.id))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        stranger = User.objects.create(username="stranger")
+        token, _ = Token.objects.get_or_create(user=stranger)
+        response = Client(headers={"Authorization": f"Token {token}"}).get(url.format(self.booking.id))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @patch("liblaas.jobs.booking_ipmi_setpower")
+    @patch("booking_api.views.get_booking_instance_ids")
+    def test_poll_power_job(self, mock_instance_ids, mock_setpower):
+        mock_instance_ids.return_value = ["instance"]
+        mock_setpower.return_value = {"success": True}
+        Booking.objects.filter(id=self.booking.id).update(aggregateId="aggregate")
+        url = f"http://127.0.0.1:8000/booking_api/booking/{self.booking.id}/instance/{{}}/power/"
+
+        response = self.client.post(url.format("instance"), data=json.dumps({"command": "PowerOn"}), content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = json.loads(response.data)["id"]
+        run(job_id)
+        mock_setpower.assert_called_once_with("instance", {"command": "PowerOn"})
+
+        response = self.client.get(f"http://127.0.0.1:8000/booking_api/booking/{self.booking.id}/job/{job_id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.data)["status"], "succeeded")
+
+        response = self.client.get(url.format("instance"))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = json.loads(response.data)["id"]
+        response = self.client.get(f"http://127.0.0.1:8000/booking_api/booking/{self.booking.id}/job/{job_id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # the instance of another booking
+        response = self.client.post(url.format("other"), data=json.dumps({"command": "PowerOn"}), content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IdempotencyKeyTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = User.objects.create(username="test")
+        UserProfile.objects.create(user=cls.user)
+        cls.lab = Lab.objects.create(name="UNH_IOL", lab_user=cls.user)
+        cls.booking_blob = json.dumps({
+            "template_id": " ",
+            "allowed_users": ["test"],
+            "global_cifile": "",
+            "metadata": {"purpose": "test", "project": "test", "length": "1"},
+        })
+
+    def setUp(self):
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = Client(headers={"Authorization": f"Token {token}"})
+
+    def post_booking(self, key, data=None):
+        return self.client.post(
+            "http://127.0.0.1:8000/booking_api/booking/",
+            data=data or self.booking_blob,
+            content_type="application/json",
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_retry_is_replayed(self):
+        first = self.post_booking("key-1")
+        retry = self.post_booking("key-1")
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Booking.objects.count(), 1)
+
+        self.post_booking("key-2")
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_key_reused_for_different_request(self):
+        self.post_booking("key-1")
+        other_blob = json.loads(self.booking_blob)
+        other_blob["metadata"]["purpose"] = "other"
+        response = self.post_booking("key-1", json.dumps(other_blob))
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    @patch("booking_api.idempotency.IDEMPOTENCY_WAIT_TIMEOUT", 0)
+    def test_in_flight_request_is_not_repeated(self):
+        self.post_booking("key-1")
+        # as if the first request was still being handled
+        IdempotencyKey.objects.filter(key="key-1").update(complete=False)
+        response = self.post_booking("key-1")
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    @patch("booking_api.idempotency.IDEMPOTENCY_WAIT_TIMEOUT", 0)
+    def test_abandoned_request_is_claimed_again(self):
+        self.post_booking("key-1")
+        # as if the worker handling the first request was killed before it finished
+        IdempotencyKey.objects.filter(key="key-1").update(complete=False, created=timezone.now() - timedelta(minutes=5))
+        response = self.post_booking("key-1")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertTrue(IdempotencyKey.objects.get(key="key-1").complete)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_expired_key_can_be_reused(self):
+        self.post_booking("key-1")
+        IdempotencyKey.objects.filter(key="key-1").update(created=timezone.now() - timedelta(days=2))
+        self.post_booking("key-1")
+
+        self.assertEqual(Booking.objects.count(), 2)
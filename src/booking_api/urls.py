@@ -6,6 +6,10 @@ from .views import (
     BookingIdInstanceIdReprovisionViewSet,
     BookingIdExtend,
     BookingIdStatusViewSet,
+    BookingIdOperationsViewSet,
+    BookingIdJobViewSet,
+    BookingIdReprovisionViewSet,
+    AvailabilityViewSet,
 )
 from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
@@ -20,11 +24,16 @@ urlpatterns = format_suffix_patterns(
             BookingIdCollaboratorsViewSet.as_view({"get": "get_collaborators", "post": "post"})
             ),
         path("booking/<int:booking_id>/instance/<str:instance_id>/power/",
-            BookingIdInstanceIdPowerViewSet.as_view({"post": "power"})
+            BookingIdInstanceIdPowerViewSet.as_view({"get": "power_status", "post": "power"})
             ),
+        path("booking/<int:booking_id>/job/<uuid:job_id>/", BookingIdJobViewSet.as_view({"get": "get_job"})),
         path("booking/<int:booking_id>/extend/", BookingIdExtend.as_view({"post": "extend"})),
+        path("booking/<int:booking_id>/operations/", BookingIdOperationsViewSet.as_view({"get": "list_operations"})),
         path("booking/<int:booking_id>/instance/<str:instance_id>/reprovision/",
             BookingIdInstanceIdReprovisionViewSet.as_view({"post": "reprovision"})
             ),
+        path("booking/<int:booking_id>/reprovision/", BookingIdReprovisionViewSet.as_view({"post": "reprovision"})),
+        path("booking/<int:booking_id>/reprovision/<uuid:batch_id>/", BookingIdReprovisionViewSet.as_view({"get": "progress"})),
+        path("availability/", AvailabilityViewSet.as_view({"get": "get_availability"})),
     ]
 )
@@ -2,26 +2,29 @@ from rest_framework import viewsets, status
 from booking.models import Booking
 from datetime import timedelta
 from .serializers import BookingSerializer
-from account.models import User, UserProfile, Lab
+from account.models import User, UserProfile
 from account.views import user_get_user
-from liblaas.views import (
-    booking_create_booking,
-    booking_booking_status,
-    booking_ipmi_setpower,
-    booking_set_image,
-)
-from booking.lib import attempt_end_booking
+from liblaas.views import booking_booking_status
+from booking.lib import attempt_end_booking, create_booking
+from booking_api.idempotency import idempotent
+from liblaas.jobs import submit, submit_reimage, describe_reimage_batch
+from liblaas.models import Job, OutboxEntry
+from liblaas.outbox import booking_key
+from liblaas.utils import get_booking_instance_ids
+from laas_dashboard.settings import AVAILABILITY_DAYS, AVAILABILITY_MAX_DAYS
+from resource_inventory.availability import calendar, check, template_flavor_counts
 from rest_framework.response import Response
 from django.core.exceptions import ObjectDoesNotExist
 from django.http import HttpRequest
 from django.utils import timezone
 from datetime import timedelta, datetime
 import json
+import logging
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.request import Request
-from laas_dashboard.settings import PROJECT
 
+logger = logging.getLogger(__name__)
 
 # endpoint booking_api/booking
 class BookingViewSet(viewsets.ViewSet):
@@ -38,7 +41,7 @@ class BookingViewSet(viewsets.ViewSet):
                 active = True
             else:
                 active = False
-            bookings_of_user = Booking.objects.filter(owner=user)
+            bookings_of_user = Booking.objects.filter(owner=user).prefetch_related("instances")
             lst_of_serial_booking: list = []
             for booking in bookings_of_user:
                 if active:
@@ -58,55 +61,26 @@ class BookingViewSet(viewsets.ViewSet):
         else:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
+    @idempotent
     def create(self, request: HttpRequest):
         if self.request.user.is_authenticated:
-            booking_response = None
             data = self.request.data
-            allowed_users = list(data["allowed_users"])
-            ipa_users = allowed_users
-            booking_blob = {
-                "template_id": data["template_id"],
-                "allowed_users": ipa_users,
-                "global_cifile": data["global_cifile"],
-                "metadata": {
-                    "booking_id": str(None),
-                    "owner": UserProfile.objects.get(
-                        user=self.request.user
-                    ).ipa_username,
-                    "lab": PROJECT,
-                    "purpose": data["metadata"]["purpose"],
-                    "project": data["metadata"]["project"],
-                    "length": int(data["metadata"]["length"]),
-                },
-                "origin": PROJECT,
-            }
-            # Dashboard booking
-            booking = Booking.objects.create(
-                purpose=booking_blob["metadata"]["purpose"],
-                project=booking_blob["metadata"]["project"],
-                lab=Lab.objects.get(name="UNH_IOL"),
-                owner=self.request.user,
-                start=timezone.now(),
-                end=timezone.now()
-                + timedelta(days=int(booking_blob["metadata"]["length"])),
+            booking, warnings = create_booking(
+                owner_profile=UserProfile.for_user(self.request.user),
+                template_id=data["template_id"],
+                collaborators=list(data["allowed_users"]),
+                global_cifile=data["global_cifile"],
+                purpose=data["metadata"]["purpose"],
+                project=data["metadata"]["project"],
+                length=int(data["metadata"]["length"]),
+                details=data["metadata"].get("details", ""),
+                validate_collaborators=False,
+                send_unknown_users=True,
             )
-            for booking_collaborator in allowed_users:
-                try:
-                    booking.collaborators.add(
-                        User.objects.get(username=booking_collaborator)
-                    )
-                    booking.save()
-                except ObjectDoesNotExist:
-                    print("collaborators not found")
-            booking_blob["metadata"]["booking_id"] = str(booking.id)
-            booking_response = booking_create_booking(booking_blob)
-            booking.aggregateId = booking_response
-            booking.save()
-            if booking_response is None:
-                return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-            else:
 
-                return Response(str(booking.id), status=status.HTTP_200_OK)
+            for warning in warnings:
+                logger.warning(warning, extra={"fields": {"booking_id": booking.id}})
+            return Response(str(booking.id), status=status.HTTP_200_OK)
         else:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
@@ -273,17 +247,81 @@ class BookingIdInstanceIdPowerViewSet(viewsets.ViewSet):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def booking_of_instance(self, **kwargs):
+        """
+        Returns the booking of the instance in the url, or an error response if the user may not use it.
+        """
+        try:
+            booking = Booking.objects.get(id=kwargs["booking_id"])
+        except ObjectDoesNotExist:
+            return (None, Response(status=status.HTTP_400_BAD_REQUEST))
+        if not (
+            self.request.user == booking.owner
+            or self.request.user.is_superuser
+            or booking.collaborators.filter(id=self.request.user.id).exists()
+        ):
+            return (None, Response(status=status.HTTP_401_UNAUTHORIZED))
+
+        instance_ids = get_booking_instance_ids(booking.aggregateId) if booking.aggregateId else []
+        if instance_ids is None:
+            return (None, Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR))
+        if kwargs["instance_id"] not in instance_ids:
+            return (None, Response(data="Instance does not belong to this booking", status=status.HTTP_400_BAD_REQUEST))
+        return (booking, None)
+
+    @idempotent
     def power(self, *args, **kwargs):
         if self.request.user.is_authenticated:
-            host_id = self.kwargs["booking_id"]
-            command = self.request.data
-            r_data = booking_ipmi_setpower(
-                host_id=self.kwargs["instance_id"], command=command
+            booking, error = self.booking_of_instance(**kwargs)
+            if error is not None:
+                return error
+            # Run by a celery worker, poll booking/{booking_id}/job/{job_id} for the result
+            job, _ = submit(
+                "ipmi_setpower",
+                kwargs["instance_id"],
+                dict(self.request.data, booking_id=booking.id),
+                user=self.request.user,
             )
-            if r_data is not None:
-                return Response(data=r_data, status=status.HTTP_200_OK)
-            else:
-                return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response(data=json.dumps(job.to_dict()), status=status.HTTP_202_ACCEPTED)
+        else:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+    def power_status(self, *args, **kwargs):
+        if self.request.user.is_authenticated:
+            booking, error = self.booking_of_instance(**kwargs)
+            if error is not None:
+                return error
+            job, _ = submit("ipmi_getpower", kwargs["instance_id"], {"booking_id": booking.id}, user=self.request.user)
+            return Response(data=json.dumps(job.to_dict()), status=status.HTTP_202_ACCEPTED)
+        else:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+
+# Reports the state of a job started by the power (or reprovision) endpoints
+# endpoint booking_api/booking/{booking_id}/job/{job_id}
+class BookingIdJobViewSet(viewsets.ViewSet):
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_job(self, *args, **kwargs):
+        if self.request.user.is_authenticated:
+            try:
+                booking = Booking.objects.get(id=kwargs["booking_id"])
+            except ObjectDoesNotExist:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            if not (
+                self.request.user == booking.owner
+                or self.request.user.is_superuser
+                or booking.collaborators.filter(id=self.request.user.id).exists()
+            ):
+                return Response(status=status.HTTP_401_UNAUTHORIZED)
+            try:
+                job = Job.objects.get(id=kwargs["job_id"], payload__booking_id=booking.id)
+            except ObjectDoesNotExist:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            if job.kind == "reimage":
+                return Response(data=json.dumps(describe_reimage_batch([job])[0]), status=status.HTTP_200_OK)
+            return Response(data=json.dumps(job.to_dict()), status=status.HTTP_200_OK)
         else:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
@@ -294,6 +332,7 @@ class BookingIdInstanceIdReprovisionViewSet(viewsets.ViewSet):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def reprovision(self, *args, **kwargs):
         if self.request.user.is_authenticated:
             try:
@@ -301,15 +340,70 @@ class BookingIdInstanceIdReprovisionViewSet(viewsets.ViewSet):
             except ObjectDoesNotExist:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
             if self.request.user == booking.owner:
-                response = booking_set_image(
-                    instance_key=kwargs["instance_id"],
-                    image={"image_id": self.request.data["image"]},
+                # Run by a celery worker, poll booking/{booking_id}/job/{job_id} for progress
+                _, jobs = submit_reimage(
+                    booking, {kwargs["instance_id"]: {"image_id": self.request.data["image"]}}, user=self.request.user
                 )
-                print(response)
-                if response["code"] == 500 or response is None:
-                    return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                elif response["code"] == 200:
-                    return Response(status=status.HTTP_200_OK)
+                return Response(data=json.dumps(jobs[0].to_dict()), status=status.HTTP_202_ACCEPTED)
+            else:
+                return Response(status=status.HTTP_401_UNAUTHORIZED)
+        else:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+
+# Reprovisions several instances of a booking at once
+# Body: {"instances": {instance_id: image_id}}
+# endpoint booking_api/booking/{booking_id}/reprovision
+# endpoint booking_api/booking/{booking_id}/reprovision/{batch_id} reports the progress of each instance
+class BookingIdReprovisionViewSet(viewsets.ViewSet):
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @idempotent
+    def reprovision(self, *args, **kwargs):
+        if self.request.user.is_authenticated:
+            try:
+                booking = Booking.objects.get(id=kwargs["booking_id"])
+            except ObjectDoesNotExist:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            if self.request.user != booking.owner:
+                return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+            images = self.request.data.get("instances") if isinstance(self.request.data, dict) else None
+            if not images or not isinstance(images, dict):
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+
+            instance_ids = get_booking_instance_ids(booking.aggregateId) if booking.aggregateId else []
+            if instance_ids is None:
+                return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            if not set(images).issubset(instance_ids):
+                return Response(data="Instances do not belong to this booking", status=status.HTTP_400_BAD_REQUEST)
+
+            batch, jobs = submit_reimage(
+                booking, {instance_id: {"image_id": image} for instance_id, image in images.items()}, user=self.request.user
+            )
+            return Response(
+                data=json.dumps({"batch": str(batch), "jobs": [job.to_dict() for job in jobs]}),
+                status=status.HTTP_202_ACCEPTED,
+            )
+        else:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+    def progress(self, *args, **kwargs):
+        if self.request.user.is_authenticated:
+            try:
+                booking = Booking.objects.get(id=kwargs["booking_id"])
+            except ObjectDoesNotExist:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            if self.request.user != booking.owner:
+                return Response(status=status.HTTP_401_UNAUTHORIZED)
+            jobs = list(Job.objects.filter(batch=kwargs["batch_id"], payload__booking_id=kwargs["booking_id"]))
+            if not jobs:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            return Response(
+                data=json.dumps({"batch": str(kwargs["batch_id"]), "jobs": describe_reimage_batch(jobs)}),
+                status=status.HTTP_200_OK,
+            )
         else:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
@@ -320,6 +414,7 @@ class BookingIdExtend(viewsets.ViewSet):
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def extend(self, request: HttpRequest, **kwargs):
         if self.request.user.is_authenticated:
             try:
@@ -342,3 +437,57 @@ class BookingIdExtend(viewsets.ViewSet):
             
         else:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+
+# Lists the LibLaaS calls queued for a booking and whether they have been delivered
+# endpoint booking_api/booking/{booking_id}/operations
+class BookingIdOperationsViewSet(viewsets.ViewSet):
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def list_operations(self, request: HttpRequest, **kwargs):
+        if self.request.user.is_authenticated:
+            try:
+                booking = Booking.objects.get(id=self.kwargs["booking_id"])
+            except ObjectDoesNotExist:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            if booking.owner != self.request.user:
+                return Response(status=status.HTTP_401_UNAUTHORIZED)
+            entries = OutboxEntry.objects.filter(aggregate_key=booking_key(booking.id))
+            return Response(
+                data=json.dumps([e.to_dict() for e in entries]), status=status.HTTP_200_OK
+            )
+        else:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+
+# Returns the availability calendar of every flavor, and whether a template fits right now
+# endpoint booking_api/availability?days={days}&template_id={template_id}
+class AvailabilityViewSet(viewsets.ViewSet):
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_availability(self, request: HttpRequest):
+        if self.request.user.is_authenticated:
+            try:
+                days = int(self.request.query_params.get("days", AVAILABILITY_DAYS))
+            except ValueError:
+                return Response(data="days must be a number", status=status.HTTP_400_BAD_REQUEST)
+            days = max(1, min(days, AVAILABILITY_MAX_DAYS))
+
+            flavors = calendar(days)
+            if flavors is None:
+                return Response(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            data = {"flavors": flavors}
+
+            template_id = self.request.query_params.get("template_id")
+            if template_id:
+                profile = UserProfile.for_user(self.request.user)
+                counts = template_flavor_counts(template_id, profile.ipa_username)
+                if counts is None:
+                    return Response(data="Template not found", status=status.HTTP_404_NOT_FOUND)
+                data["check"] = check(counts)
+
+            return Response(data=json.dumps(data), status=status.HTTP_200_OK)
+        else:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
@@ -10,7 +10,33 @@
 
 
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
 
+from dashboard.models import Profile
 
 admin.site.site_header = "Laas Dashboard Administration"
 admin.site.site_title = "Laas Dashboard"
+
+
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ["created", "kind", "target", "user", "duration_ms", "samples", "download"]
+    list_filter = ["kind"]
+    search_fields = ["target"]
+    exclude = ["stacks"]
+    readonly_fields = ["kind", "target", "user", "created", "duration_ms", "interval_ms", "samples", "download", "hottest_functions"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="Collapsed stacks")
+    def download(self, profile):
+        return format_html('<a href="{}">{}.folded</a>', reverse("dashboard:profile", args=[profile.id]), profile.id)
+
+    @admin.display(description="Hottest functions")
+    def hottest_functions(self, profile):
+        return format_html(
+            "<table>{}</table>",
+            format_html_join("", "<tr><td>{}</td><td>{}</td></tr>", profile.hottest()),
+        )
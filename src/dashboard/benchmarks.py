@@ -0,0 +1,308 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Benchmarks of the hot views and the periodic tasks, against synthetic data at a few scales.
+# LibLaaS is replaced by the simulator (liblaas.simulator), which also counts the calls made to it.
+#
+# Every run of a scenario starts with empty caches and is rolled back afterwards, so its SQL query and LibLaaS call
+# counts are exact and repeatable. Those, and a generous latency limit, are budgeted per scale in BUDGETS_FILE.
+# The test suite checks the counts at the small scale, `manage.py benchmark_views` measures every scale.
+
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from account.models import Lab, UserProfile
+from analytics.tasks import update_booking_rollups
+from booking.models import Booking
+from booking_api.tasks import purge_idempotency_keys
+from dashboard.tasks import end_expired_bookings, send_notifications, sync_booking_instances
+from laas_dashboard.settings import BOOKING_LAB
+from liblaas import views as liblaas_views
+from liblaas.simulator import Simulator, make_server
+from liblaas.tasks import expire_stale_jobs, relay_outbox
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), "benchmark_budgets.json")
+
+SCALES = {
+    "small": {"users": 20, "bookings": 200, "active": 4, "collaborators": 3},
+    "medium": {"users": 200, "bookings": 2000, "active": 12, "collaborators": 5},
+    "large": {"users": 1000, "bookings": 20000, "active": 30, "collaborators": 8},
+}
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class LibLaaSStub:
+    """
+    Runs a simulator on a free local port and points liblaas.views at it until stopped.
+    """
+
+    def __init__(self, hosts_per_flavor: int, latency_ms: float = 0, seed: int = 0):
+        self.simulator = Simulator({
+            "seed": seed,
+            "flavors": [{"name": "Bench x86", "hosts": hosts_per_flavor}, {"name": "Bench arm", "arch": "aarch64", "hosts": hosts_per_flavor}],
+            "provision_step_seconds": 0,
+            "faults": {"default": {"latency": {"distribution": "fixed", "ms": latency_ms}}},
+        })
+        self.server = make_server(self.simulator, port=0)
+        self.base = patch.object(liblaas_views, "base", f"http://127.0.0.1:{self.server.server_port}/")
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        self.base.start()
+        return self
+
+    def stop(self):
+        self.base.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def calls(self) -> dict[str, int]:
+        return {endpoint: counts["requests"] for endpoint, counts in self.simulator.get_stats()["endpoints"].items()}
+
+
+def seed(scale: str, stub: LibLaaSStub, rng_seed: int = 0) -> dict:
+    """
+    Creates the users and bookings of the given scale. Returns what the scenarios need to know about them.
+
+    The first user is the one the views are benchmarked as. It owns every active booking, a tenth of the
+    past ones, and collaborates on others' bookings, so its pages grow with the scale like a heavy user's would.
+    """
+    sizes = SCALES[scale]
+    rng = random.Random(rng_seed)
+    now = timezone.now()
+
+    users = User.objects.bulk_create([User(username=f"bench{i}", email=f"bench{i}@email.com") for i in range(sizes["users"])])
+    UserProfile.objects.bulk_create([
+        UserProfile(user=user, ipa_username=user.username, email_addr=user.email) for user in users
+    ])
+    Token.objects.bulk_create([Token(user=user, key=f"{user.id:040d}") for user in users])
+    user = users[0]
+    lab_user = User.objects.create(username="bench-lab")
+    Lab.objects.get_or_create(name=BOOKING_LAB, defaults={"lab_user": lab_user, "contact_email": "lab@email.com"})
+
+    past = []
+    for i in range(sizes["bookings"] - sizes["active"]):
+        start = now - timedelta(days=rng.uniform(1, 730))
+        past.append(Booking(
+            owner=user if i % 10 == 0 else rng.choice(users),
+            start=start,
+            end=min(start + timedelta(days=rng.randint(1, 21)), now - timedelta(hours=1)),
+            purpose="benchmark",
+            project=rng.choice(["anuket", "onap", "nephio"]),
+            details="Synthetic booking",
+            lab_id=BOOKING_LAB,
+            aggregateId=f"past-{i}",
+            complete=True,
+        ))
+    Booking.objects.bulk_create(past)
+
+    template = next(iter(stub.simulator.templates.values()))
+    active = []
+    for i in range(sizes["active"]):
+        _, aggregate_id = stub.simulator.booking_create_booking({"template_id": template["id"], "allowed_users": [user.username]})
+        active.append(Booking.objects.create(
+            owner=user,
+            start=now - timedelta(days=1),
+            end=now + timedelta(days=rng.randint(2, 14)),
+            purpose="benchmark",
+            project="anuket",
+            details="Synthetic booking",
+            lab_id=BOOKING_LAB,
+            aggregateId=aggregate_id,
+        ))
+
+    bookings = past + active
+    others = users[1:]
+    Booking.collaborators.through.objects.bulk_create([
+        Booking.collaborators.through(booking_id=booking.id, user_id=collaborator.id)
+        for booking in bookings
+        for collaborator in rng.sample(others, min(sizes["collaborators"], len(others)))
+        if collaborator != booking.owner
+    ] + [
+        Booking.collaborators.through(booking_id=booking.id, user_id=user.id)
+        for booking in bookings[1::7] if booking.owner != user
+    ])
+
+    return {
+        "scale": scale,
+        "user_id": user.id,
+        "token": Token.objects.get(user=user).key,
+        "booking_id": active[0].id,
+    }
+
+
+# --- SCENARIOS ---
+# Each takes the seeded data and a client logged in as its user, and returns the response status (or None for tasks).
+
+def get(client: Client, url: str, **headers):
+    return client.get(url, **headers).status_code
+
+
+def task(function):
+    def scenario(data, client):
+        function()
+    return scenario
+
+
+SCENARIOS = {
+    "booking_detail_view": lambda data, client: get(client, f"/booking/detail/{data['booking_id']}/"),
+    "account_booking_view": lambda data, client: get(client, "/accounts/my/bookings/"),
+    "BookingListView": lambda data, client: get(client, "/booking/list/"),
+    "landing_view": lambda data, client: get(client, "/"),
+    "book_a_pod_view": lambda data, client: get(client, "/workflow/book/"),
+    "BookingViewSet.list": lambda data, client: get(client, "/booking_api/booking/", HTTP_AUTHORIZATION=f"Token {data['token']}"),
+    "get_collaborators": lambda data, client: get(
+        client, f"/booking_api/booking/{data['booking_id']}/collaborators/?full=True", HTTP_AUTHORIZATION=f"Token {data['token']}"
+    ),
+    "end_expired_bookings": task(end_expired_bookings),
+    "send_notifications": task(send_notifications),
+    "sync_booking_instances": task(sync_booking_instances),
+    "update_booking_rollups": task(update_booking_rollups),
+    "relay_outbox": task(relay_outbox),
+    "expire_stale_jobs": task(expire_stale_jobs),
+    "purge_idempotency_keys": task(purge_idempotency_keys),
+}
+
+
+class QueryCounter:
+    """
+    Counts the SQL statements run, used with connection.execute_wrapper(). Unlike connection.queries it has no limit.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def clear_caches():
+    for alias in caches:
+        caches[alias].clear()
+
+
+def measure(name: str, data: dict, client: Client, stub: LibLaaSStub, repeat: int) -> dict:
+    """
+    Runs a scenario repeat times, each with empty caches and rolled back afterwards.
+    Returns its SQL query and LibLaaS call counts (the most of any run) and its latency in milliseconds.
+    """
+    timings = []
+    queries = 0
+    calls = {}
+    for _ in range(repeat):
+        clear_caches()
+        before = stub.calls()
+        counter = QueryCounter()
+        with transaction.atomic():
+            with connection.execute_wrapper(counter):
+                begin = time.perf_counter()
+                status = SCENARIOS[name](data, client)
+                timings.append((time.perf_counter() - begin) * 1000)
+            transaction.set_rollback(True)
+
+        if status is not None and status >= 400:
+            raise BenchmarkError(f"{name} responded with {status}")
+        queries = max(queries, counter.count)
+        after = stub.calls()
+        run_calls = {endpoint: count - before.get(endpoint, 0) for endpoint, count in after.items() if count > before.get(endpoint, 0)}
+        if sum(run_calls.values()) >= sum(calls.values()):
+            calls = run_calls
+
+    timings.sort()
+    return {
+        "queries": queries,
+        "liblaas_calls": sum(calls.values()),
+        "liblaas_endpoints": calls,
+        "ms": {
+            "min": round(timings[0], 2),
+            "median": round(statistics.median(timings), 2),
+            "p95": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+            "max": round(timings[-1], 2),
+        },
+        "repeat": repeat,
+    }
+
+
+def run(scale: str, repeat: int = 5, scenarios: list[str] = None, latency_ms: float = 0, rng_seed: int = 0) -> dict:
+    """
+    Seeds the given scale and measures every scenario, or only the given ones. Call it against a throwaway database.
+    """
+    stub = LibLaaSStub(SCALES[scale]["active"] + 5, latency_ms, rng_seed).start()
+    try:
+        data = seed(scale, stub, rng_seed)
+        client = Client()
+        client.force_login(User.objects.get(id=data["user_id"]))
+        results = {name: measure(name, data, client, stub, repeat) for name in scenarios or SCENARIOS}
+    finally:
+        stub.stop()
+
+    return {
+        "scale": scale,
+        "sizes": SCALES[scale],
+        "liblaas_latency_ms": latency_ms,
+        "measured": timezone.now().isoformat(),
+        "results": results,
+    }
+
+
+def load_budgets(path: str = BUDGETS_FILE) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_budgets(report: dict, budgets: dict, latency: bool = True) -> list[str]:
+    """
+    Returns a description of every budget the report goes over. Scenarios without a budget are reported too.
+    """
+    violations = []
+    scale_budgets = budgets.get(report["scale"], {})
+    for name, result in report["results"].items():
+        budget = scale_budgets.get(name)
+        if budget is None:
+            violations.append(f"{report['scale']} {name}: no budget")
+            continue
+        measured = {"queries": result["queries"], "liblaas_calls": result["liblaas_calls"]}
+        if latency:
+            measured["p95_ms"] = result["ms"]["p95"]
+        for key, value in measured.items():
+            if key in budget and value > budget[key]:
+                violations.append(f"{report['scale']} {name}: {key} {value} over budget {budget[key]}")
+    return violations
+
+
+def budgets_from(report: dict) -> dict:
+    """
+    Budgets matching the given report: its exact counts, and room for a slower machine on latency.
+    """
+    return {
+        name: {
+            "queries": result["queries"],
+            "liblaas_calls": result["liblaas_calls"],
+            "p95_ms": max(round(result["ms"]["p95"] * 5), 250),
+        }
+        for name, result in report["results"].items()
+    }
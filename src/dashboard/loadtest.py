@@ -0,0 +1,434 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Load tests of a running dashboard, with traffic modelled on how it is used:
+#   - watchers have a booking's detail page open, which polls the booking's status and the power state of its hosts
+#   - CI clients create a booking through booking_api, wait for it to be provisioned, look at it and end it
+#   - visitors load the landing page
+# Each user is a thread of its own, making requests over HTTP like a browser or CI job would. Point the deployment at
+# the LibLaaS simulator (`manage.py liblaas_simulator`) to test the dashboard rather than the labs.
+#
+# prepare() creates the users (and the watchers' bookings) in the deployment's database, so it has to run with the
+# deployment's settings. The report has the throughput, latency percentiles and error rate of every endpoint.
+
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import timedelta
+from importlib import import_module
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from account.models import Lab, UserProfile
+from booking.lib import attempt_end_booking
+from booking.models import Booking
+from laas_dashboard.settings import BOOKING_LAB, PROJECT
+from liblaas import views as liblaas_views
+
+USERNAME_PREFIX = "loadtest"
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+class LoadTestError(Exception):
+    pass
+
+
+class Recorder:
+    """
+    Collects the outcome of every request, shared by all the users' threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+        self.events = Counter()
+
+    def record(self, endpoint: str, ms: float, status: int | None):
+        # status is None when no response was received at all
+        with self.lock:
+            self.timings[endpoint].append(ms)
+            self.statuses[endpoint][str(status) if status is not None else "no response"] += 1
+            if status is None or status >= 400:
+                self.errors[endpoint] += 1
+
+    def event(self, name: str):
+        with self.lock:
+            self.events[name] += 1
+
+    def report(self, duration: float) -> dict:
+        with self.lock:
+            endpoints = {endpoint: summarize(timings, self.errors[endpoint], self.statuses[endpoint], duration)
+                         for endpoint, timings in sorted(self.timings.items())}
+            every = [ms for timings in self.timings.values() for ms in timings]
+            statuses = sum(self.statuses.values(), Counter())
+            total = summarize(every, sum(self.errors.values()), statuses, duration) if every else None
+            return {"duration_s": round(duration, 2), "total": total, "endpoints": endpoints, "events": dict(self.events)}
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    # nearest rank
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(timings: list[float], errors: int, statuses: Counter, duration: float) -> dict:
+    ordered = sorted(timings)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "error_rate": round(errors / len(ordered), 4),
+        "rps": round(len(ordered) / duration, 2) if duration else None,
+        "ms": {
+            **{f"p{p}": round(percentile(ordered, p), 2) for p in PERCENTILES},
+            "max": round(ordered[-1], 2),
+        },
+        "statuses": dict(statuses),
+    }
+
+
+class VirtualUser(threading.Thread):
+    """
+    A user of the dashboard, repeating its scenario every interval seconds until the deadline.
+    Its first run is at a random point of the first interval, so users that start together don't stay in step.
+    """
+
+    def __init__(self, target: str, recorder: Recorder, deadline: float, interval: float, timeout: float, rng: random.Random):
+        super().__init__(daemon=True)
+        self.target = target.rstrip("/")
+        self.recorder = recorder
+        self.deadline = deadline
+        self.interval = interval
+        self.timeout = timeout
+        self.rng = rng
+        self.session = requests.Session()
+
+    def request(self, method: str, path: str, endpoint: str, **kwargs) -> requests.Response | None:
+        """
+        Makes a request and records it under endpoint, the path with its ids left out.
+        """
+        begin = time.perf_counter()
+        try:
+            response = self.session.request(method, self.target + path, timeout=self.timeout, allow_redirects=False, **kwargs)
+        except requests.RequestException:
+            self.recorder.record(endpoint, (time.perf_counter() - begin) * 1000, None)
+            return None
+        self.recorder.record(endpoint, (time.perf_counter() - begin) * 1000, response.status_code)
+        return response
+
+    def wait(self, seconds: float) -> bool:
+        """
+        Sleeps, returns False instead if the deadline is reached first.
+        """
+        if time.time() + seconds >= self.deadline:
+            return False
+        time.sleep(seconds)
+        return True
+
+    def run(self):
+        if not self.wait(self.rng.uniform(0, self.interval)):
+            return
+        self.start_session()
+        while time.time() < self.deadline:
+            begin = time.time()
+            self.step()
+            if not self.wait(max(0, self.interval - (time.time() - begin))):
+                return
+
+    def start_session(self):
+        pass
+
+    def step(self):
+        raise NotImplementedError
+
+
+class Watcher(VirtualUser):
+    """
+    Has the detail page of a booking open. The page polls the booking's status and its hosts' power state.
+    """
+
+    def __init__(self, *args, session_key: str, booking: dict, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session.cookies.set(settings.SESSION_COOKIE_NAME, session_key)
+        self.booking = booking
+
+    def start_session(self):
+        self.request("GET", f"/booking/detail/{self.booking['id']}/", "GET /booking/detail/<id>/")
+
+    def step(self):
+        path = f"/booking/detail/{self.booking['id']}/"
+        self.request(
+            "POST", path, "POST /booking/detail/<id>/ (status)",
+            data=json.dumps({"agg_id": self.booking["aggregate_id"]}),
+            headers={
+                "Content-Type": "application/json",
+                "X-CSRFToken": self.session.cookies.get(settings.CSRF_COOKIE_NAME, ""),
+                "Referer": self.target + path,
+            },
+        )
+        self.request("GET", f"/liblaas/ipmi/booking/{self.booking['id']}/", "GET /liblaas/ipmi/booking/<id>/")
+
+
+class CIClient(VirtualUser):
+    """
+    A CI job using booking_api. Creates a booking, waits for it to be provisioned, checks its status and ends it.
+    A booking that isn't provisioned within provision_polls polls is ended without checking its status.
+    """
+
+    def __init__(self, *args, token: str, template_id: str, poll_interval: float, provision_polls: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session.headers["Authorization"] = f"Token {token}"
+        self.template_id = template_id
+        self.poll_interval = poll_interval
+        self.provision_polls = provision_polls
+
+    def step(self):
+        response = self.request(
+            "POST", "/booking_api/booking/", "POST /booking_api/booking/",
+            json={
+                "template_id": self.template_id,
+                "allowed_users": [],
+                "global_cifile": "",
+                "metadata": {"purpose": "load test", "project": PROJECT or "anuket", "length": 1, "details": "Load test booking"},
+            },
+            headers={"Idempotency-Key": str(uuid.uuid4())},
+        )
+        if response is None or response.status_code != 200:
+            return
+        booking_id = response.json()
+        self.recorder.event("bookings created")
+
+        self.request("GET", "/booking_api/booking/?active=True", "GET /booking_api/booking/?active=True")
+
+        for poll in range(self.provision_polls):
+            response = self.request("GET", f"/booking_api/booking/{booking_id}/", "GET /booking_api/booking/<id>/")
+            if response is not None and response.status_code == 200 and json.loads(response.json()).get("aggregateId"):
+                self.recorder.event("bookings provisioned")
+                self.request("GET", f"/booking_api/booking/{booking_id}/status/", "GET /booking_api/booking/<id>/status/")
+                break
+            if poll == self.provision_polls - 1 or not self.wait(self.poll_interval):
+                self.recorder.event("bookings not provisioned in time")
+                break
+
+        if self.request("DELETE", f"/booking_api/booking/{booking_id}/", "DELETE /booking_api/booking/<id>/") is not None:
+            self.recorder.event("bookings ended")
+
+
+class Visitor(VirtualUser):
+    """
+    Loads the landing page, without logging in.
+    """
+
+    def step(self):
+        self.request("GET", "/", "GET /")
+
+
+def session_key(user: User) -> str:
+    """
+    Starts a logged in session for the user, like Client.force_login() does.
+    """
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return session.session_key
+
+
+def load_users(count: int, kind: str) -> list[User]:
+    """
+    Returns count load test users of the given kind, creating the ones that don't exist yet.
+    Their IPA username is their username. They are kept between runs, as bookings keep their owners.
+    """
+    users = []
+    for i in range(count):
+        username = f"{USERNAME_PREFIX}-{kind}{i}"
+        user, _ = User.objects.get_or_create(username=username, defaults={"email": f"{username}@email.com"})
+        profile = UserProfile.for_user(user)
+        if profile.ipa_username != username:
+            profile.ipa_username = username
+            profile.email_addr = user.email
+            profile.save()
+        Token.objects.get_or_create(user=user)
+        users.append(user)
+    return users
+
+
+def public_template(uid: str) -> str:
+    templates = liblaas_views.template_list_templates(uid, PROJECT)
+    if not templates:
+        raise LoadTestError(f"LibLaaS at {liblaas_views.base} has no templates for {uid}")
+    return templates[0]["id"]
+
+
+def prepare(watchers: int, ci_clients: int) -> dict:
+    """
+    Creates the load test users and a provisioned booking for every watcher, directly in LibLaaS so watchers
+    don't depend on the outbox relay. Returns what the users need to log in and book.
+    """
+    if not Lab.objects.filter(name=BOOKING_LAB).exists():
+        raise LoadTestError(f"The deployment has no {BOOKING_LAB} lab to book")
+
+    data = {"watchers": [], "ci_clients": [], "template_id": None}
+    now = timezone.now()
+    for user in load_users(watchers, "watcher"):
+        template_id = public_template(user.username)
+        booking = Booking.objects.create(
+            owner=user,
+            start=now,
+            end=now + timedelta(days=1),
+            purpose="load test",
+            project=PROJECT or "anuket",
+            details="Load test booking",
+            lab_id=BOOKING_LAB,
+        )
+        aggregate_id = liblaas_views.booking_create_booking({
+            "template_id": template_id,
+            "allowed_users": [user.username],
+            "global_cifile": "",
+            "metadata": {
+                "booking_id": str(booking.id),
+                "owner": user.username,
+                "lab": PROJECT,
+                "purpose": booking.purpose,
+                "project": booking.project,
+                "details": booking.details,
+                "length": 1,
+            },
+            "origin": PROJECT,
+        })
+        if not aggregate_id:
+            booking.delete()
+            raise LoadTestError(f"LibLaaS at {liblaas_views.base} didn't create a booking for {user.username}")
+        booking.aggregateId = aggregate_id
+        booking.save()
+        data["watchers"].append({"session_key": session_key(user), "booking": {"id": booking.id, "aggregate_id": aggregate_id}})
+
+    for user in load_users(ci_clients, "ci"):
+        data["template_id"] = data["template_id"] or public_template(user.username)
+        data["ci_clients"].append({"token": Token.objects.get(user=user).key})
+
+    return data
+
+
+def clean_up():
+    """
+    Ends the load test bookings that are still active, the CI clients' bookings included if a run was cut short.
+    """
+    for booking in Booking.objects.filter(owner__username__startswith=f"{USERNAME_PREFIX}-", complete=False):
+        booking.end = timezone.now()
+        booking.save()
+        attempt_end_booking(booking)
+
+
+def liblaas_stats() -> dict | None:
+    # only the simulator has these
+    try:
+        response = requests.get(f"{liblaas_views.base}_simulator/stats", timeout=5)
+        return response.json() if response.status_code == 200 else None
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def liblaas_requests(before: dict | None, after: dict | None) -> dict | None:
+    """
+    The requests the simulator got between the two stats, per endpoint.
+    """
+    if before is None or after is None:
+        return None
+    counts = {}
+    for endpoint, stats in after["endpoints"].items():
+        previous = before["endpoints"].get(endpoint, {})
+        made = {key: value - previous.get(key, 0) for key, value in stats.items()}
+        if any(made.values()):
+            counts[endpoint] = made
+    return counts
+
+
+def run(
+    target: str,
+    data: dict,
+    duration: float,
+    visitors: int = 0,
+    poll_interval: float = 5,
+    ci_interval: float = 60,
+    visit_interval: float = 10,
+    provision_polls: int = 12,
+    timeout: float = 30,
+    rng_seed: int = 0,
+) -> dict:
+    """
+    Runs the prepared watchers and CI clients, and the given number of visitors, against target for duration seconds.
+    """
+    rng = random.Random(rng_seed)
+    recorder = Recorder()
+    begin = time.time()
+    deadline = begin + duration
+    common = {"recorder": recorder, "deadline": deadline, "timeout": timeout}
+
+    users = [
+        Watcher(target, interval=poll_interval, rng=random.Random(rng.random()), session_key=watcher["session_key"],
+                booking=watcher["booking"], **common)
+        for watcher in data["watchers"]
+    ] + [
+        CIClient(target, interval=ci_interval, rng=random.Random(rng.random()), token=client["token"],
+                 template_id=data["template_id"], poll_interval=poll_interval, provision_polls=provision_polls, **common)
+        for client in data["ci_clients"]
+    ] + [
+        Visitor(target, interval=visit_interval, rng=random.Random(rng.random()), **common)
+        for _ in range(visitors)
+    ]
+
+    stats_before = liblaas_stats()
+    for user in users:
+        user.start()
+    for user in users:
+        # a request in flight when the deadline passes is allowed to finish
+        user.join(max(0, deadline - time.time()) + timeout)
+    elapsed = time.time() - begin
+
+    report = recorder.report(elapsed)
+    report.update({
+        "target": target,
+        "users": {"watchers": len(data["watchers"]), "ci_clients": len(data["ci_clients"]), "visitors": visitors},
+        "intervals_s": {"poll": poll_interval, "ci": ci_interval, "visit": visit_interval},
+        "liblaas_requests": liblaas_requests(stats_before, liblaas_stats()),
+        "measured": timezone.now().isoformat(),
+    })
+    return report
+
+
+def format_report(report: dict) -> str:
+    """
+    The report as a table, one line per endpoint.
+    """
+    header = f"{'endpoint':<45} {'requests':>8} {'rps':>7} {'errors':>7} " + " ".join(f"{f'p{p}':>8}" for p in PERCENTILES) + f" {'max':>8}"
+    lines = [header, "-" * len(header)]
+    rows = list(report["endpoints"].items()) + ([("total", report["total"])] if report["total"] else [])
+    for endpoint, stats in rows:
+        latencies = " ".join(f"{stats['ms'][f'p{p}']:>8}" for p in PERCENTILES)
+        lines.append(
+            f"{endpoint:<45} {stats['requests']:>8} {stats['rps']:>7} {stats['error_rate']:>7.1%} "
+            f"{latencies} {stats['ms']['max']:>8}"
+        )
+    for name, count in sorted(report["events"].items()):
+        lines.append(f"{name}: {count}")
+    return "\n".join(lines)
@@ -0,0 +1,97 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+import json
+import sys
+from contextlib import redirect_stdout
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from dashboard.benchmarks import (
+    BUDGETS_FILE,
+    SCALES,
+    SCENARIOS,
+    BenchmarkError,
+    budgets_from,
+    check_budgets,
+    load_budgets,
+    run,
+)
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks the hot views and periodic tasks on synthetic data, against a LibLaaS simulator. "
+            "Runs in a throwaway test database, and with per process caches, so nothing shared is touched.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=list(SCALES), action="append", help="repeat for several, defaults to all")
+        parser.add_argument("--scenario", choices=list(SCENARIOS), action="append", help="repeat for several, defaults to all")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--liblaas-latency-ms", type=float, default=0, help="fixed latency of every simulated LibLaaS call")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", "-o", help="file to write the json results to, defaults to stdout")
+        parser.add_argument("--check", action="store_true", help="fail if any result is over its budget")
+        parser.add_argument("--no-latency-check", action="store_true", help="only check query and LibLaaS call counts")
+        parser.add_argument("--update-budgets", action="store_true", help=f"write the results as the new budgets to {BUDGETS_FILE}")
+
+    def handle(self, *args, **options):
+        local_caches = {
+            alias: {**config, "BACKEND": "laas_dashboard.cache.LocMemCache", "LOCATION": f"benchmark-{alias}", "OPTIONS": {}}
+            for alias, config in settings.CACHES.items()
+        }
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            # the tasks print what they did, which would end up in the json
+            with override_settings(CACHES=local_caches, SESSION_ENGINE="django.contrib.sessions.backends.db"), redirect_stdout(sys.stderr):
+                reports = [
+                    run(scale, options["repeat"], options["scenario"], options["liblaas_latency_ms"], options["seed"])
+                    for scale in options["scale"] or SCALES
+                ]
+        except BenchmarkError as e:
+            raise CommandError(e)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps({"reports": reports}, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if options["update_budgets"]:
+            budgets = load_budgets()
+            for report in reports:
+                budgets.setdefault(report["scale"], {}).update(budgets_from(report))
+            with open(BUDGETS_FILE, "w") as f:
+                f.write(json.dumps(budgets, indent=2, sort_keys=True) + "\n")
+            self.stderr.write(f"Updated {BUDGETS_FILE}")
+
+        if options["check"]:
+            budgets = load_budgets()
+            violations = [
+                violation
+                for report in reports
+                for violation in check_budgets(report, budgets, latency=not options["no_latency_check"])
+            ]
+            if violations:
+                raise CommandError("Over budget:\n" + "\n".join(violations))
+            self.stderr.write("Every benchmark is within its budget")
@@ -0,0 +1,46 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.synthetic import SCALES, GeneratorError, clear, generate
+
+
+class Command(BaseCommand):
+    help = ("Generates users, bookings with collaborators, notifications, API logs and downtimes with the volume and shape "
+            "of a long running deployment. Never run it against production.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=list(SCALES), default="small")
+        for size in ["users", "bookings", "active", "apilogs", "years"]:
+            parser.add_argument(f"--{size}", type=int, help=f"overrides the scale's number of {size}")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--populate-liblaas", action="store_true",
+                            help="create the active bookings in LibLaaS too, e.g. in the LibLaaS simulator")
+        parser.add_argument("--clear", action="store_true", help="delete the data generated earlier first")
+        parser.add_argument("--clear-only", action="store_true", help="only delete the data generated earlier")
+
+    def handle(self, *args, **options):
+        if options["clear"] or options["clear_only"]:
+            clear()
+            self.stdout.write("Cleared the synthetic data")
+            if options["clear_only"]:
+                return
+
+        sizes = {size: options[size] if options[size] is not None else value for size, value in SCALES[options["scale"]].items()}
+        begin = time.monotonic()
+        try:
+            written = generate(sizes, options["seed"], options["populate_liblaas"], out=self.stdout.write)
+        except GeneratorError as e:
+            raise CommandError(e)
+
+        self.stdout.write(f"Generated in {time.monotonic() - begin:.0f}s: " + ", ".join(f"{count} {kind}" for kind, count in written.items()))
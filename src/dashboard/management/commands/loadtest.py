@@ -0,0 +1,83 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.loadtest import LoadTestError, clean_up, format_report, prepare, run
+
+
+class Command(BaseCommand):
+    help = ("Load tests a running dashboard with booking watchers, booking_api CI clients and landing page visitors. "
+            "Run it with the deployment's settings, it creates its users and bookings in the deployment's database. "
+            "Point the deployment at the LibLaaS simulator to test the dashboard rather than the labs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", default=os.environ.get("DASHBOARD_URL"), help="url of the dashboard, defaults to DASHBOARD_URL")
+        parser.add_argument("--duration", type=float, default=300, help="seconds")
+        parser.add_argument("--watchers", type=int, default=20, help="users with a booking detail page open")
+        parser.add_argument("--ci-clients", type=int, default=5, help="CI jobs creating, checking and ending bookings")
+        parser.add_argument("--visitors", type=int, default=10, help="anonymous users loading the landing page")
+        parser.add_argument("--poll-interval", type=float, default=5, help="seconds between a page's status polls")
+        parser.add_argument("--ci-interval", type=float, default=60, help="seconds between a CI client's bookings")
+        parser.add_argument("--visit-interval", type=float, default=10, help="seconds between a visitor's page loads")
+        parser.add_argument("--provision-polls", type=int, default=12, help="polls a CI client waits for its booking to be provisioned")
+        parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as failed")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", "-o", help="file to write the json report to, defaults to stdout")
+        parser.add_argument("--keep-bookings", action="store_true", help="leave the load test bookings active afterwards")
+        parser.add_argument("--max-error-rate", type=float, help="fail if any endpoint's error rate is higher, e.g. 0.01")
+        parser.add_argument("--max-p95-ms", type=float, help="fail if any endpoint's p95 latency is higher")
+
+    def handle(self, *args, **options):
+        if not options["target"]:
+            raise CommandError("No --target given and DASHBOARD_URL isn't set")
+
+        try:
+            data = prepare(options["watchers"], options["ci_clients"])
+        except LoadTestError as e:
+            raise CommandError(e)
+
+        self.stderr.write(f"Load testing {options['target']} for {options['duration']:g}s")
+        try:
+            report = run(
+                options["target"],
+                data,
+                options["duration"],
+                visitors=options["visitors"],
+                poll_interval=options["poll_interval"],
+                ci_interval=options["ci_interval"],
+                visit_interval=options["visit_interval"],
+                provision_polls=options["provision_polls"],
+                timeout=options["timeout"],
+                rng_seed=options["seed"],
+            )
+        finally:
+            if not options["keep_bookings"]:
+                clean_up()
+
+        self.stderr.write(format_report(report))
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        failures = []
+        for endpoint, stats in report["endpoints"].items():
+            if options["max_error_rate"] is not None and stats["error_rate"] > options["max_error_rate"]:
+                failures.append(f"{endpoint}: error rate {stats['error_rate']:.2%}")
+            if options["max_p95_ms"] is not None and stats["ms"]["p95"] > options["max_p95_ms"]:
+                failures.append(f"{endpoint}: p95 {stats['ms']['p95']}ms")
+        if failures:
+            raise CommandError("Not sustained:\n" + "\n".join(failures))
@@ -0,0 +1,96 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.loadtest import format_report
+from dashboard.replay import ReplayError, compare, format_comparison, load_trace, parse_time, read_trace, replay, save_trace
+
+
+class Command(BaseCommand):
+    help = ("Replays the API calls logged in a time window against a test instance, with their original timing or sped up, "
+            "and reports the latency of every endpoint, compared with a baseline run if one is given. "
+            "Calls are made with the tokens of the same users on this instance.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="start of the window to replay, e.g. 2025-01-31T12:00:00+00:00")
+        parser.add_argument("--until", help="end of the window, defaults to now")
+        parser.add_argument("--user", action="append", help="only replay this user's calls, repeat for several")
+        parser.add_argument("--trace", help="replay a trace saved with --save-trace instead of reading APILog")
+        parser.add_argument("--save-trace", help="only save the window's calls to this file, to replay them elsewhere")
+        parser.add_argument("--target", default=os.environ.get("DASHBOARD_URL"), help="url of the test instance, defaults to DASHBOARD_URL")
+        parser.add_argument("--speedup", type=float, default=1, help="e.g. 10 replays an hour in six minutes")
+        parser.add_argument("--workers", type=int, default=32, help="most calls in flight at once")
+        parser.add_argument("--timeout", type=float, default=30, help="seconds before a call counts as failed")
+        parser.add_argument("--output", "-o", help="file to write the json report to, defaults to stdout")
+        parser.add_argument("--baseline", help="report of an earlier run to compare against")
+        parser.add_argument("--max-regression-pct", type=float, help="fail if any endpoint's p95 grew more than this from the baseline")
+
+    def handle(self, *args, **options):
+        try:
+            trace = self.get_trace(options)
+        except (ReplayError, OSError, ValueError, KeyError) as e:
+            raise CommandError(e)
+
+        if options["save_trace"]:
+            save_trace(trace, options["save_trace"])
+            self.stderr.write(f"Saved {len(trace)} calls to {options['save_trace']}")
+            return
+
+        if not trace:
+            raise CommandError("There are no calls to replay")
+        if not options["target"]:
+            raise CommandError("No --target given and DASHBOARD_URL isn't set")
+
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(e)
+
+        self.stderr.write(f"Replaying {len(trace)} calls over {trace[-1]['offset'] / options['speedup']:.0f}s against {options['target']}")
+        try:
+            report = replay(options["target"], trace, options["speedup"], options["workers"], options["timeout"])
+        except ReplayError as e:
+            raise CommandError(e)
+        self.stderr.write(format_report(report))
+
+        if baseline:
+            report["comparison"] = compare(report, baseline)
+            self.stderr.write(format_comparison(report["comparison"]))
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if baseline and options["max_regression_pct"] is not None:
+            regressions = [
+                f"{name}: p95 {entry['p95']['baseline_ms']}ms -> {entry['p95']['ms']}ms"
+                for name, entry in report["comparison"].items()
+                if entry["p95"]["change_pct"] is not None and entry["p95"]["change_pct"] > options["max_regression_pct"]
+            ]
+            if regressions:
+                raise CommandError("Slower than the baseline:\n" + "\n".join(regressions))
+
+    def get_trace(self, options) -> list[dict]:
+        if options["trace"]:
+            return read_trace(options["trace"])
+        if not options["since"]:
+            raise ReplayError("Give the window to replay with --since, or a saved trace with --trace")
+        until = parse_time(options["until"]) if options["until"] else None
+        return load_trace(parse_time(options["since"]), until, options["user"])
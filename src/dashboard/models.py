@@ -7,3 +7,44 @@
 # which accompanies this distribution, and is available at
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
+
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db import models
+
+
+class Profile(models.Model):
+    """
+    A sampling profile of a request or celery task, see laas_dashboard.profiling.
+    """
+
+    KINDS = [("request", "Request"), ("task", "Task")]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    # method and path of the request, or name of the task
+    target = models.CharField(max_length=300)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    duration_ms = models.FloatField()
+    interval_ms = models.FloatField()
+    samples = models.IntegerField()
+    # collapsed stacks, one "outer;inner;leaf count" line per stack
+    stacks = models.TextField(blank=True, default="")
+
+    class Meta:
+        db_table = 'dashboard_profile'
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"{self.target} ({self.duration_ms:.0f}ms, {self.created:%Y-%m-%d %H:%M})"
+
+    def hottest(self, count: int = 20) -> list[tuple[str, int]]:
+        """
+        The functions the most samples were taken in, and how many.
+        """
+        functions = Counter()
+        for line in self.stacks.splitlines():
+            stack, _, samples = line.rpartition(" ")
+            functions[stack.rpartition(";")[2]] += int(samples)
+        return functions.most_common(count)
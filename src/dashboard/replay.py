@@ -0,0 +1,214 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Replays the automation API calls recorded in APILog against a test instance, to compare performance changes on the
+# traffic production actually gets.
+#
+# A trace is the calls of a time window, in order, with their offset from the first call. Traces are read from the
+# database, or from a file saved earlier so they can be taken from a copy of production to a test instance.
+# Calls are made at their original offsets, divided by a speed-up factor, with the token of the user that made them on
+# the test instance. The report has the latency of every endpoint, like dashboard.loadtest's, and can be compared
+# against the report of a baseline run.
+
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.authtoken.models import Token
+
+from api.models import APILog
+from dashboard.loadtest import PERCENTILES, Recorder, percentile
+
+# APILog.endpoint is the path under /api/ that was called
+API_PREFIX = "/api/"
+
+
+class ReplayError(Exception):
+    pass
+
+
+def load_trace(since, until=None, users: list[str] = None) -> list[dict]:
+    """
+    Returns the calls logged between since and until (or now), the oldest first, optionally only those of the given usernames.
+    """
+    logs = APILog.objects.filter(call_time__gte=since, call_time__lt=until or timezone.now()).select_related("user").order_by("call_time", "id")
+    if users:
+        logs = logs.filter(user__username__in=users)
+
+    trace = []
+    first = None
+    for log in logs.iterator():
+        first = first or log.call_time
+        trace.append({
+            "offset": (log.call_time - first).total_seconds(),
+            "time": log.call_time.isoformat(),
+            "user": log.user.username,
+            "method": log.method or "GET",
+            "endpoint": log.endpoint or "",
+            "body": request_body(log.body),
+        })
+    return trace
+
+
+def request_body(body):
+    # auth_and_log() stores the parsed body wrapped in a one element list
+    if isinstance(body, list) and len(body) == 1:
+        return body[0]
+    return body
+
+
+def save_trace(trace: list[dict], path: str):
+    with open(path, "w") as f:
+        json.dump({"trace": trace, "saved": timezone.now().isoformat()}, f, indent=2)
+
+
+def read_trace(path: str) -> list[dict]:
+    with open(path) as f:
+        return json.load(f)["trace"]
+
+
+def endpoint_name(method: str, endpoint: str) -> str:
+    """
+    The name a call is reported under, its method and path with the ids left out.
+    """
+    path = re.sub(r"/\d+(?=/|$)", "/<id>", API_PREFIX + endpoint.lstrip("/"))
+    return f"{method} {path}"
+
+
+def user_tokens(usernames: set[str]) -> dict[str, str]:
+    """
+    The API token of every given user that exists on this instance, created for the users that don't have one.
+    """
+    tokens = dict(Token.objects.filter(user__username__in=usernames).values_list("user__username", "key"))
+    for user in User.objects.filter(username__in=usernames).exclude(username__in=tokens):
+        tokens[user.username] = Token.objects.create(user=user).key
+    return tokens
+
+
+def replay(
+    target: str,
+    trace: list[dict],
+    speedup: float = 1,
+    workers: int = 32,
+    timeout: float = 30,
+) -> dict:
+    """
+    Makes the calls of the trace against target, at their original offsets divided by speedup.
+    Calls of users that don't exist on this instance are skipped.
+
+    Calls are made by a pool of workers. If all of them are busy calls start late, which the report counts as lag.
+    """
+    if speedup <= 0:
+        raise ReplayError("The speed-up factor has to be positive")
+
+    target = target.rstrip("/")
+    tokens = user_tokens({call["user"] for call in trace})
+    recorder = Recorder()
+    local = threading.local()
+    lags = []
+
+    def call(entry: dict, scheduled: float):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        lag = time.monotonic() - scheduled
+        name = endpoint_name(entry["method"], entry["endpoint"])
+        begin = time.perf_counter()
+        try:
+            response = session.request(
+                entry["method"],
+                target + API_PREFIX + entry["endpoint"].lstrip("/"),
+                headers={"auth-token": tokens[entry["user"]]},
+                json=entry["body"] if entry["method"] in ["POST", "PUT"] else None,
+                timeout=timeout,
+                allow_redirects=False,
+            )
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        recorder.record(name, (time.perf_counter() - begin) * 1000, status)
+        with recorder.lock:
+            lags.append(lag * 1000)
+
+    begin = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for entry in trace:
+            if entry["user"] not in tokens:
+                recorder.event("skipped, user not on this instance")
+                continue
+            scheduled = begin + entry["offset"] / speedup
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(call, entry, scheduled)
+    elapsed = time.monotonic() - begin
+
+    report = recorder.report(elapsed)
+    lags.sort()
+    report.update({
+        "target": target,
+        "calls": len(trace),
+        "trace_duration_s": trace[-1]["offset"] if trace else 0,
+        "speedup": speedup,
+        "lag_ms": {"p95": round(percentile(lags, 95), 2), "max": round(lags[-1], 2)} if lags else None,
+        "measured": timezone.now().isoformat(),
+    })
+    return report
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """
+    The change of every endpoint's latency percentiles and error rate from the baseline report, in ms and percent.
+    Endpoints missing from either report are left out.
+    """
+    comparison = {}
+    for name, stats in report["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        entry = {"requests": [before["requests"], stats["requests"]], "error_rate": [before["error_rate"], stats["error_rate"]]}
+        for p in [f"p{p}" for p in PERCENTILES]:
+            old, new = before["ms"][p], stats["ms"][p]
+            entry[p] = {
+                "baseline_ms": old,
+                "ms": new,
+                "change_ms": round(new - old, 2),
+                "change_pct": round((new - old) / old * 100, 1) if old else None,
+            }
+        comparison[name] = entry
+    return comparison
+
+
+def format_comparison(comparison: dict) -> str:
+    header = f"{'endpoint':<40} {'requests':>9} " + " ".join(f"{f'p{p} ms':>20}" for p in PERCENTILES)
+    lines = [header, "-" * len(header)]
+    for name, entry in comparison.items():
+        cells = []
+        for p in PERCENTILES:
+            change = entry[f"p{p}"]
+            pct = f"{change['change_pct']:+.0f}%" if change["change_pct"] is not None else "n/a"
+            cells.append(f"{change['baseline_ms']:>7}->{change['ms']:<7} {pct:>4}")
+        lines.append(f"{name:<40} {entry['requests'][1]:>9} " + " ".join(f"{cell:>20}" for cell in cells))
+    return "\n".join(lines)
+
+
+def parse_time(value: str):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ReplayError(f"{value} isn't a date and time, e.g. 2025-01-31T12:00:00+00:00")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
@@ -0,0 +1,178 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Keeps the booking, notification and API log tables from growing forever.
+#   - completed bookings are moved into ArchivedBooking
+#   - sent notifications are deleted
+#   - API logs are rolled up into per day APILogSummary rows
+# Rows are handled RETENTION_CHUNK_SIZE at a time, each chunk in its own short transaction, and a run stops
+# starting new chunks after RETENTION_MAX_SECONDS. Whatever is left is picked up by the next run.
+
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from analytics.models import BookingSnapshot
+from api.models import APILog, APILogSummary
+from booking.models import AbstractScheduledNotification, ArchivedBooking, Booking
+from laas_dashboard.settings import (
+    RETENTION_APILOG_DAYS,
+    RETENTION_BOOKING_DAYS,
+    RETENTION_CHUNK_SIZE,
+    RETENTION_MAX_SECONDS,
+    RETENTION_NOTIFICATION_DAYS,
+)
+
+
+def archive_bookings(cutoff: datetime, chunk_size: int, deadline: float) -> int:
+    """
+    Moves completed bookings that ended before cutoff into the archive. Returns the number moved.
+    """
+    moved = 0
+    while time.monotonic() < deadline:
+        with transaction.atomic():
+            ids = list(
+                Booking.objects.select_for_update(skip_locked=True)
+                .filter(complete=True, end__lt=cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+
+            collaborators = defaultdict(list)
+            for booking_id, user_id in Booking.collaborators.through.objects.filter(booking_id__in=ids).values_list("booking_id", "user_id"):
+                collaborators[booking_id].append(user_id)
+
+            ArchivedBooking.objects.bulk_create([
+                ArchivedBooking(
+                    id=row["id"],
+                    owner_id=row["owner_id"],
+                    collaborator_ids=sorted(collaborators[row["id"]]),
+                    start=row["start"],
+                    end=row["end"],
+                    purpose=row["purpose"],
+                    project=row["project"],
+                    lab_name=row["lab__name"] or "",
+                    aggregateId=row["aggregateId"],
+                )
+                for row in Booking.objects.filter(id__in=ids).values(
+                    "id", "owner_id", "start", "end", "purpose", "project", "lab__name", "aggregateId"
+                )
+            ])
+
+            # takes the collaborators, notifications, instances and allocations with it
+            Booking.objects.filter(id__in=ids).delete()
+            # archived bookings never change, so the rollups don't need their last interval
+            BookingSnapshot.objects.filter(booking_id__in=ids).delete()
+
+        moved += len(ids)
+    return moved
+
+
+def purge_notifications(cutoff: datetime, chunk_size: int, deadline: float) -> int:
+    """
+    Deletes scheduled notifications that were sent and were due before cutoff. Returns the number deleted.
+    """
+    deleted = 0
+    for notification_type in AbstractScheduledNotification.__subclasses__():
+        while time.monotonic() < deadline:
+            ids = list(
+                notification_type.objects.filter(sent=True, when__lt=cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            notification_type.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+    return deleted
+
+
+def summarize_apilogs(cutoff: datetime, chunk_size: int, deadline: float) -> tuple[int, int]:
+    """
+    Rolls API logs made before cutoff into daily summaries per user, method and endpoint, then deletes them.
+    Returns the number of logs rolled up and of summaries created.
+    """
+    rolled_up = 0
+    created = 0
+    while time.monotonic() < deadline:
+        with transaction.atomic():
+            ids = list(
+                APILog.objects.select_for_update(skip_locked=True)
+                .filter(call_time__lt=cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+
+            calls = defaultdict(int)
+            for row in (
+                APILog.objects.filter(id__in=ids)
+                .annotate(day=TruncDate("call_time"))
+                .values("day", "user_id", "method", "endpoint")
+                .annotate(calls=Count("id"))
+            ):
+                calls[(row["day"], row["user_id"], row["method"] or "", row["endpoint"] or "")] += row["calls"]
+
+            existing = {
+                (s.day, s.user_id, s.method, s.endpoint): s
+                for s in APILogSummary.objects.select_for_update().filter(
+                    day__in={key[0] for key in calls},
+                    user_id__in={key[1] for key in calls},
+                )
+            }
+            updated = []
+            new = []
+            for key, count in calls.items():
+                if key in existing:
+                    existing[key].calls += count
+                    updated.append(existing[key])
+                else:
+                    day, user_id, method, endpoint = key
+                    new.append(APILogSummary(day=day, user_id=user_id, method=method, endpoint=endpoint, calls=count))
+
+            APILogSummary.objects.bulk_update(updated, ["calls"])
+            APILogSummary.objects.bulk_create(new)
+            APILog.objects.filter(id__in=ids).delete()
+
+        rolled_up += len(ids)
+        created += len(new)
+    return rolled_up, created
+
+
+def apply_retention(now: datetime = None, chunk_size: int = RETENTION_CHUNK_SIZE, max_seconds: float = RETENTION_MAX_SECONDS) -> dict:
+    """
+    Applies every retention rule, skipping those set to 0 days, and reports what was done and how long it took.
+    done is False if the run stopped because it ran out of time.
+    """
+    now = now or timezone.now()
+    begin = time.monotonic()
+    deadline = begin + max_seconds
+    report = {"bookings": 0, "notifications": 0, "apilogs": 0, "apilog_summaries": 0}
+
+    if RETENTION_BOOKING_DAYS:
+        report["bookings"] = archive_bookings(now - timedelta(days=RETENTION_BOOKING_DAYS), chunk_size, deadline)
+    if RETENTION_NOTIFICATION_DAYS:
+        report["notifications"] = purge_notifications(now - timedelta(days=RETENTION_NOTIFICATION_DAYS), chunk_size, deadline)
+    if RETENTION_APILOG_DAYS:
+        report["apilogs"], report["apilog_summaries"] = summarize_apilogs(
+            now - timedelta(days=RETENTION_APILOG_DAYS), chunk_size, deadline
+        )
+
+    report["done"] = time.monotonic() < deadline
+    report["seconds"] = round(time.monotonic() - begin, 3)
+    return report
@@ -0,0 +1,356 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Generates a synthetic dataset with the volume and shape of a long running deployment, for benchmarks, load tests
+# and trying out migrations.
+#   - a few users make most of the bookings, and book with the same small team of collaborators
+#   - bookings grow over the years, mostly start on weekdays in office hours and mostly last a week or less
+#   - every booking has its expiring notifications, sent for the bookings that have ended
+#   - a tenth of the users automate against the API, which is logged in APILog
+#   - the lab goes down for maintenance about once a month
+# Everything is written with bulk inserts, CHUNK_SIZE bookings at a time. The same seed gives the same data,
+# relative to the time it is generated at.
+#
+# Active bookings can also be created in LibLaaS (or the simulator), so the dashboard's view of them matches.
+
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from account.models import Downtime, Lab, UserProfile
+from api.models import APILog, APILogSummary
+from booking.instances import sync_instances
+from booking.models import ArchivedBooking, Booking, ExpiringBookingNotification
+from laas_dashboard.settings import BOOKING_LAB, PROJECT
+from liblaas import views as liblaas_views
+
+USERNAME_PREFIX = "synthetic"
+DOWNTIME_DESCRIPTION = "Synthetic maintenance window"
+
+CHUNK_SIZE = 10000
+BATCH_SIZE = 2000
+
+SCALES = {
+    "small": {"users": 500, "bookings": 5000, "active": 10, "apilogs": 20000, "years": 2},
+    "medium": {"users": 5000, "bookings": 50000, "active": 40, "apilogs": 200000, "years": 4},
+    "large": {"users": 20000, "bookings": 300000, "active": 100, "apilogs": 1000000, "years": 6},
+}
+
+# (value, weight) pairs
+PROJECTS = [("anuket", 40), ("onap", 20), ("nephio", 15), ("lfedge", 10), ("akraino", 10), ("opnfv", 5)]
+PURPOSES = [
+    ("CI verification", 30),
+    ("Feature development", 25),
+    ("Performance testing", 15),
+    ("Interoperability testing", 10),
+    ("Plugfest", 5),
+    ("Demo", 5),
+    ("Training", 5),
+    ("Debugging a failed job", 5),
+]
+LENGTH_DAYS = [(1, 20), (2, 15), (3, 15), (7, 25), (14, 15), (21, 10)]
+COLLABORATOR_COUNTS = [(0, 40), (1, 25), (2, 15), (3, 8), (4, 6), (6, 4), (8, 2)]
+TIMEZONES = [("UTC", 30), ("America/New_York", 20), ("Europe/Paris", 15), ("Asia/Shanghai", 15), ("America/Los_Angeles", 10), ("Europe/Stockholm", 10)]
+API_ENDPOINTS = [
+    ("GET", "users", 50),
+    ("GET", f"labs/{BOOKING_LAB}/status", 20),
+    ("GET", f"labs/{BOOKING_LAB}/users", 15),
+    ("GET", f"labs/{BOOKING_LAB}/profile", 10),
+    ("POST", f"labs/{BOOKING_LAB}/status", 5),
+]
+NOTIFICATION_DAYS = [1, 3, 7]  # as scheduled by ExpiringBookingNotification.schedule_expiring_booking_notifications()
+TEAM_SIZE = 8
+
+
+class GeneratorError(Exception):
+    pass
+
+
+class Weighted:
+    """
+    Draws from (value, weight) pairs, with the weights summed once rather than on every draw.
+    """
+
+    def __init__(self, pairs: list[tuple]):
+        self.values = [pair[:-1] if len(pair) > 2 else pair[0] for pair in pairs]
+        self.cum_weights = list(accumulate(pair[-1] for pair in pairs))
+
+    def __call__(self, rng: random.Random):
+        return rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+
+@contextmanager
+def explicit(model, field_name: str):
+    """
+    Lets a bulk insert set an auto_now field, which Django otherwise overwrites with the current time.
+    """
+    field = model._meta.get_field(field_name)
+    field.auto_now = False
+    try:
+        yield
+    finally:
+        field.auto_now = True
+
+
+def new_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def booking_start(rng: random.Random, now, history: timedelta, latest):
+    """
+    A start time no later than latest, more likely recent than old, on a weekday and in office hours.
+    """
+    # the density of the age falls linearly to 0 at the start of the history, for a deployment that kept growing
+    start = now - history * (1 - rng.random() ** 0.5)
+    if start.weekday() >= 5 and rng.random() < 0.8:
+        # back to the Friday, moving forward could go past now
+        start -= timedelta(days=start.weekday() - 4)
+    hour = min(23, max(0, round(rng.gauss(13, 3))))
+    start = start.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60), microsecond=0)
+    return min(start, latest)
+
+
+def clear():
+    """
+    Deletes everything generated earlier.
+    """
+    users = User.objects.filter(username__startswith=f"{USERNAME_PREFIX}-")
+    Booking.objects.filter(owner__in=users).delete()
+    ArchivedBooking.objects.filter(owner__in=users).delete()
+    APILog.objects.filter(user__in=users).delete()
+    APILogSummary.objects.filter(user__in=users).delete()
+    Downtime.objects.filter(description=DOWNTIME_DESCRIPTION).delete()
+    users.delete()
+
+
+def generate_users(rng: random.Random, count: int, now, history: timedelta) -> list[User]:
+    timezones = Weighted(TIMEZONES)
+    users = User.objects.bulk_create([
+        User(
+            username=f"{USERNAME_PREFIX}-{i:06d}",
+            email=f"{USERNAME_PREFIX}-{i:06d}@email.com",
+            first_name=f"Synthetic{i}",
+            date_joined=now - history * rng.random(),
+        )
+        for i in range(count)
+    ], batch_size=BATCH_SIZE)
+    UserProfile.objects.bulk_create([
+        UserProfile(
+            user=user,
+            ipa_username=user.username,
+            email_addr=user.email,
+            full_name=user.first_name,
+            timezone=timezones(rng),
+            public_user=rng.random() < 0.3,
+            booking_privledge=True,
+        )
+        for user in users
+    ], batch_size=BATCH_SIZE)
+    return users
+
+
+def generate_bookings(rng: random.Random, users: list[User], count: int, active: int, now, history: timedelta, out=print) -> dict:
+    """
+    Creates count bookings, the last active of them still running. Returns how many rows of each kind were written.
+    """
+    projects, purposes, lengths, collaborator_counts = Weighted(PROJECTS), Weighted(PURPOSES), Weighted(LENGTH_DAYS), Weighted(COLLABORATOR_COUNTS)
+
+    # bookings per user follow a power law, users are shuffled so the heavy bookers aren't the first ones
+    owners = users[:]
+    rng.shuffle(owners)
+    owner_weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(owners))))
+    teams = [owners[i:i + TEAM_SIZE] for i in range(0, len(owners), TEAM_SIZE)]
+    team_of = {user.id: teams[i // TEAM_SIZE] for i, user in enumerate(owners)}
+
+    written = {"bookings": 0, "collaborators": 0, "notifications": 0}
+    for chunk_start in range(0, count, CHUNK_SIZE):
+        bookings = []
+        for i in range(chunk_start, min(count, chunk_start + CHUNK_SIZE)):
+            owner = rng.choices(owners, cum_weights=owner_weights)[0]
+            length = timedelta(days=lengths(rng))
+            # some bookings are extended, which uses up their extension days
+            extension = rng.randint(1, 21) if rng.random() < 0.15 else 0
+            if i >= count - active:
+                start = now - timedelta(hours=rng.uniform(1, 72))
+                end = max(start + length + timedelta(days=extension), now + timedelta(hours=rng.uniform(6, 48)))
+            else:
+                ended = now - timedelta(minutes=rng.randint(1, 600))
+                start = booking_start(rng, now, history, latest=ended - timedelta(hours=1))
+                end = min(start + length + timedelta(days=extension), ended)
+            bookings.append(Booking(
+                owner=owner,
+                start=start,
+                end=end,
+                purpose=purposes(rng),
+                project=projects(rng),
+                details="Synthetic booking",
+                lab_id=BOOKING_LAB,
+                ext_days=42 - extension,
+                aggregateId="" if end > now else new_id(rng),
+                complete=end <= now,
+            ))
+
+        with transaction.atomic():
+            Booking.objects.bulk_create(bookings, batch_size=BATCH_SIZE)
+
+            collaborators = []
+            notifications = []
+            for booking in bookings:
+                team = [user for user in team_of[booking.owner_id] if user.id != booking.owner_id]
+                chosen = set()
+                for _ in range(collaborator_counts(rng)):
+                    # most collaborators are from the owner's team
+                    candidate = rng.choice(team) if team and rng.random() < 0.8 else rng.choice(users)
+                    if candidate.id != booking.owner_id:
+                        chosen.add(candidate.id)
+                collaborators.extend(Booking.collaborators.through(booking_id=booking.id, user_id=user_id) for user_id in sorted(chosen))
+
+                for days in NOTIFICATION_DAYS:
+                    when = booking.end - timedelta(days=days)
+                    if when > booking.start:
+                        notifications.append(ExpiringBookingNotification(for_booking=booking, when=when, sent=when <= now))
+
+            Booking.collaborators.through.objects.bulk_create(collaborators, batch_size=BATCH_SIZE)
+            ExpiringBookingNotification.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
+
+        written["bookings"] += len(bookings)
+        written["collaborators"] += len(collaborators)
+        written["notifications"] += len(notifications)
+        out(f"{written['bookings']}/{count} bookings")
+    return written
+
+
+def generate_apilogs(rng: random.Random, users: list[User], count: int, now, history: timedelta) -> int:
+    """
+    Logs count API calls by a tenth of the users, each with its own steady rate.
+    """
+    automation = users[:max(1, len(users) // 10)]
+    Token.objects.bulk_create([Token(user=user, key=f"{rng.getrandbits(160):040x}") for user in automation], batch_size=BATCH_SIZE)
+    weights = list(accumulate(rng.paretovariate(1.5) for _ in automation))
+    endpoints = Weighted(API_ENDPOINTS)
+    addresses = {user.id: f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}" for user in automation}
+
+    written = 0
+    with explicit(APILog, "call_time"):
+        while written < count:
+            logs = []
+            for _ in range(min(CHUNK_SIZE, count - written)):
+                user = rng.choices(automation, cum_weights=weights)[0]
+                method, endpoint = endpoints(rng)
+                logs.append(APILog(
+                    user=user,
+                    call_time=now - history * rng.random(),
+                    method=method,
+                    endpoint=endpoint,
+                    ip_addr=addresses[user.id],
+                    # auth_and_log() wraps the body in a list
+                    body=[{"status": rng.choice(["up", "down"])}] if method == "POST" else None,
+                ))
+            APILog.objects.bulk_create(logs, batch_size=BATCH_SIZE)
+            written += len(logs)
+    return written
+
+
+def generate_downtimes(rng: random.Random, lab: Lab, now, history: timedelta) -> int:
+    downtimes = []
+    start = now - history
+    while True:
+        start += timedelta(days=rng.uniform(20, 40))
+        if start > now + timedelta(days=30):
+            break
+        downtimes.append(Downtime(
+            lab=lab,
+            start=start,
+            end=start + timedelta(hours=rng.choice([2, 4, 8, 24, 48])),
+            description=DOWNTIME_DESCRIPTION,
+        ))
+    Downtime.objects.bulk_create(downtimes, batch_size=BATCH_SIZE)
+    return len(downtimes)
+
+
+def provision(rng: random.Random, bookings: list[Booking]) -> int:
+    """
+    Creates an aggregate in LibLaaS for each of the active bookings, from a random public template, and records the
+    instances and host allocations LibLaaS reports for it.
+    """
+    for number, booking in enumerate(bookings):
+        owner = booking.owner.username
+        templates = [template for template in liblaas_views.template_list_templates(owner, PROJECT) or [] if template.get("public")]
+        if not templates:
+            raise GeneratorError(f"LibLaaS at {liblaas_views.base} has no public templates")
+        aggregate_id = liblaas_views.booking_create_booking({
+            "template_id": rng.choice(templates)["id"],
+            "allowed_users": [owner] + [user.username for user in booking.collaborators.all()],
+            "global_cifile": "",
+            "metadata": {
+                "booking_id": str(booking.id),
+                "owner": owner,
+                "lab": PROJECT,
+                "purpose": booking.purpose,
+                "project": booking.project,
+                "details": booking.details,
+                "length": max(1, (booking.end - booking.start).days),
+            },
+            "origin": PROJECT,
+        })
+        if not aggregate_id:
+            raise GeneratorError(
+                f"LibLaaS at {liblaas_views.base} didn't create a booking after {number}, it may be out of hosts. "
+                "Give the simulator more hosts with --config, or generate fewer active bookings."
+            )
+        booking.aggregateId = aggregate_id
+        booking.save(update_fields=["aggregateId"])
+        sync_instances(booking)
+    return len(bookings)
+
+
+def generate(sizes: dict, seed: int = 0, populate_liblaas: bool = False, now=None, out=print) -> dict:
+    """
+    Generates a dataset of the given sizes, see SCALES. Returns how many rows of each kind were written.
+    Fails if a dataset was generated before, clear() it first.
+    """
+    if User.objects.filter(username__startswith=f"{USERNAME_PREFIX}-").exists():
+        raise GeneratorError("There is synthetic data already, clear it first")
+    if sizes["active"] > sizes["bookings"]:
+        raise GeneratorError("There can't be more active bookings than bookings")
+
+    rng = random.Random(seed)
+    now = now or timezone.now()
+    history = timedelta(days=365 * sizes["years"])
+
+    lab = Lab.objects.filter(name=BOOKING_LAB).first()
+    if lab is None:
+        lab = Lab.objects.create(
+            name=BOOKING_LAB,
+            lab_user=User.objects.create(username=f"{USERNAME_PREFIX}_lab"),
+            contact_email="lab@email.com",
+            project=PROJECT or "anuket",
+        )
+
+    users = generate_users(rng, sizes["users"], now, history)
+    out(f"{len(users)} users")
+    written = {"users": len(users)}
+    written.update(generate_bookings(rng, users, sizes["bookings"], sizes["active"], now, history, out))
+    written["apilogs"] = generate_apilogs(rng, users, sizes["apilogs"], now, history)
+    out(f"{written['apilogs']} API logs")
+    written["downtimes"] = generate_downtimes(rng, lab, now, history)
+
+    if populate_liblaas:
+        active = Booking.objects.filter(owner__in=users, complete=False).select_related("owner").order_by("id")
+        written["liblaas_aggregates"] = provision(rng, list(active))
+        out(f"{written['liblaas_aggregates']} bookings created in LibLaaS")
+    return written
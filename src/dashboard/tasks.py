@@ -8,11 +8,16 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
 
+import logging
 
 from booking.models import Booking, AbstractScheduledNotification
 from celery import shared_task
 from django.utils import timezone
 from booking.lib import attempt_end_booking
+from booking.instances import sync_pending
+from dashboard.retention import apply_retention as run_retention
+
+logger = logging.getLogger(__name__)
 
 @shared_task
 def end_expired_bookings():
@@ -24,4 +29,20 @@ def end_expired_bookings():
 def send_notifications():
     for notification_types in AbstractScheduledNotification.get_all_unsent_and_ready_notifications():
         for notification in notification_types:
-            notification.send()
\ No newline at end of file
+            notification.send()
+
+@shared_task
+def sync_booking_instances():
+    synced = sync_pending()
+    if synced:
+        logger.info(f"Synced the instances of {synced} bookings", extra={"fields": {"bookings": synced}})
+
+@shared_task
+def apply_retention():
+    report = run_retention()
+    logger.info(
+        f"Retention moved {report['bookings']} bookings to the archive, deleted {report['notifications']} notifications "
+        f"and rolled {report['apilogs']} API logs into {report['apilog_summaries']} new summaries in {report['seconds']}s",
+        extra={"fields": report},
+    )
+    return report
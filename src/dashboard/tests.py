@@ -0,0 +1,734 @@
+##############################################################################
+# Copyright (c) 2016 Max Breitenfeldt and others.
+# Copyright (c) 2018 Parker Berberian, Sawyer Bergeron, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
+import requests
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.core.cache import caches
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from prometheus_client.parser import text_string_to_metric_families
+
+from account.models import Downtime, Lab
+from analytics.utilization import utilization
+from api.models import APILog, APILogSummary
+from booking.lib import resolve_hostname
+from booking.models import ArchivedBooking, Booking, ExpiringBookingNotification
+from dashboard import loadtest, replay, synthetic
+from dashboard.benchmarks import SCALES, SCENARIOS, LibLaaSStub, check_budgets, load_budgets, run
+from dashboard.models import Profile
+from dashboard.retention import apply_retention, archive_bookings, summarize_apilogs
+from dashboard.tasks import end_expired_bookings, send_notifications, sync_booking_instances
+from laas_dashboard import celery as celery_signals, tracing
+from laas_dashboard.profiling import profiling, store
+from laas_dashboard.cache import FileBasedCache, LocMemCache, _counts, cache_stats, reset_stats
+from laas_dashboard.logs import AsyncHandler, JsonFormatter, TextFormatter
+from laas_dashboard.metrics import MultiDirectoryCollector
+from laas_dashboard.settings import CACHE_BACKENDS, CACHE_NAMES, CACHES, RETENTION_BOOKING_DAYS
+from laas_dashboard.timing import timing
+from liblaas import views as liblaas_views
+
+NOW = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+OLD = NOW - timedelta(days=RETENTION_BOOKING_DAYS + 10)
+
+
+class RetentionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@email.com", "testpassword")
+        cls.collab = User.objects.create_user("collab", "collab@email.com", "testpassword")
+        cls.lab = Lab.objects.create(name="UNH_IOL", lab_user=cls.owner)
+
+    def book(self, end, complete=True):
+        booking = Booking.objects.create(
+            owner=self.owner,
+            start=end - timedelta(days=2),
+            end=end,
+            purpose="test",
+            project="anuket",
+            details="x" * 1000,
+            lab=self.lab,
+            complete=complete,
+        )
+        booking.collaborators.add(self.collab)
+        return booking
+
+    def log(self, when, endpoint="/api/booking"):
+        log = APILog.objects.create(user=self.owner, method="GET", endpoint=endpoint)
+        # call_time is auto_now
+        APILog.objects.filter(id=log.id).update(call_time=when)
+
+    def test_archive_bookings(self):
+        old = self.book(OLD)
+        active = self.book(OLD, complete=False)
+        recent = self.book(NOW - timedelta(days=1))
+
+        report = apply_retention(now=NOW, chunk_size=1)
+
+        self.assertEqual(report["bookings"], 1)
+        self.assertTrue(report["done"])
+        self.assertEqual(set(Booking.objects.values_list("id", flat=True)), {active.id, recent.id})
+        archived = ArchivedBooking.objects.get(id=old.id)
+        self.assertEqual(archived.collaborator_ids, [self.collab.id])
+        self.assertEqual(archived.lab_name, "UNH_IOL")
+        self.assertEqual(archived.end, OLD)
+        self.assertFalse(ExpiringBookingNotification.objects.filter(for_booking_id=old.id).exists())
+
+    def test_archived_bookings_still_counted(self):
+        self.book(OLD)
+        before = utilization(OLD - timedelta(days=3), OLD, 86400, filters={"lab": "UNH_IOL"})
+
+        apply_retention(now=NOW)
+        caches["snapshots"].clear()
+        after = utilization(OLD - timedelta(days=3), OLD, 86400, filters={"lab": "UNH_IOL"})
+
+        self.assertEqual(before["bookings"], 1)
+        self.assertEqual(after["bookings"], 1)
+
+    def test_purge_notifications(self):
+        booking = self.book(NOW + timedelta(days=10), complete=False)
+        ExpiringBookingNotification.objects.create(for_booking=booking, when=NOW - timedelta(days=60), sent=True)
+        ExpiringBookingNotification.objects.create(for_booking=booking, when=NOW - timedelta(days=60), sent=False)
+        ExpiringBookingNotification.objects.create(for_booking=booking, when=NOW - timedelta(days=1), sent=True)
+        total = ExpiringBookingNotification.objects.count()
+
+        report = apply_retention(now=NOW)
+
+        self.assertEqual(report["notifications"], 1)
+        self.assertEqual(ExpiringBookingNotification.objects.count(), total - 1)
+
+    def test_summarize_apilogs(self):
+        day = NOW - timedelta(days=200)
+        self.log(day)
+        self.log(day + timedelta(hours=1))
+        self.log(day, endpoint="/api/users")
+        self.log(NOW)
+
+        rolled_up, created = summarize_apilogs(NOW - timedelta(days=90), 2, float("inf"))
+
+        self.assertEqual((rolled_up, created), (3, 2))
+        self.assertEqual(APILog.objects.count(), 1)
+        summary = APILogSummary.objects.get(endpoint="/api/booking")
+        self.assertEqual((summary.day, summary.calls), (day.date(), 2))
+
+        # a later run adds to the existing summary
+        self.log(day)
+        summarize_apilogs(NOW - timedelta(days=90), 2, float("inf"))
+        summary.refresh_from_db()
+        self.assertEqual(summary.calls, 3)
+
+    def test_deadline(self):
+        self.book(OLD)
+
+        self.assertEqual(archive_bookings(NOW, 10, 0), 0)
+        self.assertFalse(apply_retention(now=NOW, max_seconds=0)["done"])
+
+
+# the counts are checked against locmem caches, whatever CACHE_BACKEND the environment running the tests sets
+@override_settings(CACHES={
+    name: {**config, "BACKEND": CACHE_BACKENDS["locmem"], "LOCATION": f"test-{name}", "OPTIONS": {}}
+    for name, config in CACHES.items()
+})
+class CacheTests(TestCase):
+
+    def setUp(self):
+        reset_stats()
+
+    def test_named_caches(self):
+        self.assertEqual(set(caches), set(CACHE_NAMES))
+        caches["liblaas"].set("key", "liblaas")
+        self.assertIsNone(caches["snapshots"].get("key"))
+
+    def test_counts(self):
+        cache = caches["liblaas"]
+        cache.clear()
+        cache.set("a", 1)
+        cache.set_many({"b": 2, "c": None})
+        cache.get("a")
+        cache.get("missing")
+        # a stored None is a hit
+        self.assertEqual(cache.get_many(["b", "c", "d"]), {"b": 2, "c": None})
+        cache.delete("a")
+
+        stats = cache_stats()["liblaas"]
+        self.assertEqual(stats["hits"], 3)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["sets"], 3)
+        self.assertEqual(stats["deletes"], 1)
+        self.assertEqual(stats["hit_rate"], 0.6)
+        self.assertEqual(stats["backend"], "LocMemCache")
+        self.assertIsNone(stats["server_evictions"])
+
+    def test_locmem_evictions(self):
+        cache = LocMemCache("test-evictions", {"ALIAS": "evictions", "OPTIONS": {"MAX_ENTRIES": 4, "CULL_FREQUENCY": 2}})
+        for i in range(6):
+            cache.set(i, i)
+
+        # full at the 5th set, which culls half of the entries
+        self.assertEqual(_counts["evictions"]["evictions"], 2)
+        self.assertEqual(_counts["evictions"]["sets"], 6)
+
+    def test_file_evictions(self):
+        with tempfile.TemporaryDirectory() as location:
+            cache = FileBasedCache(location, {"ALIAS": "files", "OPTIONS": {"MAX_ENTRIES": 4, "CULL_FREQUENCY": 2}})
+            for i in range(6):
+                cache.set(i, i)
+            self.assertEqual(cache.get(5), 5)
+
+        self.assertEqual(_counts["files"]["evictions"], 2)
+
+    def test_stats_view(self):
+        url = reverse("dashboard:cache_stats")
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        user = User.objects.create_user("user", "user@email.com", "testpassword")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        user.is_superuser = True
+        user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()["caches"]), set(CACHE_NAMES))
+
+
+class BenchmarkBudgetTests(TestCase):
+
+    def test_every_scenario_has_a_budget(self):
+        budgets = load_budgets()
+        for scale in SCALES:
+            self.assertEqual(set(budgets[scale]), set(SCENARIOS), scale)
+
+    def test_small_scale_within_budgets(self):
+        # latency depends on the machine, so only the query and LibLaaS call counts are checked here
+        report = run("small", repeat=1)
+        self.assertEqual(check_budgets(report, load_budgets(), latency=False), [])
+
+
+class LoadTestTests(LiveServerTestCase):
+
+    def setUp(self):
+        self.stub = LibLaaSStub(hosts_per_flavor=4).start()
+        self.addCleanup(self.stub.stop)
+        Lab.objects.create(name="UNH_IOL", lab_user=User.objects.create(username="lab"))
+
+    def test_percentile(self):
+        ordered = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(ordered, 50), 50)
+        self.assertEqual(loadtest.percentile(ordered, 99), 99)
+        self.assertEqual(loadtest.percentile([7], 95), 7)
+
+    def test_run(self):
+        data = loadtest.prepare(watchers=1, ci_clients=1)
+        report = loadtest.run(
+            self.live_server_url, data, duration=3, visitors=1,
+            poll_interval=0.5, ci_interval=1, visit_interval=0.5, provision_polls=2,
+        )
+
+        self.assertEqual(set(report["endpoints"]), {
+            "GET /",
+            "GET /booking/detail/<id>/",
+            "POST /booking/detail/<id>/ (status)",
+            "GET /liblaas/ipmi/booking/<id>/",
+            "POST /booking_api/booking/",
+            "GET /booking_api/booking/?active=True",
+            "GET /booking_api/booking/<id>/",
+            "DELETE /booking_api/booking/<id>/",
+        })
+        self.assertEqual(report["total"]["errors"], 0, report["endpoints"])
+        # no outbox relay runs here, so the CI clients' bookings are never provisioned
+        self.assertGreater(report["events"]["bookings not provisioned in time"], 0)
+        self.assertGreater(report["liblaas_requests"]["booking_booking_status"]["requests"], 0)
+
+        loadtest.clean_up()
+        self.assertFalse(Booking.objects.filter(owner__username__startswith="loadtest-", complete=False).exists())
+
+
+class ReplayTests(LiveServerTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("automation", "automation@email.com", "testpassword")
+        for seconds, endpoint in [(0, "users"), (2, "users"), (3, "labs/UNH_IOL/users/1")]:
+            log = APILog.objects.create(user=self.user, method="GET", endpoint=endpoint)
+            APILog.objects.filter(id=log.id).update(call_time=NOW + timedelta(seconds=seconds))
+        log = APILog.objects.create(user=self.user, method="POST", endpoint="users", body=[{"key": "value"}])
+        APILog.objects.filter(id=log.id).update(call_time=NOW - timedelta(seconds=1))
+
+    def test_load_trace(self):
+        trace = replay.load_trace(NOW, NOW + timedelta(minutes=1))
+        self.assertEqual([call["offset"] for call in trace], [0, 2, 3])
+        self.assertEqual(replay.endpoint_name("GET", trace[2]["endpoint"]), "GET /api/labs/UNH_IOL/users/<id>")
+        self.assertEqual(replay.load_trace(NOW - timedelta(seconds=1), NOW)[0]["body"], {"key": "value"})
+        self.assertEqual(replay.load_trace(NOW, NOW + timedelta(minutes=1), users=["someone"]), [])
+
+    def test_replay(self):
+        trace = replay.load_trace(NOW, NOW + timedelta(minutes=1))
+        trace.append({**trace[0], "user": "someone"})
+        begin = time.monotonic()
+        report = replay.replay(self.live_server_url, trace, speedup=10)
+
+        # the 3s of calls took 0.3s
+        self.assertLess(time.monotonic() - begin, 2)
+        self.assertEqual(report["endpoints"]["GET /api/users"]["requests"], 2)
+        self.assertEqual(report["endpoints"]["GET /api/users"]["errors"], 0)
+        self.assertEqual(report["events"], {"skipped, user not on this instance": 1})
+
+        comparison = replay.compare(report, report)
+        self.assertEqual(comparison["GET /api/users"]["p95"]["change_ms"], 0)
+
+
+class SyntheticDataTests(TestCase):
+    SIZES = {"users": 40, "bookings": 300, "active": 3, "apilogs": 200, "years": 1}
+
+    def setUp(self):
+        self.stub = LibLaaSStub(hosts_per_flavor=4).start()
+        self.addCleanup(self.stub.stop)
+
+    def bookings(self):
+        return Booking.objects.filter(owner__username__startswith="synthetic-")
+
+    def test_generate(self):
+        written = synthetic.generate(self.SIZES, seed=1, populate_liblaas=True, now=NOW, out=lambda line: None)
+
+        self.assertEqual(self.bookings().count(), 300)
+        self.assertEqual(written["liblaas_aggregates"], 3)
+        self.assertEqual(self.stub.simulator.get_stats()["bookings"], 3)
+        for booking in self.bookings().filter(complete=False):
+            self.assertGreater(booking.end, NOW)
+            self.assertEqual(booking.instances.count(), 1)
+        self.assertFalse(self.bookings().filter(complete=True, end__gt=NOW).exists())
+        self.assertFalse(self.bookings().filter(end__lte=F("start")).exists())
+        self.assertEqual(APILog.objects.filter(call_time__lt=NOW - timedelta(days=1)).count(), 200)
+        self.assertEqual(ExpiringBookingNotification.objects.count(), written["notifications"])
+        self.assertFalse(ExpiringBookingNotification.objects.filter(sent=False, when__lt=NOW).exists())
+        self.assertTrue(Downtime.objects.filter(description=synthetic.DOWNTIME_DESCRIPTION).exists())
+
+        with self.assertRaises(synthetic.GeneratorError):
+            synthetic.generate(self.SIZES, out=lambda line: None)
+        synthetic.clear()
+        self.assertFalse(self.bookings().exists())
+        self.assertFalse(User.objects.filter(username__startswith="synthetic-").exists())
+
+    def test_recent_bookings_end_after_they_start(self):
+        # over a short history, many starts fall on the day of now, or on a weekend just before it
+        rng = random.Random(3)
+        history = timedelta(days=4)
+        users = synthetic.generate_users(rng, 5, NOW, history)
+        Lab.objects.create(name=synthetic.BOOKING_LAB, lab_user=users[0])
+        synthetic.generate_bookings(rng, users, 500, 0, NOW, history, out=lambda line: None)
+
+        self.assertEqual(self.bookings().count(), 500)
+        self.assertFalse(self.bookings().filter(end__lte=F("start")).exists())
+        self.assertFalse(self.bookings().filter(start__gt=NOW).exists())
+
+    def test_deterministic(self):
+        def snapshot():
+            return list(self.bookings().order_by("id").values_list("owner__username", "start", "end", "purpose", "aggregateId"))
+
+        sizes = {**self.SIZES, "active": 0}
+        synthetic.generate(sizes, seed=7, now=NOW, out=lambda line: None)
+        first = snapshot()
+        synthetic.clear()
+        synthetic.generate(sizes, seed=7, now=NOW, out=lambda line: None)
+        self.assertEqual(snapshot(), first)
+
+
+class TimingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("timed", "timed@email.com", "testpassword")
+        self.client.force_login(self.user)
+
+    @patch("laas_dashboard.timing.SERVER_TIMING_SAMPLE_RATE", 1)
+    def test_server_timing_header(self):
+        response = self.client.get("/")
+        metrics = {metric.split(";")[0]: metric for metric in response["Server-Timing"].split(", ")}
+        self.assertIn("db", metrics)
+        self.assertIn("template", metrics)
+        self.assertIn("total", metrics)
+        # the landing page looks the user up in LibLaaS
+        self.assertEqual(metrics["liblaas"].split(";")[2], 'desc="1 call"')
+
+    @patch("laas_dashboard.timing.SERVER_TIMING_SAMPLE_RATE", 0)
+    def test_unsampled(self):
+        self.assertNotIn("Server-Timing", self.client.get("/"))
+
+    def test_liblaas_and_dns(self):
+        stub = LibLaaSStub(hosts_per_flavor=1).start()
+        self.addCleanup(stub.stop)
+
+        with timing() as timings, patch("booking.lib.os.popen") as popen:
+            popen.return_value.read.return_value = "host.example.com not found"
+            liblaas_views.flavor_list_flavors("anuket")
+            liblaas_views.flavor_list_hosts("anuket")
+            resolve_hostname("host.example.com")
+            User.objects.count()
+
+        self.assertEqual(timings.calls["liblaas"], 2)
+        self.assertGreater(timings.ms["liblaas"], 0)
+        self.assertEqual(timings.calls["dns"], 1)
+        self.assertEqual(timings.calls["db"], 1)
+
+    @patch("laas_dashboard.timing.SERVER_TIMING_SAMPLE_RATE", 1)
+    @patch("laas_dashboard.timing.SLOW_REQUEST_MS", 0.001)
+    def test_slow_request_logged(self):
+        with self.assertLogs("laas_dashboard.timing", "WARNING") as logs:
+            self.client.get("/")
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["path"], "/")
+        self.assertEqual(record["user"], self.user.id)
+        self.assertGreater(record["breakdown"]["db"]["calls"], 0)
+
+
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("metrics", "metrics@email.com", "testpassword")
+        cls.lab = Lab.objects.create(name="UNH_IOL", lab_user=cls.owner)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def scrape(self, **headers) -> dict:
+        with patch("laas_dashboard.metrics.celery_queue_length", return_value=3):
+            response = self.client.get(reverse("dashboard:metrics"), **headers)
+        self.assertEqual(response.status_code, 200)
+        return {
+            (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+            for family in text_string_to_metric_families(response.content.decode())
+            for sample in family.samples
+        }
+
+    def test_requests(self):
+        labels = {"view": "dashboard:cache_stats", "method": "GET", "status": "401"}
+        before = self.sample("laas_http_requests_total", **labels)
+        self.client.get(reverse("dashboard:cache_stats"))
+        self.assertEqual(self.sample("laas_http_requests_total", **labels), before + 1)
+
+        samples = self.scrape()
+        self.assertEqual(samples[("laas_http_requests_total", tuple(sorted(labels.items())))], before + 1)
+        self.assertEqual(samples[("laas_celery_queue_messages", ())], 3)
+
+    def test_backlogs(self):
+        now = timezone.now()
+        booking = Booking.objects.create(
+            owner=self.owner, start=now - timedelta(days=2), end=now - timedelta(hours=1), purpose="test",
+            project="anuket", lab=self.lab, complete=False,
+        )
+        ExpiringBookingNotification.objects.create(for_booking=booking, when=now - timedelta(minutes=10))
+
+        samples = self.scrape()
+        self.assertEqual(samples[("laas_expired_bookings", ())], 1)
+        overdue = (("type", "ExpiringBookingNotification"),)
+        self.assertEqual(samples[("laas_overdue_notifications", overdue)], 1)
+        self.assertGreaterEqual(samples[("laas_oldest_overdue_notification_seconds", overdue)], 600)
+
+    def test_notification_lag(self):
+        now = timezone.now()
+        booking = Booking.objects.create(
+            owner=self.owner, start=now, end=now + timedelta(days=1), purpose="test", project="anuket", lab=self.lab,
+        )
+        notification = ExpiringBookingNotification.objects.create(for_booking=booking, when=now - timedelta(minutes=5))
+        labels = {"type": "ExpiringBookingNotification"}
+        count = self.sample("laas_notification_lag_seconds_count", **labels)
+        total = self.sample("laas_notification_lag_seconds_sum", **labels)
+
+        self.assertTrue(notification.send())
+        self.assertEqual(self.sample("laas_notification_lag_seconds_count", **labels), count + 1)
+        self.assertGreaterEqual(self.sample("laas_notification_lag_seconds_sum", **labels) - total, 300)
+
+    def test_liblaas_outcomes(self):
+        stub = LibLaaSStub(hosts_per_flavor=1).start()
+        self.addCleanup(stub.stop)
+        outcomes = {
+            ("flavor_list_flavors", "ok"): lambda: liblaas_views.flavor_list_flavors("anuket"),
+            ("booking_booking_status", "http_error"): lambda: liblaas_views.booking_booking_status("missing"),
+        }
+        for (endpoint, outcome), call in outcomes.items():
+            before = self.sample("laas_liblaas_requests_total", endpoint=endpoint, outcome=outcome)
+            call()
+            self.assertEqual(self.sample("laas_liblaas_requests_total", endpoint=endpoint, outcome=outcome), before + 1)
+
+        before = self.sample("laas_liblaas_requests_total", endpoint="flavor_list_flavors", outcome="connection_error")
+        with patch.object(liblaas_views, "base", "http://127.0.0.1:9/"):
+            liblaas_views.flavor_list_flavors("anuket")
+        self.assertEqual(
+            self.sample("laas_liblaas_requests_total", endpoint="flavor_list_flavors", outcome="connection_error"), before + 1
+        )
+
+    def test_cache_operations(self):
+        before = self.sample("laas_cache_operations_total", cache="liblaas", operation="misses")
+        caches["liblaas"].get("metrics-missing")
+        self.assertEqual(self.sample("laas_cache_operations_total", cache="liblaas", operation="misses"), before + 1)
+
+    @patch("dashboard.views.METRICS_TOKEN", "secret")
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse("dashboard:metrics")).status_code, 401)
+        self.scrape(HTTP_AUTHORIZATION="Bearer secret")
+
+    def test_multiple_directories(self):
+        key = mmap_key("laas_tasks", "laas_tasks_total", ["queue"], ["celery"], "Tasks")
+        with tempfile.TemporaryDirectory() as web, tempfile.TemporaryDirectory() as worker:
+            # the same pid in two containers
+            for directory, value in [(web, 2), (worker, 3)]:
+                files = MmapedDict(os.path.join(directory, "counter_7.db"))
+                files.write_value(key, value, 0)
+                files.close()
+
+            families = list(MultiDirectoryCollector([web, worker]).collect())
+
+        samples = {sample.name: sample.value for family in families for sample in family.samples}
+        self.assertEqual(samples["laas_tasks_total"], 5)
+
+
+class TracingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("traced", "traced@email.com", "testpassword")
+        self.client.force_login(self.user)
+        self.spans_file = tempfile.NamedTemporaryFile(suffix=".jsonl")
+        self.addCleanup(self.spans_file.close)
+        for setting, value in [("TRACING_EXPORTER", "file"), ("TRACING_FILE", self.spans_file.name), ("TRACING_SAMPLE_RATE", 1)]:
+            patcher = patch(f"laas_dashboard.tracing.{setting}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch("laas_dashboard.tracing._exporter", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def spans(self) -> list[dict]:
+        with open(self.spans_file.name) as f:
+            return [json.loads(line) for line in f]
+
+    def test_request(self):
+        stub = LibLaaSStub(hosts_per_flavor=1).start()
+        self.addCleanup(stub.stop)
+
+        with patch("liblaas.views.requests.request", wraps=requests.request) as request:
+            self.client.get("/")
+
+        spans = self.spans()
+        root = spans[-1]
+        self.assertEqual(root["name"], "GET dashboard:index")
+        self.assertEqual(root["kind"], "server")
+        self.assertIsNone(root["parent_id"])
+        self.assertEqual(root["attributes"]["http.status_code"], 200)
+        self.assertEqual({s["trace_id"] for s in spans}, {root["trace_id"]})
+        self.assertTrue(any(s["name"] == "db SELECT" for s in spans))
+
+        # the landing page looks the user up in LibLaaS, which gets the trace
+        liblaas = next(s for s in spans if s["name"] == "liblaas user_get_user")
+        self.assertEqual(liblaas["parent_id"], root["span_id"])
+        self.assertEqual(request.call_args.kwargs["headers"]["traceparent"], f"00-{root['trace_id']}-{liblaas['span_id']}-01")
+
+    @patch("laas_dashboard.tracing.TRACING_SAMPLE_RATE", 0)
+    def test_incoming_traceparent(self):
+        self.client.get(reverse("dashboard:cache_stats"))
+        self.assertEqual(self.spans(), [])
+
+        trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+        self.client.get(reverse("dashboard:cache_stats"), HTTP_TRACEPARENT=f"00-{trace_id}-{parent_id}-01")
+        root = self.spans()[-1]
+        self.assertEqual(root["trace_id"], trace_id)
+        self.assertEqual(root["parent_id"], parent_id)
+
+    def test_parse_traceparent(self):
+        self.assertEqual(
+            tracing.parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00"),
+            ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", False),
+        )
+        for header in [None, "", "00-xyz-00f067aa0ba902b7-01", "00-00000000000000000000000000000000-00f067aa0ba902b7-01"]:
+            self.assertIsNone(tracing.parse_traceparent(header))
+
+    def test_task_continues_trace(self):
+        headers = {}
+        with tracing.start_trace("queueing", "server") as root:
+            celery_signals.task_queued(headers=headers)
+        self.assertEqual(headers["traceparent"], root.traceparent)
+
+        send_notifications.push_request(traceparent=headers["traceparent"])
+        self.addCleanup(send_notifications.pop_request)
+        celery_signals.task_started(task_id="task", task=send_notifications)
+        User.objects.count()
+        celery_signals.task_finished(task_id="task", task=send_notifications, state="SUCCESS")
+
+        spans = self.spans()
+        task = next(s for s in spans if s["name"] == "task dashboard.tasks.send_notifications")
+        self.assertEqual(task["trace_id"], root.trace.trace_id)
+        self.assertEqual(task["parent_id"], root.span_id)
+        self.assertEqual(task["attributes"]["celery.state"], "SUCCESS")
+        self.assertTrue(any(s["parent_id"] == task["span_id"] and s["name"] == "db SELECT" for s in spans))
+
+    def test_stages(self):
+        lab = Lab.objects.create(name="UNH_IOL", lab_user=self.user)
+        now = timezone.now()
+        with tracing.start_trace("stages", "internal") as root:
+            booking = Booking.objects.create(
+                owner=self.user, start=now, end=now + timedelta(days=2), purpose="test", project="anuket", lab=lab,
+            )
+            booking.end = now + timedelta(days=3)
+            booking.save()
+
+        names = [s["name"] for s in self.spans() if s["parent_id"] == root.span_id]
+        self.assertIn("booking.post_save", names)
+        self.assertIn("booking.pre_save", names)
+
+    def test_collector_payload(self):
+        with tracing.start_trace("failing", "server") as root:
+            with self.assertRaises(ValueError), tracing.span("stage", attributes={"booking.id": 1, "ratio": 0.5}):
+                raise ValueError("broken")
+
+        stage = next(s for s in root.trace.spans if s.name == "stage")
+        payload = tracing.otlp(root.trace.spans)
+        spans = {s["name"]: s for s in payload["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+        self.assertEqual(spans["stage"]["parentSpanId"], root.span_id)
+        self.assertEqual(spans["stage"]["status"], {"code": 2, "message": "ValueError: broken"})
+        self.assertIn({"key": "booking.id", "value": {"intValue": "1"}}, spans["stage"]["attributes"])
+        self.assertEqual(spans["failing"]["kind"], 2)
+        self.assertEqual(int(spans["stage"]["endTimeUnixNano"]), stage.end_ns)
+
+        exporter = tracing.CollectorExporter("http://collector/v1/traces")
+        exporter.interval = 0
+        with patch("laas_dashboard.tracing.requests.post") as post:
+            exporter.export(root.trace.spans)
+            exporter.flush()
+        sent = [s for call in post.call_args_list for s in call.kwargs["json"]["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+        self.assertEqual(len(sent), 2)
+
+
+def spin(ms):
+    end = time.perf_counter() + ms / 1000
+    while time.perf_counter() < end:
+        pass
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("profiled", "profiled@email.com", "testpassword", is_superuser=True, is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_sampling(self):
+        with profiling(interval_ms=1) as recording:
+            spin(100)
+
+        self.assertGreater(recording.samples, 10)
+        self.assertGreaterEqual(recording.duration_ms, 100)
+        stack, count = recording.stacks.most_common(1)[0]
+        self.assertTrue(stack.endswith("dashboard.tests.ProfilingTests.test_sampling;dashboard.tests.spin"))
+        self.assertIn(f"{stack} {count}\n", recording.collapsed())
+
+    def test_request(self):
+        url = reverse("dashboard:cache_stats")
+        response = self.client.get(url, {"profile": "return"})
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+
+        response = self.client.get(url, HTTP_X_PROFILE="store")
+        self.assertEqual(response.status_code, 200)
+        profile = Profile.objects.get(id=response["X-Profile-Id"])
+        self.assertEqual((profile.kind, profile.target, profile.user), ("request", "GET /caches/", self.user))
+
+        self.assertEqual(self.client.get(reverse("dashboard:profile", args=[profile.id])).content.decode(), profile.stacks)
+        self.assertEqual(self.client.get(reverse("admin:dashboard_profile_change", args=[profile.id])).status_code, 200)
+
+    def test_superusers_only(self):
+        self.user.is_superuser = False
+        self.user.save()
+        response = self.client.get(reverse("dashboard:cache_stats"), {"profile": "store"})
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(Profile.objects.exists())
+
+    @patch("laas_dashboard.profiling.PROFILE_STORE_LIMIT", 2)
+    def test_store_limit(self):
+        with profiling() as recording:
+            pass
+        stored = [store(recording, "task", f"task {i}").id for i in range(3)]
+        self.assertEqual(list(Profile.objects.values_list("id", flat=True)), stored[:0:-1])
+
+    def test_hottest(self):
+        profile = Profile(stacks="a;b;c 5\na;b 2\nd;c 1\n")
+        self.assertEqual(profile.hottest(2), [("c", 6), ("b", 2)])
+
+    @patch("laas_dashboard.celery.PROFILE_TASK_SAMPLE_RATE", 1)
+    def test_task_sampling(self):
+        for task_id, task in [("profiled", end_expired_bookings), ("not_listed", sync_booking_instances)]:
+            celery_signals.task_started(task_id=task_id, task=task)
+            celery_signals.task_finished(task_id=task_id, task=task, state="SUCCESS")
+
+        self.assertEqual(list(Profile.objects.values_list("kind", "target")), [("task", "dashboard.tasks.end_expired_bookings")])
+
+
+class LoggingTests(TestCase):
+
+    def log(self, handler, message, **fields):
+        logger = logging.getLogger("laas_dashboard.tests")
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        logger.warning(message, extra={"fields": fields})
+
+    def test_json(self):
+        stream = io.StringIO()
+        handler = AsyncHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        with patch("laas_dashboard.tracing.TRACING_EXPORTER", "file"), patch("laas_dashboard.tracing.TRACING_SAMPLE_RATE", 1), \
+                patch("laas_dashboard.tracing.export"):
+            with tracing.start_trace("logging", "internal") as root:
+                self.log(handler, "Ended booking", booking_id=1, aggregate_id="abc")
+        handler.close()
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(entry["message"], "Ended booking")
+        self.assertEqual(entry["level"], "WARNING")
+        self.assertEqual((entry["booking_id"], entry["aggregate_id"]), (1, "abc"))
+        self.assertEqual(entry["trace_id"], root.trace.trace_id)
+
+    def test_text(self):
+        stream = io.StringIO()
+        handler = AsyncHandler(stream)
+        handler.setFormatter(TextFormatter())
+        self.log(handler, "Ended booking", booking_id=1)
+        handler.close()
+        self.assertTrue(stream.getvalue().rstrip().endswith("WARNING laas_dashboard.tests: Ended booking booking_id=1"))
+
+    def test_drops_rather_than_blocks(self):
+        handler = AsyncHandler(io.StringIO(), max_queued=1)
+        handler.close()
+        self.log(handler, "kept")
+        self.log(handler, "dropped")
+        self.assertEqual(handler.dropped, 1)
+
+    def test_liblaas_calls(self):
+        stub = LibLaaSStub(hosts_per_flavor=1).start()
+        self.addCleanup(stub.stop)
+
+        with self.assertLogs("liblaas.views", "DEBUG") as logs:
+            liblaas_views.flavor_list_flavors("anuket")
+        fields = logs.records[-1].fields
+        self.assertEqual((fields["endpoint"], fields["outcome"], fields["status"]), ("flavor_list_flavors", "ok", 200))
+        self.assertGreater(fields["duration_ms"], 0)
+
+        with self.assertLogs("liblaas.views", "WARNING"), patch.object(liblaas_views, "base", "http://127.0.0.1:9/"):
+            liblaas_views.flavor_list_flavors("anuket")
@@ -29,12 +29,18 @@ from django.urls import path
 from dashboard.views import (
     landing_view,
     lab_list_view,
-    host_profile_detail_view
+    host_profile_detail_view,
+    cache_stats_view,
+    metrics_view,
+    profile_view,
 )
 
 app_name = 'dashboard'
 urlpatterns = [
     path('', landing_view, name='index'),
     path('lab/', lab_list_view, name='all_labs'),
-    path('hosts/', host_profile_detail_view, name="hostprofile_detail")
+    path('hosts/', host_profile_detail_view, name="hostprofile_detail"),
+    path('caches/', cache_stats_view, name="cache_stats"),
+    path('metrics', metrics_view, name="metrics"),
+    path('profiles/<int:profile_id>/', profile_view, name="profile"),
 ]
@@ -8,6 +8,7 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
 
+import hmac
 import os
 from django.shortcuts import get_object_or_404
 from django.views.generic import TemplateView
@@ -16,15 +17,21 @@ from django.db.models import Q
 from django.template import RequestContext
 from datetime import datetime
 import pytz
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 
-from account.models import Lab, UserProfile
+from account.models import Lab
 from booking.models import Booking
+from dashboard.models import Profile
 from laas_dashboard import settings
-from laas_dashboard.settings import PROJECT, SITE_CONTACT
+from laas_dashboard.cache import cache_stats
+from laas_dashboard.metrics import exposition
+from laas_dashboard.settings import METRICS_TOKEN, PROJECT, SITE_CONTACT
+from prometheus_client import CONTENT_TYPE_LATEST
 from liblaas.utils import get_ipa_status
 
 from liblaas.views import flavor_list_flavors, flavor_list_hosts
+from booking.instances import active_host_bookings
+from resource_inventory.views import availability_context
 
 
 def lab_list_view(request):
@@ -45,11 +52,16 @@ def lab_list_view(request):
         name = flavor_map[id]
         host["flavor"] = {"id": id, "name": name}
  
+    held_by = active_host_bookings([host["name"] for host in host_list])
+    for host in host_list:
+        host["booking"] = held_by.get(host["name"])
+
 
     context = {
         'labs': labs,
         'hosts': host_list,
-        'title': 'Labs'
+        'title': 'Labs',
+        **availability_context(),
     }
 
     return render(request, "dashboard/lab_list.html", context)
@@ -76,8 +88,8 @@ def landing_view(request):
         ).distinct()
 
         # new, link, conflict, n/a
-        ipa_status = get_ipa_status(user)
-        up = UserProfile.objects.get(user=user)
+        up = request.user_profile
+        ipa_status = get_ipa_status(up)
         profile["email"] = up.email_addr
 
         # Link by default, no need for modal
@@ -105,6 +117,49 @@ def landing_view(request):
         }
     )
 
+def cache_stats_view(request):
+    """
+    Hits, misses, writes, deletes and evictions of each named cache in the worker that serves the request. Superusers only.
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    if not request.user.is_superuser:
+        return HttpResponse(status=403)
+
+    return JsonResponse(status=200, data={"caches": cache_stats()})
+
+
+def profile_view(request, profile_id):
+    """
+    A stored profile as collapsed stacks, for flamegraph.pl, speedscope or inferno. Superusers only.
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+    if not request.user.is_superuser:
+        return HttpResponse(status=403)
+
+    profile = get_object_or_404(Profile, id=profile_id)
+    response = HttpResponse(profile.stacks, content_type="text/plain; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="profile-{profile.id}.folded"'
+    return response
+
+
+def metrics_view(request):
+    """
+    Metrics in the Prometheus text format, see laas_dashboard.metrics. Scrapers send METRICS_TOKEN as a bearer token if it is set.
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        return HttpResponse(status=401)
+
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE_LATEST)
+
+
 def handler404(request, exception):
     response = render(request, "dashboard/404.html")
     response.status_code = 404
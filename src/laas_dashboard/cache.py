@@ -0,0 +1,165 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Cache backends that count their hits, misses, writes, deletes and evictions.
+# settings.CACHES builds the named caches out of these, picked with the CACHE_BACKEND environment variable:
+#   - locmem for tests and local development, it stands in for memcached or redis but isn't shared between processes
+#   - file, shared by every worker on the host
+#   - memcached or redis, shared by every host
+# Counts are kept per process. Evictions of memcached and redis are read from the server and cover the whole server.
+# Every count is also added to the laas_cache_operations metric, see laas_dashboard.metrics.
+
+import random
+import threading
+from collections import Counter, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends import dummy, filebased, locmem, memcached, redis
+
+from laas_dashboard.metrics import CACHE_OPERATIONS
+
+_lock = threading.Lock()
+_counts = defaultdict(Counter)
+
+COUNTERS = ["hits", "misses", "sets", "deletes", "evictions"]
+
+
+def count(alias: str, **counts):
+    with _lock:
+        _counts[alias].update(counts)
+    for operation, value in counts.items():
+        if value > 0:
+            CACHE_OPERATIONS.labels(alias, operation).inc(value)
+
+
+class MeteredCache:
+    """
+    Mixin counting the operations of a Django cache backend, under the ALIAS given in the cache's settings.
+    Backends that don't override get_many() implement it with get(), so the keys are counted once either way.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.alias = params.get("ALIAS", "default")
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing_key, version=version)
+        if value is self._missing_key:
+            count(self.alias, misses=1)
+            return default
+        count(self.alias, hits=1)
+        return value
+
+    def set(self, key, value, timeout=dummy.DEFAULT_TIMEOUT, version=None):
+        count(self.alias, sets=1)
+        return super().set(key, value, timeout=timeout, version=version)
+
+    def add(self, key, value, timeout=dummy.DEFAULT_TIMEOUT, version=None):
+        count(self.alias, sets=1)
+        return super().add(key, value, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        count(self.alias, deletes=1)
+        return super().delete(key, version=version)
+
+    def server_evictions(self) -> int | None:
+        """
+        Evictions reported by the cache server, None for caches without one.
+        """
+        return None
+
+
+class MeteredManyCache(MeteredCache):
+    """
+    For backends that fetch, write and delete many keys in one round trip.
+    """
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version=version)
+        count(self.alias, hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set_many(self, data, timeout=dummy.DEFAULT_TIMEOUT, version=None):
+        count(self.alias, sets=len(data))
+        return super().set_many(data, timeout=timeout, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        count(self.alias, deletes=len(keys))
+        return super().delete_many(keys, version=version)
+
+
+class LocMemCache(MeteredCache, locmem.LocMemCache):
+    def _cull(self):
+        # only called with the lock held
+        before = len(self._cache)
+        super()._cull()
+        count(self.alias, evictions=before - len(self._cache))
+
+
+class FileBasedCache(MeteredCache, filebased.FileBasedCache):
+    def _cull(self):
+        # Django's _cull(), counting what it removes
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            count(self.alias, evictions=num_entries)
+            return self.clear()
+        filelist = random.sample(filelist, int(num_entries / self._cull_frequency))
+        for fname in filelist:
+            self._delete(fname)
+        count(self.alias, evictions=len(filelist))
+
+
+class PyMemcacheCache(MeteredManyCache, memcached.PyMemcacheCache):
+    def server_evictions(self) -> int | None:
+        try:
+            return sum(int(client.stats().get(b"evictions", 0)) for client in self._cache.clients.values())
+        except Exception:
+            return None
+
+
+class RedisCache(MeteredManyCache, redis.RedisCache):
+    def server_evictions(self) -> int | None:
+        try:
+            return int(self._cache.get_client().info("stats").get("evicted_keys", 0))
+        except Exception:
+            return None
+
+
+class DummyCache(MeteredCache, dummy.DummyCache):
+    pass
+
+
+def cache_stats() -> dict[str, dict]:
+    """
+    Returns the counts of every configured cache in this process, with its hit rate and the server's evictions if it has one.
+    """
+    with _lock:
+        counts = {alias: Counter(alias_counts) for alias, alias_counts in _counts.items()}
+
+    stats = {}
+    for alias in caches:
+        backend = caches[alias]
+        entry = {name: counts.get(alias, Counter())[name] for name in COUNTERS}
+        reads = entry["hits"] + entry["misses"]
+        entry["hit_rate"] = round(entry["hits"] / reads, 3) if reads else None
+        entry["backend"] = type(backend).__name__
+        if isinstance(backend, MeteredCache):
+            entry["server_evictions"] = backend.server_evictions()
+        stats[alias] = entry
+    return stats
+
+
+def reset_stats():
+    with _lock:
+        _counts.clear()
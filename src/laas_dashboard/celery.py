@@ -9,13 +9,20 @@
 
 
 import os
+import random
+import time
 
 from celery import Celery
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_shutdown
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'laas_dashboard.settings')
 
 from django.conf import settings  # noqa
+from laas_dashboard.metrics import TASK_DURATION, process_exited  # noqa
+from laas_dashboard.profiling import profiling, store  # noqa
+from laas_dashboard.settings import PROFILE_TASK_SAMPLE_RATE, PROFILE_TASKS  # noqa
+from laas_dashboard.tracing import current_traceparent, start_trace  # noqa
 
 app = Celery('laas_dashboard')
 
@@ -29,3 +36,53 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
+
+
+# Start times, traces and profiles of the tasks running in this process, by task id
+_task_starts = {}
+_task_traces = {}
+_task_profiles = {}
+
+
+@before_task_publish.connect
+def task_queued(headers=None, **kwargs):
+    # the worker continues the trace of whatever queued the task
+    traceparent = current_traceparent()
+    if traceparent is not None and headers is not None:
+        headers["traceparent"] = traceparent
+
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    _task_starts[task_id] = time.perf_counter()
+    trace = start_trace(f"task {task.name}", "consumer", getattr(task.request, "traceparent", None), {"celery.task_id": task_id})
+    _task_traces[task_id] = (trace, trace.__enter__())
+
+    if task.name in PROFILE_TASKS and PROFILE_TASK_SAMPLE_RATE and random.random() < PROFILE_TASK_SAMPLE_RATE:
+        profile = profiling()
+        _task_profiles[task_id] = (profile, profile.__enter__())
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, retval=None, **kwargs):
+    begin = _task_starts.pop(task_id, None)
+    if begin is not None:
+        TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - begin)
+
+    profile, recording = _task_profiles.pop(task_id, (None, None))
+    if profile is not None:
+        profile.__exit__(None, None, None)
+        store(recording, "task", task.name)
+
+    trace, root = _task_traces.pop(task_id, (None, None))
+    if root is not None:
+        root.set({"celery.state": state})
+        if state == "FAILURE":
+            root.fail(retval)
+    if trace is not None:
+        trace.__exit__(None, None, None)
+
+
+@worker_process_shutdown.connect
+def worker_process_exited(pid=None, **kwargs):
+    process_exited(pid or os.getpid())
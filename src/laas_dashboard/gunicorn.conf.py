@@ -0,0 +1,22 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Gunicorn settings, used by web/init.sh
+
+import os
+
+bind = "0.0.0.0:8000"
+
+
+def child_exit(server, worker):
+    # Metric files of a worker that exited are merged into the others', see laas_dashboard.metrics.
+    # The arbiter doesn't load Django, so this doesn't go through laas_dashboard.metrics.process_exited().
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client.multiprocess import mark_process_dead
+        mark_process_dead(worker.pid)
@@ -0,0 +1,112 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Log handling, set up by settings.LOGGING.
+#
+# Modules log through logging.getLogger(__name__), passing what the line is about as fields:
+#     logger.info("Ended booking", extra={"fields": {"booking_id": booking.id, "aggregate_id": booking.aggregateId}})
+# Records are formatted by the thread that logs them, as json (LOG_FORMAT=json) or as text with key=value fields, with
+# the trace id when the request or task is traced. Writing them out is left to a background thread through a queue, so
+# requests never wait on stdout. If the writer can't keep up, records are dropped rather than blocking the caller.
+#
+# LOG_LEVEL sets the level of everything, and LOG_LEVELS the level of each subsystem, by logger name:
+#     LOG_LEVELS=liblaas=DEBUG,booking=WARNING
+
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from laas_dashboard.tracing import current_span
+
+# Attributes every LogRecord has, the others were passed in extra=
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def record_fields(record: logging.LogRecord) -> dict:
+    fields = dict(getattr(record, "fields", None) or {})
+    fields.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES and key != "fields"})
+    current = current_span()
+    if current is not None:
+        fields["trace_id"] = current.trace.trace_id
+    return fields
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One json object per record, with the record's fields as keys.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    A line per record for reading in a terminal, with the fields as key=value.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in record_fields(record).items())
+        if not fields:
+            return line
+        first, newline, rest = line.partition("\n")
+        return f"{first} {fields}{newline}{rest}"
+
+
+class AsyncHandler(QueueHandler):
+    """
+    Formats records in the thread that logs them, and writes them to the stream from a background thread.
+    """
+
+    def __init__(self, stream=None, max_queued: int = 10000):
+        super().__init__(queue.Queue(max_queued))
+        self.dropped = 0
+        target = logging.StreamHandler(stream or sys.stdout)
+        target.setFormatter(logging.Formatter("%(message)s"))
+        self.listener = QueueListener(self.queue, target)
+        self.listener.start()
+        # forked processes, such as celery's pool workers, don't inherit the writing thread
+        os.register_at_fork(after_in_child=self.restart)
+
+    def restart(self):
+        self.queue = self.listener.queue = queue.Queue(self.queue.maxsize)
+        self.listener._thread = None
+        self.listener.start()
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # logging.shutdown() closes handlers at exit, which writes out the records still queued
+        if self.listener._thread is not None:
+            try:
+                self.listener.stop()
+            except queue.Full:
+                pass
+        super().close()
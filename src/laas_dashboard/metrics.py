@@ -0,0 +1,175 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Prometheus metrics, served in the text exposition format at /metrics.
+#
+# Counted as things happen:
+#   - requests and their latency per view, by MetricsMiddleware
+#   - LibLaaS calls, their latency and outcome per endpoint, by liblaas.views
+#   - cache operations per cache, by laas_dashboard.cache (hit ratio = hits / (hits + misses))
+#   - celery task durations per task and state, by the signal handlers in laas_dashboard.celery
+#   - how late notifications are sent compared to when they were due, by AbstractScheduledNotification.send()
+# Read from the database and the broker when scraped, by BacklogCollector:
+#   - the LibLaaS outbox and celery queue backlogs, expired bookings not ended yet, and overdue notifications
+#
+# Gunicorn workers and celery processes each keep their own counts. When PROMETHEUS_MULTIPROC_DIR is set, they write
+# them to files in that directory instead, and /metrics adds up the files of every directory in METRICS_DIRS, so
+# one scrape covers the web and the worker containers if they share a volume. web/init.sh and worker/init.sh set
+# both from METRICS_VOLUME, giving each container its own directory since their process ids can clash.
+
+import glob
+import os
+import time
+
+from django.db.models import Count, Min
+from django.utils import timezone
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+from prometheus_client.registry import REGISTRY
+
+from laas_dashboard.settings import METRICS_DIRS
+
+# Buckets, in seconds
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+NOTIFICATION_LAG_BUCKETS = (1, 10, 30, 60, 120, 300, 600, 1800, 3600, 6 * 3600, 24 * 3600)
+
+HTTP_REQUESTS = Counter("laas_http_requests", "Requests served", ["view", "method", "status"])
+HTTP_REQUEST_DURATION = Histogram(
+    "laas_http_request_duration_seconds", "Time to serve a request", ["view", "method"], buckets=REQUEST_BUCKETS
+)
+LIBLAAS_REQUESTS = Counter(
+    "laas_liblaas_requests", "Calls to LibLaaS, by outcome: ok, http_error or connection_error", ["endpoint", "outcome"]
+)
+LIBLAAS_REQUEST_DURATION = Histogram(
+    "laas_liblaas_request_duration_seconds", "Time a call to LibLaaS took", ["endpoint"], buckets=REQUEST_BUCKETS
+)
+CACHE_OPERATIONS = Counter("laas_cache_operations", "Cache hits, misses, sets, deletes and evictions", ["cache", "operation"])
+TASK_DURATION = Histogram("laas_celery_task_duration_seconds", "Time a celery task ran for", ["task", "state"], buckets=TASK_BUCKETS)
+NOTIFICATION_LAG = Histogram(
+    "laas_notification_lag_seconds", "Time from when a notification was due to when it was sent", ["type"],
+    buckets=NOTIFICATION_LAG_BUCKETS,
+)
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and their latency per view. Views are named by their url name, so ids don't multiply the series.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        begin = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - begin
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name or match._func_path) if match is not None else "unresolved"
+        HTTP_REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+        HTTP_REQUEST_DURATION.labels(view, request.method).observe(duration)
+        return response
+
+
+class BacklogCollector:
+    """
+    Gauges read from the database and the broker when metrics are scraped.
+    """
+
+    def collect(self):
+        from booking.models import AbstractScheduledNotification, Booking
+        from liblaas.models import OutboxEntry, OutboxStatus
+
+        now = timezone.now()
+
+        outbox = GaugeMetricFamily("laas_outbox_entries", "LibLaaS outbox entries that aren't delivered", labels=["status"])
+        counts = dict(
+            OutboxEntry.objects.exclude(status=OutboxStatus.DELIVERED).values_list("status").annotate(count=Count("id"))
+        )
+        for status in [OutboxStatus.PENDING, OutboxStatus.FAILED]:
+            outbox.add_metric([status], counts.get(status, 0))
+        yield outbox
+
+        oldest = OutboxEntry.objects.filter(status=OutboxStatus.PENDING).aggregate(oldest=Min("created"))["oldest"]
+        yield GaugeMetricFamily(
+            "laas_outbox_oldest_pending_seconds", "Age of the oldest undelivered LibLaaS outbox entry",
+            value=(now - oldest).total_seconds() if oldest else 0,
+        )
+
+        yield GaugeMetricFamily(
+            "laas_expired_bookings", "Bookings past their end that haven't been ended yet",
+            value=Booking.objects.filter(end__lte=now, complete=False).count(),
+        )
+
+        overdue = GaugeMetricFamily("laas_overdue_notifications", "Notifications past due that haven't been sent", labels=["type"])
+        overdue_age = GaugeMetricFamily(
+            "laas_oldest_overdue_notification_seconds", "How long the oldest unsent notification is overdue", labels=["type"]
+        )
+        for unsent in AbstractScheduledNotification.get_all_unsent_and_ready_notifications():
+            name = unsent.model.__name__
+            stats = unsent.aggregate(count=Count("id"), oldest=Min("when"))
+            overdue.add_metric([name], stats["count"])
+            overdue_age.add_metric([name], (now - stats["oldest"]).total_seconds() if stats["oldest"] else 0)
+        yield overdue
+        yield overdue_age
+
+        queue_length = celery_queue_length()
+        if queue_length is not None:
+            yield GaugeMetricFamily("laas_celery_queue_messages", "Tasks waiting in the celery queue", value=queue_length)
+
+
+def celery_queue_length() -> int | None:
+    """
+    The number of messages in celery's default queue, or None if the broker can't be reached.
+    """
+    from laas_dashboard.celery import app
+
+    try:
+        with app.connection_for_read(connect_timeout=2) as connection:
+            queue = app.conf.task_default_queue
+            return connection.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception:
+        return None
+
+
+class MultiDirectoryCollector:
+    """
+    Adds up the metric files written by the processes of every directory, as MultiProcessCollector does for one.
+    """
+
+    def __init__(self, directories: list[str]):
+        self.directories = directories
+
+    def collect(self):
+        files = [path for directory in self.directories for path in glob.glob(os.path.join(directory, "*.db"))]
+        return MultiProcessCollector.merge(files, accumulate=True)
+
+
+def registry() -> CollectorRegistry:
+    """
+    The registry to serve: this process's metrics, or every process's in multi-process mode, and the backlogs.
+    """
+    scraped = CollectorRegistry()
+    scraped.register(MultiDirectoryCollector(METRICS_DIRS) if METRICS_DIRS else REGISTRY)
+    scraped.register(BacklogCollector())
+    return scraped
+
+
+def exposition() -> bytes:
+    return generate_latest(registry())
+
+
+def process_exited(pid: int):
+    """
+    Cleans up after a process that wrote metric files, call it when a gunicorn worker or celery child exits.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        mark_process_dead(pid)
@@ -0,0 +1,145 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Sampling profiles of requests and celery tasks, for slow pages that only reproduce in production.
+#
+# A sampler thread reads the profiled thread's stack every PROFILE_INTERVAL_MS through sys._current_frames(), so the
+# profiled code runs as is: the cost is one stack walk per sample, not a hook on every call like cProfile.
+# Profiles are kept as collapsed stacks, one "outer;inner;leaf count" line per stack, which flamegraph.pl,
+# speedscope and inferno turn into flame graphs.
+#
+# Superusers profile a request by adding ?profile= to its url, or by sending an X-Profile header:
+#   - return, answers with the profile instead of the page
+#   - anything else, stores the profile and answers as usual, with the profile's id in an X-Profile-Id header
+# Tasks in PROFILE_TASKS are profiled on a sample of their runs (PROFILE_TASK_SAMPLE_RATE), see laas_dashboard.celery.
+# Stored profiles are dashboard.models.Profile, browsable from the admin. Only the newest PROFILE_STORE_LIMIT are kept.
+
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.http import HttpResponse
+
+from laas_dashboard.settings import PROFILE_INTERVAL_MS, PROFILE_STORE_LIMIT
+
+# Deepest stack recorded, deeper frames are cut off at the root end
+MAX_DEPTH = 200
+
+
+def frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"
+
+
+def collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Recording:
+    """
+    The stacks sampled while profiling, with how often each was seen.
+    """
+
+    def __init__(self, interval_ms: float):
+        self.interval_ms = interval_ms
+        self.stacks = Counter()
+        self.duration_ms = 0.0
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Sampler(threading.Thread):
+
+    def __init__(self, thread_id: int, recording: Recording):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.recording = recording
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = self.recording.interval_ms / 1000
+        while not self.stopped.wait(interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.recording.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+@contextmanager
+def profiling(interval_ms: float = PROFILE_INTERVAL_MS):
+    """
+    Samples the stack of the current thread during the block, yielding the Recording it fills in.
+    """
+    recording = Recording(interval_ms)
+    sampler = Sampler(threading.get_ident(), recording)
+    begin = time.perf_counter()
+    sampler.start()
+    try:
+        yield recording
+    finally:
+        sampler.stop()
+        recording.duration_ms = (time.perf_counter() - begin) * 1000
+
+
+def store(recording: Recording, kind: str, target: str, user=None):
+    """
+    Saves a profile, deleting the oldest ones beyond PROFILE_STORE_LIMIT.
+    """
+    from dashboard.models import Profile
+
+    profile = Profile.objects.create(
+        kind=kind,
+        target=target[:300],
+        user=user,
+        duration_ms=recording.duration_ms,
+        interval_ms=recording.interval_ms,
+        samples=recording.samples,
+        stacks=recording.collapsed(),
+    )
+    cutoff = list(Profile.objects.order_by("-id").values_list("id", flat=True)[PROFILE_STORE_LIMIT:PROFILE_STORE_LIMIT + 1])
+    if cutoff:
+        Profile.objects.filter(id__lte=cutoff[0]).delete()
+    return profile
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests of superusers that ask for it, see the top of this module.
+    Put it after AuthenticationMiddleware, which it needs to know who the user is.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.GET.get("profile") or request.headers.get("X-Profile")
+        if not mode or not request.user.is_superuser:
+            return self.get_response(request)
+
+        with profiling() as recording:
+            response = self.get_response(request)
+
+        if mode == "return":
+            return HttpResponse(recording.collapsed(), content_type="text/plain; charset=utf-8")
+        profile = store(recording, "request", f"{request.method} {request.get_full_path()}", request.user)
+        response["X-Profile-Id"] = str(profile.id)
+        return response
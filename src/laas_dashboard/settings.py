@@ -46,12 +46,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "laas_dashboard.timing.ServerTimingMiddleware",
+    "laas_dashboard.metrics.MetricsMiddleware",
+    "laas_dashboard.tracing.TracingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "laas_dashboard.profiling.ProfilingMiddleware",
+    "account.middleware.UserProfileMiddleware",
     "account.middleware.ActiveUserMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -105,6 +110,8 @@ ROOT_URLCONF = 'laas_dashboard.urls'
 PROJECT = os.environ.get("PROJECT", "")  # the project for the current deployment (i.e. anuket or lfedge)
 HOST_DOMAIN = os.environ.get("HOST_DOMAIN", "") # Domain for provisioned hosts (i.e opnfv.iol.unh.edu or akr.iol.unh.edu)
 LIBLAAS_BASE_URL = os.environ.get("LIBLAAS_BASE_URL") # API URL
+LIBLAAS_TIMEOUT = int(os.environ.get("LIBLAAS_TIMEOUT", 30))  # Seconds a call to LibLaaS may take before it is given up on
+BOOKING_LAB = os.environ.get("BOOKING_LAB", "UNH_IOL")  # name of the Lab that new bookings are assigned to
 TEMPLATE_DIRS = ["base"]  # where all the base templates are
 SUB_PROJECTS = os.environ.get("SUB_PROJECTS", "").split(',')
 
@@ -120,7 +127,7 @@ dirs = [os.path.join(BASE_DIR, "templates", d) for d in TEMPLATE_DIRS]
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'laas_dashboard.timing.DjangoTemplates',  # the Django backend, timing how long rendering takes
         'DIRS': dirs,
         'APP_DIRS': True,
         'OPTIONS': {
@@ -213,6 +220,65 @@ DATABASES = {
 
 DEFAULT_AUTO_FIELD='django.db.models.AutoField' 
 
+# Caches
+# Every named cache uses the same backend, picked with CACHE_BACKEND, see laas_dashboard.cache
+#   locmem - per process, the default for tests and local development
+#   file - shared by the workers of one host, one directory per cache under CACHE_LOCATION
+#   memcached / redis - shared by every host, CACHE_LOCATION is the server address
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem" if TESTING else "file")
+CACHE_BACKENDS = {
+    "locmem": "laas_dashboard.cache.LocMemCache",
+    "file": "laas_dashboard.cache.FileBasedCache",
+    "memcached": "laas_dashboard.cache.PyMemcacheCache",
+    "redis": "laas_dashboard.cache.RedisCache",
+    "dummy": "laas_dashboard.cache.DummyCache",
+}
+CACHE_LOCATION = os.environ.get("CACHE_LOCATION", {
+    "file": "/var/tmp/laas_dashboard_cache",
+    "memcached": "memcached:11211",
+    "redis": "redis://redis:6379",
+}.get(CACHE_BACKEND, ""))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 5000))  # Entries a locmem or file cache holds before culling
+
+CACHE_NAMES = [
+    "default",
+    "liblaas",  # responses from LibLaaS: booking instances, power states, hosts and flavors
+    "sessions",
+    "ratelimit",
+    "snapshots",  # computed analytics series
+]
+
+
+def cache_settings(name: str) -> dict:
+    if CACHE_BACKEND == "file":
+        location = os.path.join(CACHE_LOCATION, name)
+    elif CACHE_BACKEND in ("locmem", "dummy"):
+        location = name
+    else:
+        location = CACHE_LOCATION
+
+    options = {}
+    if CACHE_BACKEND in ("locmem", "file"):
+        options["MAX_ENTRIES"] = CACHE_MAX_ENTRIES
+
+    return {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": location,
+        # keeps the caches apart where they share a server
+        "KEY_PREFIX": name,
+        "ALIAS": name,
+        "OPTIONS": options,
+    }
+
+
+CACHES = {name: cache_settings(name) for name in CACHE_NAMES}
+
+# Sessions are read from the sessions cache and written through to the database,
+# unless the cache is per process, where a session ended in one worker would live on in the others
+if CACHE_BACKEND in ("file", "memcached", "redis"):
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+    SESSION_CACHE_ALIAS = "sessions"
+
 # Rest API Settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -237,6 +303,7 @@ OAUTH_CALLBACK_URL = os.environ.get('DASHBOARD_URL') + '/accounts/authenticated'
 
 # Celery Settings
 CELERY_TIMEZONE = 'UTC'
+CELERY_WORKER_HIJACK_ROOT_LOGGER = False  # workers log through LOGGING below too
 
 RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'rabbitmq')
 RABBITMQ_PORT = os.environ.get('RABBITMQ_PORT', '5672')
@@ -253,12 +320,118 @@ CELERY_BEAT_SCHEDULE = {
     'notification_poll': {
         'task': 'dashboard.tasks.send_notifications',
         'schedule': timedelta(minutes=2)
+    },
+    # bookings still provisioning, their instances are also refreshed whenever their status is viewed
+    'booking_instance_sync': {
+        'task': 'dashboard.tasks.sync_booking_instances',
+        'schedule': timedelta(minutes=2)
+    },
+    # entries are also relayed as soon as they are committed, this picks up retries
+    'outbox_relay': {
+        'task': 'liblaas.tasks.relay_outbox',
+        'schedule': timedelta(seconds=30)
+    },
+    'job_expiry': {
+        'task': 'liblaas.tasks.expire_stale_jobs',
+        'schedule': timedelta(minutes=1)
+    },
+    'booking_rollups': {
+        'task': 'analytics.tasks.update_booking_rollups',
+        'schedule': timedelta(minutes=10)
+    },
+    'idempotency_key_purge': {
+        'task': 'booking_api.tasks.purge_idempotency_keys',
+        'schedule': timedelta(hours=1)
+    },
+    'retention': {
+        'task': 'dashboard.tasks.apply_retention',
+        'schedule': timedelta(hours=6)
     }
 }
 
+# LibLaaS Outbox Settings
+OUTBOX_MAX_ATTEMPTS = 8  # Attempts before an outbox entry is marked as failed
+OUTBOX_RETRY_DELAY = timedelta(seconds=30)  # Delay before the first retry, doubled for every further attempt
+OUTBOX_LEASE = timedelta(minutes=5)  # How long a relay holds an entry it is delivering, after which another relay may retry it
+
+# LibLaaS Job Settings
+JOB_TIMEOUT = timedelta(minutes=10)  # Queued or running jobs older than this are failed
+JOB_EVENTS_TIMEOUT = 5  # Seconds a job event stream (and the web worker serving it) stays open before the client has to reconnect
+
+# IPMI Power Status Settings
+IPMI_STATUS_CACHE_TIMEOUT = 5  # Seconds a host's power status is shared between viewers before the BMC is asked again
+IPMI_STATUS_MAX_WORKERS = 8  # Power statuses looked up in parallel for a single booking
+BOOKING_INSTANCES_CACHE_TIMEOUT = 60  # Seconds the instance ids of a booking are cached for
+
+# Availability Settings
+AVAILABILITY_HOSTS_CACHE_TIMEOUT = 60  # Seconds the host list of each flavor is cached for when computing availability
+AVAILABILITY_DAYS = 14  # Default number of days covered by the availability calendar
+AVAILABILITY_MAX_DAYS = 90  # Longest availability calendar that can be requested
+
+# Analytics Settings
+ANALYTICS_HOURLY_RETENTION = timedelta(days=30)  # Hourly booking rollups are kept for this long, daily ones forever
+ANALYTICS_WATERMARK_LAG = timedelta(minutes=5)  # Bookings changed this long before the last rollup are looked at again, in case they committed late
+ANALYTICS_UTILIZATION_CACHE_TIMEOUT = 300  # Seconds a utilization series is cached for, per range, resolution and filter
+EXPORT_CHUNK_SIZE = 2000  # Rows fetched from the database cursor, and written out, at a time when exporting
+
+# booking_api Idempotency-Key Settings
+IDEMPOTENCY_KEY_LIFETIME = timedelta(hours=24)  # How long a stored response is replayed for retries
+IDEMPOTENCY_WAIT_TIMEOUT = 30  # Seconds a retry waits for the in-flight request with the same key before returning 409
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT = timedelta(minutes=2)  # An unfinished request older than this was abandoned (i.e. its worker was killed), longer than gunicorn's timeout
+
+# Retention Settings, a value of 0 days keeps those rows forever
+RETENTION_BOOKING_DAYS = int(os.environ.get("RETENTION_BOOKING_DAYS", 365))  # Completed bookings that ended this long ago are archived
+RETENTION_NOTIFICATION_DAYS = int(os.environ.get("RETENTION_NOTIFICATION_DAYS", 30))  # Sent notifications this old are deleted
+RETENTION_APILOG_DAYS = int(os.environ.get("RETENTION_APILOG_DAYS", 90))  # API logs this old are rolled up into daily summaries
+RETENTION_CHUNK_SIZE = 500  # Rows moved or deleted per transaction, so no lock is held for long
+RETENTION_MAX_SECONDS = 300  # A retention run stops starting new chunks after this long, the next run carries on
+
+# Request Timing Settings, see laas_dashboard.timing
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get("SERVER_TIMING_SAMPLE_RATE", 0.1))  # Share of requests whose time is broken down into SQL, LibLaaS, DNS and templates
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", 2000))  # Requests that take longer are logged, 0 logs none
+
+# Metrics Settings, see laas_dashboard.metrics
+METRICS_DIRS = [d for d in os.environ.get("METRICS_DIRS", os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")).split(",") if d]  # Metric files of every process to serve at /metrics
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")  # Bearer token scrapers must send to /metrics, empty leaves it open
+
+# Tracing Settings, see laas_dashboard.tracing
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "")  # "file" or "collector" to record traces, empty records none
+TRACING_FILE = os.environ.get("TRACING_FILE", "/tmp/laas_dashboard_traces.jsonl")  # Where the file exporter appends spans
+TRACING_COLLECTOR_URL = os.environ.get("TRACING_COLLECTOR_URL", "http://localhost:4318/v1/traces")  # OTLP/HTTP endpoint of the collector exporter
+TRACING_SAMPLE_RATE = float(os.environ.get("TRACING_SAMPLE_RATE", 0.1))  # Share of requests and tasks traced, unless their caller already decided
+TRACING_SERVICE_NAME = os.environ.get("TRACING_SERVICE_NAME", "laas-dashboard")  # Service the spans are reported under
+
+# Logging Settings, see laas_dashboard.logs
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # "json", or "text" to read in a terminal
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")  # Level of every logger not in LOG_LEVELS
+LOG_LEVELS = dict(pair.split("=", 1) for pair in os.environ.get("LOG_LEVELS", "").split(",") if "=" in pair)  # Level per subsystem, e.g. liblaas=DEBUG,booking=WARNING
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "laas_dashboard.logs.JsonFormatter"},
+        "text": {"()": "laas_dashboard.logs.TextFormatter"},
+    },
+    "handlers": {
+        "async": {"()": "laas_dashboard.logs.AsyncHandler", "formatter": LOG_FORMAT},
+    },
+    "root": {"handlers": ["async"], "level": LOG_LEVEL},
+    "loggers": {name.strip(): {"level": level.strip().upper()} for name, level in LOG_LEVELS.items()},
+}
+
+# Profiling Settings, see laas_dashboard.profiling
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))  # Time between two samples of the stack
+PROFILE_STORE_LIMIT = int(os.environ.get("PROFILE_STORE_LIMIT", 200))  # Stored profiles kept, the oldest are deleted first
+PROFILE_TASKS = [t for t in os.environ.get("PROFILE_TASKS", "dashboard.tasks.end_expired_bookings,dashboard.tasks.send_notifications").split(",") if t]  # Celery tasks profiled on a sample of their runs
+PROFILE_TASK_SAMPLE_RATE = float(os.environ.get("PROFILE_TASK_SAMPLE_RATE", 0.05))  # Share of the runs of those tasks profiled, 0 profiles none
+
 # Notifier Settings
 EXPIRE_LIFETIME = 12  # Minimum lifetime of booking to send notification
 EXPIRE_HOURS = 48  # Notify when booking is expiring within this many hours
 
+# Seconds to cache user profiles across requests, 0 only shares a profile within a single request
+USER_PROFILE_CACHE_TIMEOUT = int(os.environ.get("USER_PROFILE_CACHE_TIMEOUT", 0))
+
 SITE_CONTACT = os.environ.get("SITE_CONTACT")
 EVE_DOCS_URL = os.environ.get("EVE_DOCS_URL", "")
\ No newline at end of file
@@ -0,0 +1,176 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Breaks down where the time of a request goes:
+#   - db, every SQL query, through a connection.execute_wrapper()
+#   - liblaas, every call made by liblaas.views, which are decorated with @timed("liblaas")
+#   - dns, the host lookups of booking.lib.resolve_hostname()
+#   - template, rendering templates, through the DjangoTemplates backend below
+# ServerTimingMiddleware times a sample of the requests (SERVER_TIMING_SAMPLE_RATE). Their responses get a
+# Server-Timing header, which browsers show in their developer tools. Every request is timed as a whole, and the
+# ones slower than SLOW_REQUEST_MS are logged as json, with the breakdown if it was sampled.
+#
+# Outside of a sampled request, such as in celery tasks, timed() only costs a context variable lookup.
+
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.template.backends import django as django_backend
+
+from laas_dashboard.settings import SERVER_TIMING_SAMPLE_RATE, SLOW_REQUEST_MS
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ["db", "liblaas", "dns", "template"]
+
+_timings = ContextVar("timings", default=None)
+
+
+class Timings:
+    """
+    Time spent, and the number of calls made, in each category during one request.
+    """
+
+    def __init__(self):
+        self.ms = dict.fromkeys(CATEGORIES, 0.0)
+        self.calls = dict.fromkeys(CATEGORIES, 0)
+        # a category is only counted once while it is nested in itself, e.g. templates rendered by a template tag
+        self.active = set()
+
+    def add(self, category: str, ms: float):
+        self.ms[category] += ms
+        self.calls[category] += 1
+
+    def to_dict(self) -> dict:
+        return {category: {"ms": round(self.ms[category], 2), "calls": self.calls[category]} for category in self.ms}
+
+
+@contextmanager
+def timed(category: str):
+    """
+    Adds the time spent in the block to the category, if the current request is being timed.
+    Can also be used as a decorator.
+    """
+    timings = _timings.get()
+    if timings is None or category in timings.active:
+        yield
+        return
+    timings.active.add(category)
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(category)
+        timings.add(category, (time.perf_counter() - begin) * 1000)
+
+
+def time_query(execute, sql, params, many, context):
+    with timed("db"):
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def timing():
+    """
+    Times everything in the block, returning the Timings it fills in.
+    """
+    timings = Timings()
+    token = _timings.set(timings)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(time_query))
+            yield timings
+    finally:
+        _timings.reset(token)
+
+
+def server_timing(timings: Timings | None, total_ms: float) -> str:
+    metrics = []
+    if timings is not None:
+        for category in CATEGORIES:
+            calls = timings.calls[category]
+            if calls:
+                metrics.append(f'{category};dur={timings.ms[category]:.1f};desc="{calls} call{"s" if calls > 1 else ""}"')
+    metrics.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(metrics)
+
+
+class ServerTimingMiddleware:
+    """
+    Times requests, see the top of this module. Put it first, so it times the other middleware too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        begin = time.perf_counter()
+        timings = None
+        if SERVER_TIMING_SAMPLE_RATE and random.random() < SERVER_TIMING_SAMPLE_RATE:
+            with timing() as timings:
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - begin) * 1000
+
+        if timings is not None:
+            response["Server-Timing"] = server_timing(timings, total_ms)
+        if SLOW_REQUEST_MS and total_ms >= SLOW_REQUEST_MS:
+            log_slow_request(request, response, total_ms, timings)
+        return response
+
+
+def log_slow_request(request, response, total_ms: float, timings: Timings | None):
+    user = getattr(request, "user", None)
+    record = {
+        "event": "slow_request",
+        "method": request.method,
+        "path": request.path,
+        "view": getattr(getattr(request, "resolver_match", None), "view_name", None),
+        "status": response.status_code,
+        "user": user.id if user is not None and user.is_authenticated else None,
+        "total_ms": round(total_ms, 2),
+        "breakdown": timings.to_dict() if timings is not None else None,
+    }
+    logger.warning(json.dumps(record), extra={"timing": record})
+
+
+class TimedTemplate:
+    """
+    A template of the Django backend, timing its rendering.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        with timed("template"):
+            return self.template.render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    The Django template backend, timing how long templates take to render.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,374 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Traces of requests and celery tasks, to follow a booking from the view that creates it, through its database writes
+# and signals, to the outbox relay that sends it to LibLaaS and the tasks that notify and end it later.
+#
+# TracingMiddleware starts a trace for a sample of the requests (TRACING_SAMPLE_RATE), and the signal handlers in
+# laas_dashboard.celery start one for tasks. Inside a trace there are spans for:
+#   - every SQL query, through a connection.execute_wrapper()
+#   - every call made by liblaas.views, which send the W3C traceparent header so LibLaaS can join the trace
+#   - the stages decorated with @span(), such as booking.lib.create_booking() and outbox deliveries
+# Tasks queued during a trace carry its traceparent in their message headers, and continue it in the worker.
+# A request or task that comes with a traceparent is always traced, so one decision covers the whole trace.
+#
+# The spans recorded in a process are exported when the request or task ends, see TRACING_EXPORTER:
+#   - file, appends them as json lines to TRACING_FILE
+#   - collector, sends them in batches to an OpenTelemetry collector as OTLP/HTTP json
+# With no exporter, nothing is traced and span() only costs a context variable lookup.
+
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+import requests
+from django.db import connections
+
+from laas_dashboard.settings import (
+    TRACING_COLLECTOR_URL,
+    TRACING_EXPORTER,
+    TRACING_FILE,
+    TRACING_SAMPLE_RATE,
+    TRACING_SERVICE_NAME,
+)
+
+logger = logging.getLogger(__name__)
+
+# Spans kept per trace and process, so a long task doesn't hold on to every query it made
+MAX_SPANS = 10000
+
+# OTLP span kinds
+KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+
+_span = ContextVar("span", default=None)
+
+
+class Span:
+    """
+    One timed stage of a trace.
+    """
+
+    def __init__(self, trace: "Trace", name: str, kind: str, parent_id: str | None, attributes: dict | None):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def set(self, attributes: dict):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        self.trace.add(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": datetime.fromtimestamp(self.start_ns / 1e9, timezone.utc).isoformat(),
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+            "service": TRACING_SERVICE_NAME,
+        }
+
+
+class Trace:
+    """
+    The spans of one trace recorded in this process, exported together when its first span here ends.
+    """
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans = []
+        self.root = None
+        self.dropped = 0
+
+    def add(self, finished: Span):
+        if len(self.spans) < MAX_SPANS or finished is self.root:
+            self.spans.append(finished)
+        else:
+            self.dropped += 1
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """
+    The trace id, parent span id and sampled flag of a W3C traceparent header, or None if it isn't valid.
+    """
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def current_span() -> Span | None:
+    return _span.get()
+
+
+def annotate(attributes: dict):
+    """
+    Adds attributes to the current span, if there is one.
+    """
+    current = _span.get()
+    if current is not None:
+        current.set(attributes)
+
+
+def current_traceparent() -> str | None:
+    current = _span.get()
+    return current.traceparent if current is not None else None
+
+
+@contextmanager
+def _record(trace: Trace, parent_id: str | None, name: str, kind: str, attributes: dict | None):
+    current = Span(trace, name, kind, parent_id, attributes)
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _span.reset(token)
+        current.end()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", attributes: dict = None):
+    """
+    Records the block as a span of the current trace, if there is one. Can also be used as a decorator.
+    """
+    parent = _span.get()
+    if parent is None:
+        yield None
+        return
+    with _record(parent.trace, parent.span_id, name, kind, attributes) as current:
+        yield current
+
+
+def trace_query(execute, sql, params, many, context):
+    attributes = {"db.system": context["connection"].vendor, "db.statement": sql[:1000]}
+    with span(f"db {sql.split(None, 1)[0].upper() if sql else 'query'}", "client", attributes):
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def start_trace(name: str, kind: str, traceparent: str = None, attributes: dict = None):
+    """
+    Starts a trace for a request or task, continuing the caller's if traceparent is given.
+    Within a trace already, such as a task run eagerly by a traced request, it is a span of that trace.
+    Yields the root span, or None if the trace isn't sampled.
+    """
+    parent = parse_traceparent(traceparent)
+    if not TRACING_EXPORTER or (parent is None and _span.get() is not None):
+        with span(name, kind, attributes) as current:
+            yield current
+        return
+
+    sampled = parent[2] if parent is not None else TRACING_SAMPLE_RATE and random.random() < TRACING_SAMPLE_RATE
+    if not sampled:
+        yield None
+        return
+
+    trace = Trace(parent[0] if parent is not None else secrets.token_hex(16))
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(trace_query))
+            trace.root = stack.enter_context(_record(trace, parent[1] if parent is not None else None, name, kind, attributes))
+            yield trace.root
+    finally:
+        if trace.dropped:
+            trace.root.set({"trace.dropped_spans": trace.dropped})
+        export(trace.spans)
+
+
+class TracingMiddleware:
+    """
+    Traces requests, see the top of this module.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        attributes = {"http.method": request.method, "http.target": request.path}
+        with start_trace(f"{request.method} {request.path}", "server", request.headers.get("traceparent"), attributes) as root:
+            response = self.get_response(request)
+            if root is not None:
+                match = getattr(request, "resolver_match", None)
+                if match is not None:
+                    root.name = f"{request.method} {match.view_name or match._func_path}"
+                    root.set({"http.route": match.route})
+                user = getattr(request, "user", None)
+                if user is not None and user.is_authenticated:
+                    root.set({"enduser.id": user.id})
+                root.set({"http.status_code": response.status_code})
+                if response.status_code >= 500:
+                    root.fail(f"HTTP {response.status_code}")
+        return response
+
+
+class FileExporter:
+    """
+    Appends spans to a file as json lines.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, spans: list[Span]):
+        lines = "".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans)
+        with self.lock, open(self.path, "a") as f:
+            f.write(lines)
+
+    def flush(self):
+        pass
+
+
+class CollectorExporter:
+    """
+    Sends spans to an OpenTelemetry collector in the background, so requests don't wait on it.
+    Spans are dropped if the collector can't keep up or can't be reached.
+    """
+
+    batch_size = 512
+    interval = 5
+
+    def __init__(self, url: str, max_queued: int = 10000):
+        self.url = url
+        self.queue = queue.Queue(max_queued)
+        self.dropped = 0
+        threading.Thread(target=self.run, name="trace-exporter", daemon=True).start()
+
+    def export(self, spans: list[Span]):
+        for s in spans:
+            try:
+                self.queue.put_nowait(s)
+            except queue.Full:
+                self.dropped += 1
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.send(batch)
+
+    def send(self, batch: list[Span]):
+        try:
+            response = requests.post(self.url, json=otlp(batch), timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"Could not export {len(batch)} spans to {self.url}: {e}")
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self):
+        self.queue.join()
+
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp(spans: list[Span]) -> dict:
+    """
+    Spans in the OTLP/HTTP json format.
+    """
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACING_SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": __name__},
+            "spans": [{
+                "traceId": s.trace.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": KINDS[s.kind],
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": key, "value": otlp_value(value)} for key, value in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+_exporter = None
+_exporter_pid = None
+_exporter_lock = threading.Lock()
+
+
+def exporter():
+    """
+    This process's exporter. Made on first use, and again in forked processes, which don't inherit the export thread.
+    """
+    global _exporter, _exporter_pid
+    with _exporter_lock:
+        if _exporter is None or _exporter_pid != os.getpid():
+            if TRACING_EXPORTER == "file":
+                _exporter = FileExporter(TRACING_FILE)
+            elif TRACING_EXPORTER == "collector":
+                _exporter = CollectorExporter(TRACING_COLLECTOR_URL)
+            else:
+                raise ValueError(f"Unknown TRACING_EXPORTER {TRACING_EXPORTER}")
+            _exporter_pid = os.getpid()
+        return _exporter
+
+
+def export(spans: list[Span]):
+    if not spans:
+        return
+    try:
+        exporter().export(spans)
+    except Exception as e:
+        logger.warning(f"Could not export {len(spans)} spans: {e}")
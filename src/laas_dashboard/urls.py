@@ -42,7 +42,8 @@ urlpatterns = [
     path('api/', include('api.urls')),
     path('oidc/', include('mozilla_django_oidc.urls')),
     path('resource/', include('resource_inventory.urls', namespace='resource')),
-    path('liblaas/', include('liblaas.urls', namespace='liblaas'))
+    path('liblaas/', include('liblaas.urls', namespace='liblaas')),
+    path('analytics/', include('analytics.urls', namespace='analytics'))
 ]
 
 handler404 = 'dashboard.views.handler404'
@@ -0,0 +1,15 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+from django.contrib import admin
+
+from liblaas.models import Job, OutboxEntry
+
+admin.site.register(OutboxEntry)
+admin.site.register(Job)
@@ -9,16 +9,21 @@
 
 # HTTP Requests from the user will need to be processed here first, before the appropriate liblaas endpoint is called
 
-from account.models import UserProfile
 from liblaas.views import *
-from liblaas.utils import find_invalid_collaborators
-from django.http import JsonResponse, HttpResponse
-from django.contrib.auth.models import User
+import logging
+import time
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from booking.lib import create_booking
 from booking.models import Booking
-from account.models import Lab
-from django.utils import timezone
-from datetime import timedelta
-from laas_dashboard.settings import PROJECT
+from laas_dashboard.settings import JOB_EVENTS_TIMEOUT
+from liblaas.jobs import submit, submit_reimage, describe_reimage_batch
+from liblaas.models import Job
+from liblaas.utils import get_booking_instance_ids, get_power_states
+from liblaas.outbox import OutboxEntry
+
+logger = logging.getLogger(__name__)
+
+
 def request_list_flavors(request, lab_name) -> HttpResponse:
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
@@ -30,8 +35,7 @@ def request_list_template(request, lab_name) -> HttpResponse:
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
 
-    uid = UserProfile.objects.get(user=request.user)
-    uid = uid.ipa_username
+    uid = request.user_profile.ipa_username
 
     response = template_list_templates(uid, lab_name)
     return JsonResponse(status=200, data={"templates_list": response})
@@ -44,8 +48,11 @@ def request_create_template(request) -> HttpResponse:
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
     
-    data["template_blob"]["owner"] = UserProfile.objects.get(user=request.user).ipa_username
-    print("Sending request to make template:", data)
+    data["template_blob"]["owner"] = request.user_profile.ipa_username
+    logger.info(
+        "Making a template",
+        extra={"fields": {"owner": data["template_blob"]["owner"], "template": data["template_blob"].get("pod_name")}},
+    )
     response = template_make_template(data["template_blob"])
     return JsonResponse(status=200, data={"uuid": response})
 
@@ -60,71 +67,17 @@ def request_create_booking(request) -> HttpResponse:
     
     data = data["booking_blob"]
 
-    # Warnings are issues that won't affect the booking's ability to provision, but may lead to unexpected behavior for the user
-    warnings: list[str] = []
-
-    collab_profiles = [UserProfile.objects.get(user=User.objects.get(username=dashboard_username)) for dashboard_username in data["allowed_users"]]
-
-    invalid_collaborators: list[UserProfile] = find_invalid_collaborators(collab_profiles)
-
-    for ic in invalid_collaborators:
-        warnings.append(f"Unable to find SSH key for {str(ic)}. VPN access will be added, but no user will be created on the booked resource(s).")
-
-    # Assume there is an ipa username linked
-    ipa_users = [p.ipa_username for p in collab_profiles]
-
-    # Add the owner
-    ipa_users.append(UserProfile.objects.get(user=request.user).ipa_username)
-
-    # Reformat post data
-    bookingBlob = {
-    "template_id": data["template_id"],
-    "allowed_users": ipa_users,
-    "global_cifile": data["global_cifile"],
-    "metadata": {
-        "booking_id": None, # fill in after creating django object
-        "owner": UserProfile.objects.get(user=request.user).ipa_username,
-        "lab": PROJECT,
-        "purpose": data["metadata"]["purpose"],
-        "project": data["metadata"]["project"],
-        "details": data["metadata"]["details"],
-        "length": int(data["metadata"]["length"])
-    },
-    "origin": PROJECT
-    }
-
-    # Create booking in dashboard
-    booking = Booking.objects.create(
-    purpose=bookingBlob["metadata"]["purpose"],
-    project=bookingBlob["metadata"]['project'],
-    details=bookingBlob["metadata"]["details"],
-    lab=Lab.objects.get(name='UNH_IOL'),
-    owner=request.user,
-    start=timezone.now(),
-    end=timezone.now() + timedelta(days=int(bookingBlob["metadata"]['length'])),
+    booking, warnings = create_booking(
+        owner_profile=request.user_profile,
+        template_id=data["template_id"],
+        collaborators=list(data["allowed_users"]),
+        global_cifile=data["global_cifile"],
+        purpose=data["metadata"]["purpose"],
+        project=data["metadata"]["project"],
+        details=data["metadata"]["details"],
+        length=int(data["metadata"]["length"]),
     )
 
-    for c in list(data["allowed_users"]):
-        booking.collaborators.add(User.objects.get(username=c))
-
-    # Create booking in liblaas
-    bookingBlob["metadata"]["booking_id"] = str(booking.id)
-    liblaas_response = booking_create_booking(bookingBlob)
-    if not liblaas_response:
-        print("received non success from liblaas, deleting booking from dashboard")
-        booking.delete()
-        return JsonResponse(
-            data={},
-            status=500,
-            safe=False
-        )
-
-    aggregateId = liblaas_response
-    booking.aggregateId = aggregateId
-    booking.save()
-
-    print(f"Created new booking with id {booking.id} and aggregate {aggregateId}")
-
     return JsonResponse(
         data = {
             "bookingId": booking.id,
@@ -136,7 +89,7 @@ def request_create_booking(request) -> HttpResponse:
 
 def request_migrate_new(request) -> HttpResponse:
     user = request.user
-    profile = UserProfile.objects.get(user=user)
+    profile = request.user_profile
 
     data = json.loads(request.body.decode('utf-8'))
     fn = data["firstname"].strip()
@@ -171,8 +124,7 @@ def request_migrate_new(request) -> HttpResponse:
     )
 
 def request_migrate_conflict(request) -> HttpResponse:
-    user = request.user
-    profile = UserProfile.objects.get(user=user)
+    profile = request.user_profile
 
     data = json.loads(request.body.decode('utf-8'))
     fn = data["firstname"].strip()
@@ -224,7 +176,7 @@ def request_set_company(request):
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
     
-    up = UserProfile.objects.get(user=request.user)
+    up = request.user_profile
     success = user_set_company(up.ipa_username, data["data"].strip())
 
     if (success):
@@ -242,7 +194,7 @@ def request_set_ssh(request):
 
     if not request.user.is_authenticated:
         return HttpResponse(status=401)
-    up = UserProfile.objects.get(user=request.user)
+    up = request.user_profile
     success = user_set_ssh(up.ipa_username, data["data"])
     
     if (success):
@@ -255,35 +207,158 @@ def request_set_ssh(request):
     )
 
 def request_ipmi_setpower(request, host_id) -> HttpResponse:
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
     data = json.loads(request.body.decode('utf-8'))
 
-    success = booking_ipmi_setpower(host_id, data)
+    # the BMC can take a long time to answer, so this is run by a celery worker
+    job, _ = submit("ipmi_setpower", host_id, data, user=request.user)
+
+    return JsonResponse(
+        data = job.to_dict(),
+        status = 202,
+    )
 
-    if (success is None):
-        return HttpResponse(status=500)
-    else:
-        return JsonResponse(
-            data = success,
-            status = 200,
-        )
 def request_ipmi_getpower(request, host_id) -> HttpResponse:
-    success = booking_ipmi_getpower(host_id)
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
+    job, _ = submit("ipmi_getpower", host_id, {}, user=request.user)
+
+    return JsonResponse(
+        data = job.to_dict(),
+        status = 202,
+    )
+
+def request_booking_power_status(request, booking_id) -> HttpResponse:
+    """
+    Returns the power status of every instance in a booking in one call.
+    Statuses are shared between viewers for a few seconds, see get_power_states().
+    """
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
+    booking = Booking.objects.filter(id=booking_id).first()
+    if booking is None:
+        return HttpResponse(status=404)
+
+    if not (
+        request.user == booking.owner
+        or request.user.is_superuser
+        or booking.collaborators.filter(id=request.user.id).exists()
+    ):
+        return HttpResponse(status=403)
 
-    if (success is None):
+    if not booking.aggregateId:
+        return JsonResponse(status=200, data={"instances": {}})
+
+    instance_ids = get_booking_instance_ids(booking.aggregateId)
+    if instance_ids is None:
         return HttpResponse(status=500)
-    else:
-        return JsonResponse(
-            data = success,
-            status = 200,
-        )
-    
+
+    return JsonResponse(status=200, data={"instances": get_power_states(instance_ids)})
+
+def request_job_status(request, job_id) -> HttpResponse:
+    # Jobs are shared between users that submit the same command, so the (random) job id is what grants access
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
+    job = Job.objects.filter(id=job_id).first()
+    if job is None:
+        return HttpResponse(status=404)
+
+    return JsonResponse(status=200, data=job.to_dict())
+
+def request_job_events(request, job_id) -> HttpResponse:
+    """
+    Server-sent events for a job. Sends the job whenever its status changes, and closes once it is finished.
+    The stream is closed after JOB_EVENTS_TIMEOUT seconds, EventSource reconnects on its own.
+    """
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
+    if not Job.objects.filter(id=job_id).exists():
+        return HttpResponse(status=404)
+
+    def events():
+        last_status = None
+        deadline = time.monotonic() + JOB_EVENTS_TIMEOUT
+        while time.monotonic() < deadline:
+            job = Job.objects.get(id=job_id)
+            if job.status != last_status:
+                last_status = job.status
+                yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if job.is_finished():
+                return
+            time.sleep(1)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
 def request_image_set(request, host_id) -> HttpResponse:
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
     data = json.loads(request.body.decode('utf-8'))
-    success = booking_set_image(host_id, data)
-    
-    if (success.get("code") == 200):
-        return HttpResponse(status=200)
-    else:
-        return HttpResponse(
-            status = 500,
-        )
\ No newline at end of file
+
+    job, _ = submit("reimage", host_id, {"image": data}, user=request.user)
+
+    return JsonResponse(status=202, data=job.to_dict())
+
+def request_booking_reimage(request, booking_id) -> HttpResponse:
+    """
+    Reimages several instances of a booking in one request.
+    Expects {"instances": {instance_id: image_id}}, returns the batch of jobs, see request_reimage_batch_status().
+    """
+    if request.method != "POST":
+        return HttpResponse(status=405)
+
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
+    booking = Booking.objects.filter(id=booking_id).first()
+    if booking is None:
+        return HttpResponse(status=404)
+
+    if booking.owner != request.user:
+        return HttpResponse(status=403)
+
+    data = json.loads(request.body.decode('utf-8'))
+    images = data.get("instances")
+    if not images or not isinstance(images, dict):
+        return HttpResponse(status=422)
+
+    instance_ids = get_booking_instance_ids(booking.aggregateId) if booking.aggregateId else []
+    if instance_ids is None:
+        return HttpResponse(status=500)
+    if not set(images).issubset(instance_ids):
+        return JsonResponse(status=422, data={"message": "Instances do not belong to this booking"})
+
+    batch, jobs = submit_reimage(
+        booking, {instance_id: {"image_id": image_id} for instance_id, image_id in images.items()}, user=request.user
+    )
+
+    return JsonResponse(status=202, data={"batch": str(batch), "jobs": [job.to_dict() for job in jobs]})
+
+def request_reimage_batch_status(request, batch_id) -> HttpResponse:
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
+    jobs = list(Job.objects.filter(batch=batch_id))
+    if not jobs:
+        return HttpResponse(status=404)
+
+    return JsonResponse(status=200, data={"batch": str(batch_id), "jobs": describe_reimage_batch(jobs)})
+
+def request_outbox_status(request, idempotency_key) -> HttpResponse:
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
+    entry = OutboxEntry.objects.filter(idempotency_key=idempotency_key).first()
+    if entry is None or (entry.created_by != request.user and not request.user.is_superuser):
+        return HttpResponse(status=404)
+
+    return JsonResponse(status=200, data=entry.to_dict())
\ No newline at end of file
@@ -0,0 +1,207 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Jobs for LibLaaS calls that are too slow to make from a web worker.
+# submit() records a Job and hands it to the run_job celery task, the caller gets the job back straight away
+# and the user polls (or streams) its status.
+
+import json
+import uuid
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from laas_dashboard.settings import JOB_TIMEOUT
+from liblaas.models import Job, JobStatus
+from liblaas.utils import forget_power_state
+from liblaas.views import booking_booking_status, booking_ipmi_getpower, booking_ipmi_setpower, booking_set_image
+
+
+def dedupe_key(kind: str, instance_id: str, payload: dict) -> str:
+    return f"{kind}:{instance_id}:{json.dumps(payload, sort_keys=True)}"
+
+
+def submit(kind: str, instance_id: str, payload: dict, user=None, batch=None) -> tuple[Job, bool]:
+    """
+    Queues a job, unless an identical job for the same instance is already queued.
+    Jobs that only read state (see READ_ONLY) are also shared with an identical job that is already running.
+    Returns the job and whether it was newly queued.
+    """
+    if kind not in JOBS:
+        raise ValueError(f"Unknown job {kind}")
+
+    key = dedupe_key(kind, instance_id, payload)
+    shared_statuses = [JobStatus.QUEUED, JobStatus.RUNNING] if kind in READ_ONLY else [JobStatus.QUEUED]
+
+    existing = Job.objects.filter(dedupe_key=key, status__in=shared_statuses).first()
+    if existing is not None:
+        return (existing, False)
+
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(
+                kind=kind, instance_id=instance_id, payload=payload, dedupe_key=key, created_by=user, batch=batch
+            )
+    except IntegrityError:
+        # an identical job was queued concurrently
+        existing = Job.objects.filter(dedupe_key=key, status=JobStatus.QUEUED).first()
+        if existing is not None:
+            return (existing, False)
+        raise
+
+    transaction.on_commit(lambda: start_job(job.id), robust=True)
+    return (job, True)
+
+
+def start_job(job_id):
+    # imported here since liblaas.tasks imports this module
+    from liblaas.tasks import run_job
+    run_job.delay(str(job_id))
+
+
+def run(job_id) -> Job | None:
+    """
+    Runs a queued job and records the outcome.
+    Returns None if the job doesn't exist or was already picked up by another worker.
+    """
+    claimed = Job.objects.filter(id=job_id, status=JobStatus.QUEUED).update(
+        status=JobStatus.RUNNING, started=timezone.now()
+    )
+    if not claimed:
+        return None
+
+    job = Job.objects.get(id=job_id)
+    try:
+        success, result, error = JOBS[job.kind](job)
+    except Exception as e:
+        success, result, error = False, None, str(e)
+
+    job.status = JobStatus.SUCCEEDED if success else JobStatus.FAILED
+    job.result = result
+    job.error = error
+    job.finished = timezone.now()
+    job.save()
+    return job
+
+
+def submit_reimage(booking, images: dict[str, dict], user=None) -> tuple[uuid.UUID, list[Job]]:
+    """
+    Queues a reimage job for each instance of the booking in images (instance id -> image blob), as one batch.
+    An instance that already has the same reimage queued keeps that job (and its batch), which is returned in its place.
+    Returns the batch id and the jobs.
+    """
+    batch = uuid.uuid4()
+    return (batch, [
+        submit("reimage", instance_id, {"booking_id": booking.id, "image": image}, user=user, batch=batch)[0]
+        for instance_id, image in images.items()
+    ])
+
+
+def reimage_progress(jobs: list[Job]) -> dict[str, dict]:
+    """
+    Returns the progress of each of the given reimage jobs, by job id.
+
+    Progress is read from the instance's status log in LibLaaS: only entries logged after the job was sent count,
+    the job records how many entries there were before (see run_reimage). Each booking's status is fetched once.
+    state is one of queued, running (being sent to LibLaaS), deploying, succeeded or failed.
+    """
+    statuses = {}
+    progress = {}
+    for job in jobs:
+        booking_id = job.payload.get("booking_id")
+        if job.status != JobStatus.SUCCEEDED or booking_id is None:
+            progress[str(job.id)] = {"state": job.status, "logs": []}
+            continue
+
+        if booking_id not in statuses:
+            booking = apps.get_model("booking", "Booking").objects.filter(id=booking_id).first()
+            statuses[booking_id] = (booking_booking_status(booking.aggregateId) if booking and booking.aggregateId else None) or {}
+
+        instance = statuses[booking_id].get("instances", {}).get(job.instance_id, {})
+        logs = instance.get("logs", [])[(job.result or {}).get("log_offset", 0):]
+
+        state = "deploying"
+        if logs and "Success" in logs[-1].get("status", ""):
+            state = JobStatus.SUCCEEDED
+        elif logs and "Fail" in logs[-1].get("status", ""):
+            state = JobStatus.FAILED
+
+        progress[str(job.id)] = {"state": state, "logs": logs}
+
+    return progress
+
+
+def describe_reimage_batch(jobs: list[Job]) -> list[dict]:
+    progress = reimage_progress(jobs)
+    return [dict(job.to_dict(), progress=progress[str(job.id)]) for job in jobs]
+
+
+def expire_stale_jobs() -> int:
+    """
+    Fails jobs that have been queued or running for longer than JOB_TIMEOUT, i.e. because a worker died.
+    Otherwise a lost job would keep absorbing identical submissions forever.
+    Returns the number of jobs failed.
+    """
+    cutoff = timezone.now() - JOB_TIMEOUT
+    return Job.objects.filter(
+        status__in=[JobStatus.QUEUED, JobStatus.RUNNING], created__lt=cutoff
+    ).update(status=JobStatus.FAILED, error="Timed out", finished=timezone.now())
+
+
+# --- JOBS ---
+# Each job takes the Job being run and returns (success, result, error).
+
+def run_setpower(job: Job) -> tuple[bool, object, str]:
+    # booking_id only ties the job to the booking it was submitted through, LibLaaS gets the command alone
+    command = {key: value for key, value in job.payload.items() if key != "booking_id"}
+    response = booking_ipmi_setpower(job.instance_id, command)
+    # whatever happened, the cached power state can't be trusted any more
+    forget_power_state(job.instance_id)
+    if response is None:
+        return (False, None, "No response from LibLaaS")
+    return (True, response, "")
+
+
+def run_getpower(job: Job) -> tuple[bool, object, str]:
+    response = booking_ipmi_getpower(job.instance_id)
+    if response is None:
+        return (False, None, "No response from LibLaaS")
+    return (True, response, "")
+
+
+def run_reimage(job: Job) -> tuple[bool, object, str]:
+    # remember where the instance's log stood, so progress only shows what this reimage logged
+    log_offset = 0
+    booking = apps.get_model("booking", "Booking").objects.filter(id=job.payload.get("booking_id")).first()
+    if booking is not None and booking.aggregateId:
+        status = booking_booking_status(booking.aggregateId) or {}
+        log_offset = len(status.get("instances", {}).get(job.instance_id, {}).get("logs", []))
+
+    # keyed on the job, so a reimage resent after a lost response isn't run twice by LibLaaS
+    response = booking_set_image(job.instance_id, job.payload["image"], idempotency_key=f"job:{job.id}")
+    if response is None:
+        return (False, None, "No response from LibLaaS")
+    if response.get("code") != 200:
+        return (False, response, "LibLaaS failed to reimage the instance")
+
+    # imported here since booking.models imports liblaas
+    from booking.instances import record_reimage
+    record_reimage(job.instance_id, job.payload["image"].get("image_id", ""))
+    return (True, {"log_offset": log_offset, "response": response}, "")
+
+
+JOBS = {
+    "ipmi_setpower": run_setpower,
+    "ipmi_getpower": run_getpower,
+    "reimage": run_reimage,
+}
+
+# jobs that don't change anything, so a running job's answer is as good as a new one
+READ_ONLY = {"ipmi_getpower"}
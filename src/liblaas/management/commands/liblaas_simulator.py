@@ -0,0 +1,25 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+from django.core.management.base import BaseCommand, CommandError
+
+from liblaas.simulator import add_arguments, serve
+
+
+class Command(BaseCommand):
+    help = "Serves a local stand-in for LibLaaS, with configurable latency, errors and hangs per endpoint"
+
+    def add_arguments(self, parser):
+        add_arguments(parser)
+
+    def handle(self, *args, **options):
+        try:
+            serve(options, out=self.stdout.write)
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
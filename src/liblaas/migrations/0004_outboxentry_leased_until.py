@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-19 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('liblaas', '0003_job_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxentry',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
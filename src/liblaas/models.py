@@ -0,0 +1,164 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxStatus(object):
+    """
+    A Poor man's enum for the delivery status of an OutboxEntry.
+
+    PENDING entries are waiting to be (re)delivered to LibLaaS.
+    DELIVERED entries were accepted by LibLaaS.
+    FAILED entries ran out of attempts and need an admin to look at them.
+    """
+
+    PENDING = "pending"
+    DELIVERED = "delivered"
+    FAILED = "failed"
+
+    CHOICES = [(PENDING, "Pending"), (DELIVERED, "Delivered"), (FAILED, "Failed")]
+
+
+class OutboxEntry(models.Model):
+    """
+    A mutating LibLaaS call that has been committed in the dashboard but may not have reached LibLaaS yet.
+
+    Entries are written in the same transaction as the dashboard change they belong to (see liblaas.outbox.enqueue)
+    and delivered by the relay_outbox celery task, in order per aggregate_key.
+    """
+
+    # the dashboard object the call belongs to (i.e. "booking:12"), calls for the same key are delivered in order
+    aggregate_key = models.CharField(max_length=100)
+    # name of the operation in liblaas.outbox.OPERATIONS
+    operation = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # sent to LibLaaS as the Idempotency-Key header, so redelivering an entry is safe
+    idempotency_key = models.CharField(max_length=200, unique=True, default=uuid.uuid4)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+
+    status = models.CharField(max_length=20, choices=OutboxStatus.CHOICES, default=OutboxStatus.PENDING)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    result = models.JSONField(null=True, blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # set while a relay is delivering the entry, so other relays leave it alone until then
+    leased_until = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'liblaas_outbox'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'aggregate_key', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.operation} for {self.aggregate_key} ({self.status})"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "idempotency_key": str(self.idempotency_key),
+            "aggregate": self.aggregate_key,
+            "operation": self.operation,
+            "status": self.status,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "result": self.result,
+            "created": self.created.isoformat() if self.created else None,
+            "delivered_at": self.delivered_at.isoformat() if self.delivered_at else None,
+        }
+
+
+class JobStatus(object):
+    """
+    A Poor man's enum for the state of a Job.
+
+    QUEUED jobs are waiting for a celery worker.
+    RUNNING jobs are waiting on LibLaaS.
+    SUCCEEDED and FAILED jobs are finished, see Job.result and Job.error.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (SUCCEEDED, "Succeeded"), (FAILED, "Failed")]
+    FINISHED = [SUCCEEDED, FAILED]
+
+
+class Job(models.Model):
+    """
+    A slow LibLaaS call (i.e. one that waits on a BMC) that is run by a celery worker instead of a web worker.
+
+    The id is handed back to the user, who polls liblaas/job/<id>/ for the outcome. See liblaas.jobs.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # name of the job in liblaas.jobs.JOBS
+    kind = models.CharField(max_length=50)
+    instance_id = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # jobs submitted together in one request (i.e. reimaging a whole booking) share a batch
+    batch = models.UUIDField(null=True, blank=True, db_index=True)
+    # identical jobs share a key, only one queued job may exist per key
+    dedupe_key = models.CharField(max_length=300)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+
+    status = models.CharField(max_length=20, choices=JobStatus.CHOICES, default=JobStatus.QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'liblaas_job'
+        ordering = ['created']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status=JobStatus.QUEUED),
+                name='unique_queued_job',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['instance_id', 'created']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.instance_id} ({self.status})"
+
+    def is_finished(self) -> bool:
+        return self.status in JobStatus.FINISHED
+
+    def to_dict(self) -> dict:
+        return {
+            "id": str(self.id),
+            "kind": self.kind,
+            "batch": str(self.batch) if self.batch else None,
+            "instance_id": self.instance_id,
+            "payload": self.payload,
+            "status": self.status,
+            "finished": self.is_finished(),
+            "result": self.result,
+            "error": self.error,
+            "created": self.created.isoformat() if self.created else None,
+            "started": self.started.isoformat() if self.started else None,
+            "finished_at": self.finished.isoformat() if self.finished else None,
+        }
@@ -0,0 +1,293 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Transactional outbox for mutating LibLaaS calls.
+# Views and tasks make their dashboard change and call enqueue() in the same transaction, then return.
+# The relay_outbox celery task delivers the queued calls to LibLaaS, in order per aggregate, with retries.
+
+import logging
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from laas_dashboard.settings import OUTBOX_LEASE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY
+from laas_dashboard.tracing import annotate, span
+from liblaas.models import OutboxEntry, OutboxStatus
+from liblaas.views import (
+    booking_create_booking,
+    booking_end_booking,
+    booking_notify_aggregate_expiring,
+    booking_request_extension,
+    user_add_users,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def booking_key(booking_id: int) -> str:
+    return f"booking:{booking_id}"
+
+
+@span("outbox.enqueue")
+def enqueue(aggregate_key: str, operation: str, payload: dict, idempotency_key: str = None, user=None) -> OutboxEntry:
+    """
+    Queues a LibLaaS call to be delivered after the current transaction commits.
+    Call this inside the same transaction as the dashboard change it belongs to, so that either both or neither are saved.
+
+    If idempotency_key is given and an entry already exists for it, that entry is returned instead of queueing a duplicate.
+    A FAILED entry is queued again in that case.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown outbox operation {operation}")
+    annotate({"outbox.aggregate_key": aggregate_key, "outbox.operation": operation})
+
+    fields = {
+        "aggregate_key": aggregate_key,
+        "operation": operation,
+        "payload": payload,
+        "created_by": user,
+    }
+
+    if idempotency_key is None:
+        entry = OutboxEntry.objects.create(**fields)
+    else:
+        entry, created = OutboxEntry.objects.get_or_create(idempotency_key=idempotency_key, defaults=fields)
+        if not created and entry.status == OutboxStatus.FAILED:
+            entry.status = OutboxStatus.PENDING
+            entry.attempts = 0
+            entry.next_attempt_at = timezone.now()
+            entry.save()
+
+    transaction.on_commit(start_relay, robust=True)
+    return entry
+
+
+def start_relay():
+    # imported here since liblaas.tasks imports this module
+    from liblaas.tasks import relay_outbox
+    relay_outbox.delay()
+
+
+def relay(batch_size: int = 50) -> int:
+    """
+    Delivers due PENDING entries, oldest first.
+    An entry is only delivered once every older PENDING entry for the same aggregate has been delivered or has failed.
+    Returns the number of entries delivered.
+    """
+    delivered = 0
+    while delivered < batch_size:
+        heads = due_entry_ids(batch_size - delivered)
+        if not heads:
+            break
+
+        delivered_now = sum(1 for entry_id in heads if deliver(entry_id))
+        if delivered_now == 0:
+            break
+        delivered += delivered_now
+
+    return delivered
+
+
+def unleased(now) -> Q:
+    return Q(leased_until__isnull=True) | Q(leased_until__lte=now)
+
+
+def due_entry_ids(limit: int) -> list[int]:
+    now = timezone.now()
+    older_pending = OutboxEntry.objects.filter(
+        aggregate_key=OuterRef("aggregate_key"),
+        status=OutboxStatus.PENDING,
+        id__lt=OuterRef("id"),
+    )
+    return list(
+        OutboxEntry.objects.filter(unleased(now), status=OutboxStatus.PENDING, next_attempt_at__lte=now)
+        .exclude(Exists(older_pending))
+        .order_by("id")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+@span("outbox.deliver")
+def deliver(entry_id: int) -> bool:
+    """
+    Makes one delivery attempt for the given entry and records the outcome.
+    The entry is leased for OUTBOX_LEASE in a short transaction, so concurrent relays skip it, and the call to LibLaaS
+    is made outside of any transaction. A relay that dies mid delivery leaves the entry to be retried once the lease is up.
+    Returns True if the entry was delivered.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        entry = (
+            OutboxEntry.objects.select_for_update(skip_locked=True)
+            .filter(unleased(now), id=entry_id, status=OutboxStatus.PENDING)
+            .first()
+        )
+        if entry is None:
+            return False
+        entry.attempts += 1
+        entry.leased_until = now + OUTBOX_LEASE
+        entry.save(update_fields=["attempts", "leased_until"])
+
+    annotate({
+        "outbox.entry_id": entry.id,
+        "outbox.aggregate_key": entry.aggregate_key,
+        "outbox.operation": entry.operation,
+        "outbox.attempt": entry.attempts,
+    })
+    try:
+        success, result, error = OPERATIONS[entry.operation](entry)
+    except Exception as e:
+        success, result, error = False, None, str(e)
+
+    with transaction.atomic():
+        # the call outlasted the lease and another relay has tried the entry since, its outcome is the one kept
+        if not OutboxEntry.objects.select_for_update().filter(id=entry.id, attempts=entry.attempts, status=OutboxStatus.PENDING).exists():
+            logger.warning(f"Lost the lease on {entry} while delivering it", extra={"fields": entry_fields(entry)})
+            return False
+
+        entry.leased_until = None
+        entry.result = result
+        annotate({"outbox.delivered": success})
+        if success:
+            entry.status = OutboxStatus.DELIVERED
+            entry.delivered_at = timezone.now()
+            entry.last_error = ""
+        else:
+            logger.warning(f"Failed to deliver {entry} on attempt {entry.attempts}: {error}", extra={"fields": entry_fields(entry, error=error)})
+            entry.last_error = error
+            if entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+                entry.status = OutboxStatus.FAILED
+                if entry.operation in FAILURE_HANDLERS:
+                    try:
+                        with transaction.atomic():
+                            FAILURE_HANDLERS[entry.operation](entry)
+                    except Exception:
+                        logger.exception(f"Failure handler for {entry} raised", extra={"fields": entry_fields(entry)})
+            else:
+                entry.next_attempt_at = timezone.now() + OUTBOX_RETRY_DELAY * (2 ** (entry.attempts - 1))
+
+        entry.save()
+
+    if success:
+        logger.info(f"Delivered {entry}", extra={"fields": entry_fields(entry)})
+    elif entry.status == OutboxStatus.FAILED:
+        logger.error(f"Gave up delivering {entry} after {entry.attempts} attempts", extra={"fields": entry_fields(entry, error=error)})
+    return success
+
+
+def entry_fields(entry: OutboxEntry, **fields) -> dict:
+    return {
+        "outbox_entry_id": entry.id,
+        "aggregate_key": entry.aggregate_key,
+        "operation": entry.operation,
+        "attempt": entry.attempts,
+        **fields,
+    }
+
+
+# --- OPERATIONS ---
+# Each operation takes the entry being delivered and returns (success, result, error).
+# Booking operations look the booking up at delivery time, so they use the aggregate id
+# assigned by an earlier booking_create_booking entry for the same booking.
+
+def get_booking(entry: OutboxEntry):
+    return apps.get_model("booking", "Booking").objects.get(id=entry.payload["booking_id"])
+
+
+def deliver_create_booking(entry: OutboxEntry) -> tuple[bool, object, str]:
+    booking = get_booking(entry)
+    if booking.aggregateId:
+        return (True, booking.aggregateId, "")
+
+    aggregate_id = booking_create_booking(entry.payload["blob"], idempotency_key=entry.idempotency_key)
+    if not aggregate_id:
+        return (False, None, "LibLaaS did not return an aggregate")
+
+    # update() rather than save() so the pre_save handler doesn't re-fetch the booking
+    type(booking).objects.filter(id=booking.id).update(aggregateId=aggregate_id)
+    logger.info(f"Booking {booking.id} is aggregate {aggregate_id} in LibLaaS", extra={"fields": {"booking_id": booking.id, "aggregate_id": aggregate_id}})
+    return (True, aggregate_id, "")
+
+
+def on_create_booking_failed(entry: OutboxEntry):
+    # the booking was never provisioned, so don't leave it looking active
+    booking = get_booking(entry)
+    booking.complete = True
+    booking.save()
+
+
+def deliver_end_booking(entry: OutboxEntry) -> tuple[bool, object, str]:
+    booking = get_booking(entry)
+    if not booking.aggregateId:
+        return (True, None, "Booking has no aggregate, nothing to end")
+
+    result = booking_end_booking(booking.aggregateId, idempotency_key=entry.idempotency_key)
+    if result is None:
+        return (False, None, "No response from LibLaaS")
+    if result.get("success") is True:
+        return (True, result, "")
+    return (False, result, str(result.get("details", "")))
+
+
+def on_end_booking_failed(entry: OutboxEntry):
+    # LibLaaS still has the hosts, so reopen the booking: end_expired_bookings ends it again, which queues this entry again
+    booking = get_booking(entry)
+    booking.complete = False
+    booking.save()
+
+
+def deliver_add_users(entry: OutboxEntry) -> tuple[bool, object, str]:
+    booking = get_booking(entry)
+    if not booking.aggregateId:
+        return (True, None, "Booking has no aggregate, nothing to add users to")
+
+    collaborators = user_add_users(booking.aggregateId, entry.payload["users"], idempotency_key=entry.idempotency_key)
+    if collaborators is None:
+        return (False, None, "LibLaaS did not add the users")
+    return (True, collaborators, "")
+
+
+def deliver_request_extension(entry: OutboxEntry) -> tuple[bool, object, str]:
+    booking = get_booking(entry)
+    if not booking.aggregateId:
+        return (True, None, "Booking has no aggregate, nothing to extend")
+
+    success = booking_request_extension(
+        booking.aggregateId,
+        entry.payload["reason"],
+        entry.payload["date"],
+        idempotency_key=entry.idempotency_key,
+    )
+    return (success, None, "" if success else "LibLaaS rejected the extension request")
+
+
+def deliver_notify_expiring(entry: OutboxEntry) -> tuple[bool, object, str]:
+    booking = get_booking(entry)
+    if not booking.aggregateId:
+        return (True, None, "Booking has no aggregate, nobody to notify")
+
+    success = booking_notify_aggregate_expiring(booking.aggregateId, booking.end, idempotency_key=entry.idempotency_key)
+    return (success, None, "" if success else "LibLaaS did not send the notification")
+
+
+OPERATIONS = {
+    "booking_create_booking": deliver_create_booking,
+    "booking_end_booking": deliver_end_booking,
+    "user_add_users": deliver_add_users,
+    "booking_request_extension": deliver_request_extension,
+    "booking_notify_aggregate_expiring": deliver_notify_expiring,
+}
+
+# called when an entry runs out of attempts
+FAILURE_HANDLERS = {
+    "booking_create_booking": on_create_booking_failed,
+    "booking_end_booking": on_end_booking_failed,
+}
@@ -0,0 +1,633 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Local stand-in for LibLaaS, to benchmark and resilience test the dashboard on one machine.
+# Run it with `python manage.py liblaas_simulator` and point LIBLAAS_BASE_URL at it.
+#
+# It serves every endpoint liblaas.views calls, with the same paths and payloads, and keeps its flavors, hosts,
+# templates, users and bookings in memory. Booked hosts are provisioned over time: their logs grow by one entry
+# every provision_step_seconds until they succeed (or fail, at provision_failure_rate).
+#
+# Each endpoint, named after its function in liblaas.views, can be given a latency distribution, an error rate
+# and a hang rate, see DEFAULT_CONFIG. Random choices are seeded per endpoint, so a run can be repeated.
+# GET _simulator/stats counts the requests each endpoint served, POST _simulator/faults replaces the faults.
+#
+# Only the standard library is used, so this module can also be run without Django: python -m liblaas.simulator
+
+import argparse
+import copy
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONFIG = {
+    "seed": 0,
+    "flavors": [
+        {"name": "HPE x86 Gen10", "arch": "x86_64", "hosts": 12, "maintenance": 1},
+        {"name": "Ampere Altra", "arch": "aarch64", "hosts": 6, "maintenance": 0},
+        {"name": "Dell R740 GPU", "arch": "x86_64", "hosts": 2, "maintenance": 0},
+    ],
+    "images": ["Ubuntu 22.04", "Rocky 9", "EVE-NG"],
+    "provision_step_seconds": 20,  # seconds between provisioning log entries
+    "provision_failure_rate": 0.0,  # share of instances that fail to provision
+    "auto_create_users": True,  # unknown users are created, with an SSH key, the first time they are asked for
+    "faults": {
+        # applied to every endpoint, and overridden key by key for the endpoints listed after it, e.g.
+        # "booking_booking_status": {"latency": {"distribution": "uniform", "min_ms": 200, "max_ms": 2000}, "error_rate": 0.05}
+        "default": {
+            "latency": {"distribution": "lognormal", "median_ms": 40, "sigma": 0.5},
+            "error_rate": 0.0,  # share of requests answered with error_status
+            "error_status": 500,
+            "hang_rate": 0.0,  # share of requests held for hang_seconds, then dropped without a response
+            "hang_seconds": 300,
+        },
+    },
+}
+
+PROVISION_STEPS = [
+    "Allocated host",
+    "Configuring network",
+    "Mounting image",
+    "Booting host",
+    "Running cloud-init",
+]
+PROVISION_SUCCESS = "Success: host is provisioned"
+PROVISION_FAILURE = "Fail: host did not come up, contact the lab admins"
+
+# (method, path, endpoint), endpoints are named after their function in liblaas.views
+ROUTES = [
+    ("GET", r"docs", "liblaas_docs"),
+    ("POST", r"booking/create", "booking_create_booking"),
+    ("DELETE", r"booking/(?P<agg_id>[^/]+)/end", "booking_end_booking"),
+    ("GET", r"booking/(?P<agg_id>[^/]+)/status", "booking_booking_status"),
+    ("POST", r"booking/ipmi/(?P<instance_id>[^/]+)/setpower", "booking_ipmi_setpower"),
+    ("GET", r"booking/ipmi/(?P<instance_id>[^/]+)/powerstatus", "booking_ipmi_getpower"),
+    ("GET", r"booking/ipmi/(?P<instance_id>[^/]+)/getfqdn", "booking_ipmi_fqdn"),
+    ("POST", r"booking/(?P<agg_id>[^/]+)/notify/expiring", "booking_notify_aggregate_expiring"),
+    ("POST", r"booking/(?P<agg_id>[^/]+)/request-extension", "booking_request_extension"),
+    ("POST", r"booking/(?P<instance_id>[^/]+)/reimage", "booking_set_image"),
+    ("GET", r"flavor/(?P<project>[^/]+)", "flavor_list_flavors"),
+    ("GET", r"flavor/(?P<project>[^/]+)/hosts", "flavor_list_hosts"),
+    ("GET", r"template/list/(?P<project>[^/]+)/(?P<uid>[^/]+)", "template_list_templates"),
+    ("DELETE", r"template/(?P<template_id>[^/]+)", "template_delete_template"),
+    ("POST", r"template/(?P<project>[^/]+)/create", "template_make_template"),
+    ("POST", r"user/many", "user_get_many_users"),
+    ("POST", r"user/create", "user_create_user"),
+    ("GET", r"user/(?P<uid>[^/]+)", "user_get_user"),
+    ("POST", r"user/(?P<uid>[^/]+)/ssh", "user_set_ssh"),
+    ("POST", r"user/(?P<uid>[^/]+)/company", "user_set_company"),
+    ("POST", r"user/(?P<uid>[^/]+)/email", "user_set_email"),
+    ("POST", r"user/(?P<agg_id>[^/]+)/addusers", "user_add_users"),
+]
+ENDPOINTS = [endpoint for _, _, endpoint in ROUTES]
+COMPILED_ROUTES = [(method, re.compile(path), endpoint) for method, path, endpoint in ROUTES]
+
+# endpoints whose responses are replayed for a repeated Idempotency-Key
+IDEMPOTENT_ENDPOINTS = {
+    "booking_create_booking",
+    "booking_end_booking",
+    "booking_notify_aggregate_expiring",
+    "booking_request_extension",
+    "booking_set_image",
+    "user_add_users",
+}
+
+POWER_COMMANDS = {"PowerOn": "On", "PowerOff": "Off", "Restart": "On"}
+
+
+class Hang(Exception):
+    """
+    Raised to drop a request without answering it.
+    """
+
+
+class SimulatedError(Exception):
+    """
+    Raised to answer a request with an injected error status.
+    """
+
+    def __init__(self, status: int):
+        super().__init__(f"Simulated {status}")
+        self.status = status
+
+
+def merge(base: dict, override: dict) -> dict:
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def load_config(overrides: dict = None) -> dict:
+    """
+    Returns DEFAULT_CONFIG with the given overrides merged into it.
+    Raises ValueError for faults of an unknown endpoint or latency distribution.
+    """
+    config = merge(DEFAULT_CONFIG, overrides or {})
+    validate_faults(config["faults"])
+    return config
+
+
+def validate_faults(faults: dict):
+    for endpoint, fault in faults.items():
+        if endpoint != "default" and endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {endpoint}, must be one of " + ", ".join(ENDPOINTS))
+        distribution = fault.get("latency", {}).get("distribution")
+        if distribution is not None and distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {distribution}, must be one of " + ", ".join(LATENCY_DISTRIBUTIONS))
+
+
+# distribution -> function of (rng, parameters) returning milliseconds
+LATENCY_DISTRIBUTIONS = {
+    "none": lambda rng, p: 0,
+    "fixed": lambda rng, p: p["ms"],
+    "uniform": lambda rng, p: rng.uniform(p["min_ms"], p["max_ms"]),
+    "normal": lambda rng, p: max(rng.gauss(p["mean_ms"], p["stddev_ms"]), 0),
+    "lognormal": lambda rng, p: p["median_ms"] * math.exp(rng.gauss(0, p["sigma"])),
+    "exponential": lambda rng, p: rng.expovariate(1 / p["mean_ms"]),
+}
+
+
+def isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class Simulator:
+    """
+    The state and behaviour of the simulated LibLaaS. clock and sleep can be replaced to run it in tests without waiting.
+    """
+
+    def __init__(self, config: dict = None, clock=time.time, sleep=time.sleep):
+        self.config = load_config(config)
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.rng = random.Random(self.config["seed"])
+        self.endpoint_rngs = {endpoint: random.Random(f"{self.config['seed']}:{endpoint}") for endpoint in ENDPOINTS}
+        self.stats = defaultdict(Counter)
+        self.idempotent_responses = {}
+
+        self.flavors = {}
+        self.hosts = {}
+        self.templates = {}
+        self.users = {}
+        self.aggregates = {}
+        self.instances = {}
+        self.build_inventory()
+
+    def new_id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def build_inventory(self):
+        images = [{"image_id": self.new_id(), "name": name} for name in self.config["images"]]
+        for number, spec in enumerate(self.config["flavors"]):
+            flavor_id = self.new_id()
+            self.flavors[flavor_id] = {
+                "flavor_id": flavor_id,
+                "name": spec["name"],
+                "description": f"Simulated {spec['name']}",
+                "arch": spec.get("arch", "x86_64"),
+                "cpu_count": spec.get("cpu_count", 64),
+                "sockets": spec.get("sockets", 2),
+                "ram": {"value": spec.get("ram_gb", 256), "unit": "GB"},
+                "disk_size": {"value": spec.get("disk_gb", 1000), "unit": "GB"},
+                "root_size": {"value": 200, "unit": "GB"},
+                "swap_size": {"value": 4, "unit": "GB"},
+                "interfaces": [
+                    {"name": f"ens{i}", "speed": {"value": 25, "unit": "GBit"}, "cardtype": "Unknown"} for i in range(2)
+                ],
+                "images": images,
+                "available_count": spec["hosts"] - spec.get("maintenance", 0),
+            }
+
+            prefix = re.sub(r"[^a-z0-9]+", "-", spec["name"].lower()).strip("-")
+            for i in range(spec["hosts"]):
+                name = f"{prefix}-{i + 1:02d}"
+                self.hosts[name] = {
+                    "name": name,
+                    "arch": spec.get("arch", "x86_64"),
+                    "flavor": flavor_id,
+                    "allocation": "maintenance" if i < spec.get("maintenance", 0) else None,
+                    "serial": f"SIM{number:02d}{i:04d}",
+                    "brand": spec["name"].split()[0],
+                    "model": spec["name"],
+                    "power_state": "On",
+                }
+
+            # a public single host template per flavor, so there is something to book
+            template_id = self.new_id()
+            self.templates[template_id] = {
+                "id": template_id,
+                "pod_name": spec["name"],
+                "pod_desc": f"One {spec['name']} host",
+                "owner": "admin",
+                "lab_name": "anuket",
+                "public": True,
+                "host_list": [{"hostname": "node-1", "flavor": flavor_id, "image": images[0]["image_id"], "cifile": [], "bondgroups": []}],
+                "networks": [{"name": "public", "public": True}],
+            }
+
+    # --- REQUESTS ---
+
+    def handle(self, method: str, path: str, body: bytes, headers: dict) -> tuple[int, object]:
+        """
+        Answers one request with (status, json body), after applying the endpoint's faults.
+        Raises Hang if the request should be dropped.
+        """
+        path = path.split("?")[0].strip("/")
+        if path == "_simulator/stats":
+            return 200, self.get_stats()
+        if path == "_simulator/faults" and method == "POST":
+            return self.set_faults(json.loads(body or b"{}"))
+
+        for route_method, pattern, endpoint in COMPILED_ROUTES:
+            match = pattern.fullmatch(path)
+            if match and route_method == method:
+                break
+        else:
+            return 404, {"details": f"No route for {method} {path}"}
+
+        self.apply_faults(endpoint)
+
+        idempotency_key = headers.get("Idempotency-Key")
+        if idempotency_key and endpoint in IDEMPOTENT_ENDPOINTS:
+            with self.lock:
+                replay = self.idempotent_responses.get((endpoint, idempotency_key))
+            if replay is not None:
+                return replay
+
+        data = json.loads(body) if body else None
+        with self.lock:
+            response = getattr(self, endpoint)(data, **match.groupdict())
+            if idempotency_key and endpoint in IDEMPOTENT_ENDPOINTS:
+                self.idempotent_responses[(endpoint, idempotency_key)] = response
+        return response
+
+    def fault(self, endpoint: str) -> dict:
+        faults = self.config["faults"]
+        return merge(faults["default"], faults.get(endpoint, {}))
+
+    def apply_faults(self, endpoint: str):
+        fault = self.fault(endpoint)
+        with self.lock:
+            rng = self.endpoint_rngs[endpoint]
+            hang = rng.random() < fault["hang_rate"]
+            latency = fault["latency"]
+            delay = LATENCY_DISTRIBUTIONS[latency.get("distribution", "none")](rng, latency) / 1000
+            error = rng.random() < fault["error_rate"]
+            self.stats[endpoint]["requests"] += 1
+            self.stats[endpoint]["hangs"] += hang
+            self.stats[endpoint]["errors"] += error and not hang
+
+        if hang:
+            self.sleep(fault["hang_seconds"])
+            raise Hang()
+        self.sleep(delay)
+        if error:
+            raise SimulatedError(fault["error_status"])
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "endpoints": {endpoint: dict(counts) for endpoint, counts in self.stats.items()},
+                "bookings": sum(1 for aggregate in self.aggregates.values() if not aggregate["ended"]),
+                "free_hosts": sum(1 for host in self.hosts.values() if host["allocation"] is None),
+            }
+
+    def set_faults(self, faults: dict) -> tuple[int, object]:
+        try:
+            validate_faults(faults)
+        except ValueError as e:
+            return 400, {"details": str(e)}
+        with self.lock:
+            self.config["faults"] = merge(DEFAULT_CONFIG["faults"], faults)
+        return 200, self.config["faults"]
+
+    # --- PROVISIONING ---
+
+    def start_provisioning(self, instance: dict):
+        # a reimage logs after what the instance logged before, as LibLaaS does
+        instance["history"] = self.logs(instance) if "started" in instance else []
+        instance["started"] = self.clock()
+        instance["fail_at"] = None
+        if self.rng.random() < self.config["provision_failure_rate"]:
+            instance["fail_at"] = self.rng.randrange(1, len(PROVISION_STEPS) + 1)
+
+    def logs(self, instance: dict) -> list[dict]:
+        """
+        The log entries the instance has reached by now, one per provision_step_seconds since it started provisioning,
+        after the entries of its earlier provisionings.
+        """
+        step_seconds = self.config["provision_step_seconds"]
+        reached = int((self.clock() - instance["started"]) / step_seconds) + 1 if step_seconds else len(PROVISION_STEPS) + 1
+        steps = PROVISION_STEPS[:instance["fail_at"]] + [PROVISION_FAILURE] if instance["fail_at"] else PROVISION_STEPS + [PROVISION_SUCCESS]
+        return instance["history"] + [
+            {"status": status, "time": isoformat(instance["started"] + i * step_seconds)}
+            for i, status in enumerate(steps[:reached])
+        ]
+
+    def instance_status(self, instance_id: str) -> dict:
+        instance = self.instances[instance_id]
+        host = self.hosts[instance["host"]]
+        return {
+            "instance": instance_id,
+            "host_alias": instance["host_alias"],
+            "assigned_host_info": {
+                "hostname": host["name"],
+                "arch": host["arch"],
+                "flavor": host["flavor"],
+                "serial": host["serial"],
+                "brand": host["brand"],
+                "model": host["model"],
+            },
+            "logs": self.logs(instance),
+        }
+
+    # --- ENDPOINTS ---
+    # Each takes the decoded request body and the path parameters, and returns (status, json body).
+
+    def liblaas_docs(self, data):
+        return 200, {"title": "LibLaaS simulator", "endpoints": ENDPOINTS}
+
+    def booking_create_booking(self, data):
+        template = self.templates.get(data.get("template_id"))
+        if template is None:
+            return 404, None
+
+        free = defaultdict(list)
+        for host in self.hosts.values():
+            if host["allocation"] is None:
+                free[host["flavor"]].append(host)
+        needed = Counter(host["flavor"] for host in template["host_list"])
+        if any(len(free[flavor]) < count for flavor, count in needed.items()):
+            return 500, None
+
+        agg_id = self.new_id()
+        instance_ids = []
+        for template_host in template["host_list"]:
+            host = free[template_host["flavor"]].pop(0)
+            host["allocation"] = "booked"
+            instance_id = self.new_id()
+            self.instances[instance_id] = {
+                "aggregate": agg_id,
+                "host": host["name"],
+                "host_alias": template_host["hostname"],
+                "image": template_host["image"],
+            }
+            self.start_provisioning(self.instances[instance_id])
+            instance_ids.append(instance_id)
+
+        self.aggregates[agg_id] = {
+            "template": template,
+            "instances": instance_ids,
+            "allowed_users": list(data.get("allowed_users", [])),
+            "metadata": data.get("metadata", {}),
+            "ended": False,
+        }
+        return 200, agg_id
+
+    def booking_end_booking(self, data, agg_id):
+        aggregate = self.aggregates.get(agg_id)
+        if aggregate is None:
+            return 404, {"success": False, "details": f"No aggregate {agg_id}"}
+        if not aggregate["ended"]:
+            aggregate["ended"] = True
+            for instance_id in aggregate["instances"]:
+                self.hosts[self.instances[instance_id]["host"]]["allocation"] = None
+        return 200, {"success": True, "details": ""}
+
+    def booking_booking_status(self, data, agg_id):
+        aggregate = self.aggregates.get(agg_id)
+        if aggregate is None:
+            return 404, None
+        template = aggregate["template"]
+        return 200, {
+            "id": agg_id,
+            "instances": {instance_id: self.instance_status(instance_id) for instance_id in aggregate["instances"]},
+            "config": {"ipmi_username": "laas-sim", "ipmi_password": "laas-sim-password"},
+            "template": {
+                "id": template["id"],
+                "name": template["pod_name"],
+                "description": template["pod_desc"],
+                "owner": template["owner"],
+                "hosts": [
+                    {"hostname": host["hostname"], "flavor": host["flavor"], "image": host["image"]}
+                    for host in template["host_list"]
+                ],
+            },
+        }
+
+    def booking_ipmi_setpower(self, data, instance_id):
+        if instance_id not in self.instances:
+            return 404, None
+        command = (data or {}).get("command")
+        if command not in POWER_COMMANDS:
+            return 400, {"details": f"Unknown power command {command}"}
+        self.hosts[self.instances[instance_id]["host"]]["power_state"] = POWER_COMMANDS[command]
+        return 200, {"success": True}
+
+    def booking_ipmi_getpower(self, data, instance_id):
+        if instance_id not in self.instances:
+            return 404, None
+        return 200, {"power_state": self.hosts[self.instances[instance_id]["host"]]["power_state"]}
+
+    def booking_ipmi_fqdn(self, data, instance_id):
+        if instance_id not in self.instances:
+            return 404, None
+        return 200, {"ipmi_fqdn": f"{self.instances[instance_id]['host']}-ipmi.sim.local"}
+
+    def booking_notify_aggregate_expiring(self, data, agg_id):
+        return (200, True) if agg_id in self.aggregates else (404, None)
+
+    def booking_request_extension(self, data, agg_id):
+        return (200, True) if agg_id in self.aggregates else (404, None)
+
+    def booking_set_image(self, data, instance_id):
+        instance = self.instances.get(instance_id)
+        if instance is None or self.aggregates[instance["aggregate"]]["ended"]:
+            return 404, None
+        instance["image"] = (data or {}).get("image_id", instance["image"])
+        self.start_provisioning(instance)
+        return 200, True
+
+    def flavor_list_flavors(self, data, project):
+        return 200, list(self.flavors.values())
+
+    def flavor_list_hosts(self, data, project):
+        return 200, [
+            {"name": host["name"], "arch": host["arch"], "flavor": host["flavor"], "allocation": host["allocation"]}
+            for host in self.hosts.values()
+        ]
+
+    def template_list_templates(self, data, project, uid):
+        return 200, [template for template in self.templates.values() if template["public"] or template["owner"] == uid]
+
+    def template_delete_template(self, data, template_id):
+        if self.templates.pop(template_id, None) is None:
+            return 404, None
+        return 200, True
+
+    def template_make_template(self, data, project):
+        template_id = self.new_id()
+        self.templates[template_id] = {
+            "pod_name": "",
+            "pod_desc": "",
+            "owner": "",
+            "public": False,
+            "host_list": [],
+            "networks": [],
+            **data,
+            "id": template_id,
+            "lab_name": project,
+        }
+        return 200, template_id
+
+    def get_user(self, uid: str) -> dict | None:
+        if uid not in self.users and self.config["auto_create_users"]:
+            self.users[uid] = {
+                "uid": uid,
+                "givenname": uid,
+                "sn": "Simulated",
+                "mail": f"{uid}@sim.local",
+                "ou": "Simulated",
+                "ipasshpubkey": [f"ssh-ed25519 AAAASIMULATED {uid}"],
+            }
+        return self.users.get(uid)
+
+    def user_get_user(self, data, uid):
+        user = self.get_user(uid)
+        return (200, user) if user else (404, None)
+
+    def user_get_many_users(self, data):
+        return 200, [user for user in map(self.get_user, data or []) if user]
+
+    def user_create_user(self, data):
+        if data["uid"] in self.users:
+            return 409, {"details": f"User {data['uid']} already exists"}
+        self.users[data["uid"]] = {key: value for key, value in data.items() if key != "random"}
+        return 200, True
+
+    def update_user(self, uid: str, field: str, value):
+        user = self.get_user(uid)
+        if user is None:
+            return 404, None
+        user[field] = value
+        return 200, True
+
+    def user_set_ssh(self, data, uid):
+        return self.update_user(uid, "ipasshpubkey", data)
+
+    def user_set_company(self, data, uid):
+        return self.update_user(uid, "ou", data)
+
+    def user_set_email(self, data, uid):
+        return self.update_user(uid, "mail", data)
+
+    def user_add_users(self, data, agg_id):
+        aggregate = self.aggregates.get(agg_id)
+        if aggregate is None:
+            return 404, {"details": f"No aggregate {agg_id}"}
+        for uid in data.get("users", []):
+            if uid not in aggregate["allowed_users"]:
+                aggregate["allowed_users"].append(uid)
+        return 200, aggregate["allowed_users"]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def respond(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            status, data = self.server.simulator.handle(method, self.path, body, self.headers)
+            payload = json.dumps(data).encode()
+            content_type = "application/json"
+        except Hang:
+            self.close_connection = True
+            return
+        except SimulatedError as e:
+            # like a proxy in front of a struggling LibLaaS, the body isn't json
+            status, payload, content_type = e.status, b"Simulated failure", "text/plain"
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def do_DELETE(self):
+        self.respond("DELETE")
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(simulator: Simulator, host: str = "127.0.0.1", port: int = 8001, verbose: bool = False) -> ThreadingHTTPServer:
+    """
+    Returns an HTTP server for the given simulator, handling each request in its own thread. Port 0 picks a free port.
+    """
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.simulator = simulator
+    server.verbose = verbose
+    return server
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Local LibLaaS stand-in with latency and fault injection")
+    add_arguments(parser)
+    serve(vars(parser.parse_args(argv)))
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--config", help="JSON file merged over the default configuration, see DEFAULT_CONFIG")
+    parser.add_argument("--seed", type=int, help="overrides the seed in the configuration")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+
+
+def serve(options: dict, out=print):
+    overrides = {}
+    if options.get("config"):
+        with open(options["config"]) as f:
+            overrides = json.load(f)
+    if options.get("seed") is not None:
+        overrides["seed"] = options["seed"]
+
+    server = make_server(Simulator(overrides), options["host"], options["port"], options.get("verbose", False))
+    out(f"LibLaaS simulator listening on http://{options['host']}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
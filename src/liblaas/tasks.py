@@ -0,0 +1,27 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+from celery import shared_task
+from liblaas import jobs
+from liblaas.outbox import relay
+
+
+@shared_task
+def relay_outbox():
+    relay()
+
+
+@shared_task
+def run_job(job_id):
+    jobs.run(job_id)
+
+
+@shared_task
+def expire_stale_jobs():
+    jobs.expire_stale_jobs()
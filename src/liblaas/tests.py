@@ -67,3 +67,348 @@
 
 
 
+
+
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase
+from django.utils import timezone
+
+from account.models import Lab
+from booking.models import Booking
+from liblaas.jobs import describe_reimage_batch, expire_stale_jobs, run, submit, submit_reimage
+from laas_dashboard.settings import LIBLAAS_TIMEOUT
+from liblaas import views
+from liblaas.models import Job, JobStatus
+from liblaas.simulator import PROVISION_SUCCESS, Simulator, make_server
+from liblaas.utils import forget_power_state, get_power_states
+
+
+class JobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("user", "user@email.com", "testpassword")
+
+    def test_identical_queued_jobs_are_shared(self):
+        first, created = submit("ipmi_setpower", "instance", {"command": "PowerOn"}, user=self.user)
+        self.assertTrue(created)
+
+        second, created = submit("ipmi_setpower", "instance", {"command": "PowerOn"}, user=self.user)
+        self.assertFalse(created)
+        self.assertEqual(first.id, second.id)
+
+        _, created = submit("ipmi_setpower", "instance", {"command": "PowerOff"}, user=self.user)
+        self.assertTrue(created)
+        _, created = submit("ipmi_setpower", "other", {"command": "PowerOn"}, user=self.user)
+        self.assertTrue(created)
+
+    @patch("liblaas.jobs.booking_ipmi_setpower")
+    def test_run(self, mock_setpower):
+        mock_setpower.return_value = {"power_state": "On"}
+        job, _ = submit("ipmi_setpower", "instance", {"command": "PowerOn"}, user=self.user)
+
+        job = run(job.id)
+        self.assertEqual(job.status, JobStatus.SUCCEEDED)
+        self.assertEqual(job.result, {"power_state": "On"})
+        mock_setpower.assert_called_once_with("instance", {"command": "PowerOn"})
+
+        # a job is only run once
+        self.assertIsNone(run(job.id))
+
+        # finished jobs don't absorb new commands
+        _, created = submit("ipmi_setpower", "instance", {"command": "PowerOn"}, user=self.user)
+        self.assertTrue(created)
+
+    @patch("liblaas.jobs.booking_ipmi_getpower")
+    def test_failed_run(self, mock_getpower):
+        mock_getpower.return_value = None
+        job, _ = submit("ipmi_getpower", "instance", {})
+
+        job = run(job.id)
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertNotEqual(job.error, "")
+
+    def test_running_status_queries_are_shared(self):
+        job, _ = submit("ipmi_getpower", "instance", {})
+        Job.objects.filter(id=job.id).update(status=JobStatus.RUNNING)
+        self.assertEqual(submit("ipmi_getpower", "instance", {})[0].id, job.id)
+
+        # but commands are not, the state may have changed since the running one was sent
+        command, _ = submit("ipmi_setpower", "instance", {"command": "Restart"})
+        Job.objects.filter(id=command.id).update(status=JobStatus.RUNNING)
+        self.assertNotEqual(submit("ipmi_setpower", "instance", {"command": "Restart"})[0].id, command.id)
+
+    def test_stale_jobs_expire(self):
+        job, _ = submit("ipmi_getpower", "instance", {})
+        Job.objects.filter(id=job.id).update(created=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(expire_stale_jobs(), 1)
+        self.assertEqual(Job.objects.get(id=job.id).status, JobStatus.FAILED)
+
+
+class PowerStatusTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@email.com", "testpassword")
+        cls.other = User.objects.create_user("other", "other@email.com", "testpassword")
+        lab = Lab.objects.create(name="UNH_IOL", lab_user=cls.owner)
+        cls.booking = Booking.objects.create(
+            owner=cls.owner,
+            start=timezone.now(),
+            end=timezone.now() + timedelta(days=1),
+            purpose="test",
+            project="test",
+            lab=lab,
+            aggregateId="aggregate",
+        )
+
+    def setUp(self):
+        caches["liblaas"].clear()
+
+    @patch("liblaas.utils.booking_ipmi_getpower")
+    def test_power_states_are_cached(self, mock_getpower):
+        mock_getpower.side_effect = lambda instance_id: {"power_state": "On"} if instance_id != "broken" else None
+
+        states = get_power_states(["a", "b", "broken"])
+        self.assertEqual(states, {"a": {"power_state": "On"}, "b": {"power_state": "On"}, "broken": None})
+        self.assertEqual(mock_getpower.call_count, 3)
+
+        # only the failed lookup is retried
+        get_power_states(["a", "b", "broken"])
+        self.assertEqual(mock_getpower.call_count, 4)
+
+        forget_power_state("a")
+        get_power_states(["a", "b"])
+        self.assertEqual(mock_getpower.call_count, 5)
+
+    @patch("liblaas.utils.booking_ipmi_getpower")
+    @patch("liblaas.utils.booking_booking_status")
+    def test_booking_power_status(self, mock_status, mock_getpower):
+        mock_status.return_value = {"instances": {"a": {}, "b": {}}}
+        mock_getpower.return_value = {"power_state": "Off"}
+        url = f"/liblaas/ipmi/booking/{self.booking.id}/"
+
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.owner)
+        for _ in range(2):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {"instances": {"a": {"power_state": "Off"}, "b": {"power_state": "Off"}}})
+
+        mock_status.assert_called_once()
+        self.assertEqual(mock_getpower.call_count, 2)
+
+
+class ReimageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@email.com", "testpassword")
+        lab = Lab.objects.create(name="UNH_IOL", lab_user=cls.owner)
+        cls.booking = Booking.objects.create(
+            owner=cls.owner,
+            start=timezone.now(),
+            end=timezone.now() + timedelta(days=1),
+            purpose="test",
+            project="test",
+            lab=lab,
+            aggregateId="aggregate",
+        )
+
+    def setUp(self):
+        caches["liblaas"].clear()
+        self.client.force_login(self.owner)
+
+    def status(self, logs_a, logs_b=None):
+        return {"instances": {
+            "a": {"logs": [{"status": s, "time": ""} for s in logs_a]},
+            "b": {"logs": [{"status": s, "time": ""} for s in logs_b or []]},
+        }}
+
+    @patch("liblaas.jobs.booking_set_image")
+    @patch("liblaas.jobs.booking_booking_status")
+    @patch("liblaas.utils.booking_booking_status")
+    def test_batch_reimage(self, mock_instances, mock_status, mock_set_image):
+        mock_instances.return_value = self.status([])
+        mock_set_image.return_value = {"code": 200}
+
+        response = self.client.post(
+            f"/liblaas/reimage/booking/{self.booking.id}/",
+            data={"instances": {"a": "image", "b": "image"}},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 202)
+        batch = response.json()["batch"]
+        jobs = Job.objects.filter(batch=batch)
+        self.assertEqual(jobs.count(), 2)
+
+        # a previous deployment has already logged to instance a
+        mock_status.return_value = self.status(["Provisioned Success"])
+        for job in jobs:
+            run(job.id)
+        job_a = jobs.get(instance_id="a")
+        mock_set_image.assert_any_call("a", {"image_id": "image"}, idempotency_key=f"job:{job_a.id}")
+
+        mock_status.return_value = self.status(["Provisioned Success", "Reimaging", "Reimaged Success"], ["Reimaging"])
+        progress = {job["instance_id"]: job["progress"] for job in self.client.get(f"/liblaas/reimage/batch/{batch}/").json()["jobs"]}
+        self.assertEqual(progress["a"]["state"], JobStatus.SUCCEEDED)
+        self.assertEqual(len(progress["a"]["logs"]), 2)
+        self.assertEqual(progress["b"]["state"], "deploying")
+
+    @patch("liblaas.utils.booking_booking_status")
+    def test_instances_must_belong_to_booking(self, mock_instances):
+        mock_instances.return_value = self.status([])
+
+        response = self.client.post(
+            f"/liblaas/reimage/booking/{self.booking.id}/",
+            data={"instances": {"someone_elses": "image"}},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Job.objects.exists())
+
+
+class ViewsTests(TestCase):
+
+    @patch("liblaas.views.requests.request")
+    def test_calls_time_out(self, mock_request):
+        views.liblaas_docs()
+        self.assertEqual(mock_request.call_args[1]["timeout"], LIBLAAS_TIMEOUT)
+
+
+class SimulatorTests(TestCase):
+
+    def start(self, config: dict = None) -> Simulator:
+        self.now = 1_700_000_000.0
+        self.slept = []
+        simulator = Simulator(config, clock=lambda: self.now, sleep=self.slept.append)
+        server = make_server(simulator, port=0)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        base = patch.object(views, "base", f"http://127.0.0.1:{server.server_port}/")
+        base.start()
+        self.addCleanup(base.stop)
+        return simulator
+
+    def test_booking_lifecycle(self):
+        self.start({"provision_step_seconds": 10})
+        hosts = views.flavor_list_hosts("anuket")
+        flavors = {flavor["flavor_id"]: flavor for flavor in views.flavor_list_flavors("anuket")}
+        self.assertTrue(all(host["flavor"] in flavors for host in hosts))
+
+        template = views.template_list_templates("user", "anuket")[0]
+        blob = {"template_id": template["id"], "allowed_users": ["user"], "metadata": {}}
+        agg_id = views.booking_create_booking(blob, idempotency_key="key")
+        # a retried delivery gets the same aggregate
+        self.assertEqual(views.booking_create_booking(blob, idempotency_key="key"), agg_id)
+
+        status = views.booking_booking_status(agg_id)
+        instance_id, instance = next(iter(status["instances"].items()))
+        self.assertEqual(len(instance["logs"]), 1)
+        self.assertEqual(status["template"]["hosts"][0]["flavor"], template["host_list"][0]["flavor"])
+        allocated = [host for host in views.flavor_list_hosts("anuket") if host["allocation"] == "booked"]
+        self.assertEqual([host["name"] for host in allocated], [instance["assigned_host_info"]["hostname"]])
+
+        self.now += 25
+        self.assertEqual(len(views.booking_booking_status(agg_id)["instances"][instance_id]["logs"]), 3)
+        self.now += 3600
+        self.assertEqual(views.booking_booking_status(agg_id)["instances"][instance_id]["logs"][-1]["status"], PROVISION_SUCCESS)
+
+        self.assertEqual(views.booking_set_image(instance_id, {"image_id": "other"}), {"code": 200})
+        # the reimage logs after the first provisioning
+        self.assertEqual(len(views.booking_booking_status(agg_id)["instances"][instance_id]["logs"]), 7)
+
+        self.assertEqual(views.booking_ipmi_setpower(instance_id, {"command": "PowerOff"}), {"success": True})
+        self.assertEqual(views.booking_ipmi_getpower(instance_id), {"power_state": "Off"})
+        self.assertIn("ipmi_fqdn", views.booking_ipmi_fqdn(instance_id))
+        self.assertEqual(views.user_add_users(agg_id, ["other"]), ["user", "other"])
+
+        self.assertEqual(views.booking_end_booking(agg_id), {"success": True, "details": ""})
+        self.assertFalse(any(host["allocation"] == "booked" for host in views.flavor_list_hosts("anuket")))
+
+    def test_reimage_progress(self):
+        self.start({"provision_step_seconds": 10, "provision_failure_rate": 0})
+        template = views.template_list_templates("user", "anuket")[0]
+        agg_id = views.booking_create_booking({"template_id": template["id"]})
+        instance_id = next(iter(views.booking_booking_status(agg_id)["instances"]))
+        self.now += 3600
+
+        owner = User.objects.create_user("owner")
+        booking = Booking.objects.create(
+            owner=owner, start=timezone.now(), end=timezone.now() + timedelta(days=1), purpose="test", project="test",
+            lab=Lab.objects.create(name="UNH_IOL", lab_user=owner), aggregateId=agg_id,
+        )
+        _, jobs = submit_reimage(booking, {instance_id: {"image_id": "other"}})
+        run(jobs[0].id)
+
+        progress = describe_reimage_batch(list(Job.objects.filter(id=jobs[0].id)))[0]["progress"]
+        self.assertEqual(progress["state"], "deploying")
+        self.assertEqual(len(progress["logs"]), 1)
+
+        self.now += 3600
+        progress = describe_reimage_batch(list(Job.objects.filter(id=jobs[0].id)))[0]["progress"]
+        self.assertEqual(progress["state"], JobStatus.SUCCEEDED)
+        self.assertEqual(progress["logs"][-1]["status"], PROVISION_SUCCESS)
+
+    def test_booking_needs_free_hosts(self):
+        self.start({"flavors": [{"name": "Small", "hosts": 1}]})
+        template = views.template_list_templates("user", "anuket")[0]
+
+        self.assertTrue(views.booking_create_booking({"template_id": template["id"]}))
+        self.assertIsNone(views.booking_create_booking({"template_id": template["id"]}))
+
+    def test_users(self):
+        self.start({"auto_create_users": False})
+        self.assertIsNone(views.user_get_user("user"))
+
+        self.assertTrue(views.user_create_user({"uid": "user", "mail": "user@email.com", "random": True}))
+        self.assertTrue(views.user_set_company("user", "Company"))
+        self.assertTrue(views.user_set_ssh("user", [" ssh-ed25519 key "]))
+        self.assertEqual(views.user_get_user("user")["ipasshpubkey"], ["ssh-ed25519 key"])
+        self.assertEqual([user["uid"] for user in views.user_get_many_users(["user", "missing"])], ["user"])
+
+    def test_faults(self):
+        simulator = self.start({
+            "faults": {
+                "default": {"latency": {"distribution": "fixed", "ms": 20}},
+                "flavor_list_hosts": {"error_rate": 1},
+                "flavor_list_flavors": {"hang_rate": 1, "hang_seconds": 5},
+            },
+        })
+
+        self.assertIsNone(views.flavor_list_hosts("anuket"))
+        self.assertIsNone(views.flavor_list_flavors("anuket"))
+        self.assertTrue(views.template_list_templates("user", "anuket"))
+        # the hang is held, then dropped without the latency
+        self.assertEqual(self.slept, [0.02, 5, 0.02])
+
+        stats = simulator.get_stats()["endpoints"]
+        self.assertEqual(stats["flavor_list_hosts"], {"requests": 1, "hangs": 0, "errors": 1})
+        self.assertEqual(stats["flavor_list_flavors"], {"requests": 1, "hangs": 1, "errors": 0})
+
+    def test_latency_is_reproducible(self):
+        config = {"seed": 7, "faults": {"default": {"latency": {"distribution": "uniform", "min_ms": 10, "max_ms": 500}}}}
+        runs = []
+        for _ in range(2):
+            self.start(config)
+            for _ in range(5):
+                views.flavor_list_hosts("anuket")
+            runs.append(self.slept)
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual(len(set(runs[0])), 5)
+
+    def test_unknown_fault(self):
+        with self.assertRaises(ValueError):
+            Simulator({"faults": {"no_such_endpoint": {"error_rate": 1}}})
+        with self.assertRaises(ValueError):
+            Simulator({"faults": {"default": {"latency": {"distribution": "zipf"}}}})
@@ -23,5 +23,11 @@ urlpatterns = [
     path('ipa/company/', request_set_company, name='set_company'),
     re_path(r'^ipmi/set/(?P<host_id>[A-Za-z0-9_-]+)$', request_ipmi_setpower, name='ipmi_set'),
     re_path(r'^ipmi/get/(?P<host_id>[A-Za-z0-9_-]+)$', request_ipmi_getpower, name='ipmi_get'),
+    path('ipmi/booking/<int:booking_id>/', request_booking_power_status, name='ipmi_booking_status'),
     re_path(r'^reimage/(?P<host_id>[A-Za-z0-9_-]+)$', request_image_set, name='image_set'),
+    path('reimage/booking/<int:booking_id>/', request_booking_reimage, name='booking_reimage'),
+    path('reimage/batch/<uuid:batch_id>/', request_reimage_batch_status, name='reimage_batch_status'),
+    path('outbox/<str:idempotency_key>/', request_outbox_status, name='outbox_status'),
+    path('job/<uuid:job_id>/', request_job_status, name='job_status'),
+    path('job/<uuid:job_id>/events/', request_job_events, name='job_events'),
 ]
\ No newline at end of file
@@ -7,9 +7,16 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
 
-from django.contrib.auth.models import User
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import caches
+
 from account.models import UserProfile
-from liblaas.views import user_get_user, user_get_many_users
+from laas_dashboard.settings import IPMI_STATUS_CACHE_TIMEOUT, IPMI_STATUS_MAX_WORKERS, BOOKING_INSTANCES_CACHE_TIMEOUT
+from liblaas.views import user_get_user, user_get_many_users, booking_booking_status, booking_ipmi_getpower
+
+logger = logging.getLogger(__name__)
 
 def isValidCollaborator(profile: UserProfile) -> bool:
     """
@@ -18,26 +25,26 @@ def isValidCollaborator(profile: UserProfile) -> bool:
     """
 
     if not profile:
-        print("UserProfile was None!")
+        logger.warning("Can't validate a collaborator without a UserProfile")
         return False
 
     ipa_username = profile.ipa_username
 
     if not ipa_username:
-        print("No ipa username for", profile)
+        logger.info(f"No ipa username for {profile}", extra={"fields": {"user_id": profile.user_id}})
         return False
     
     ipa_account = user_get_user(ipa_username)
 
     if not ipa_account:
-        print("Failed to retreieve user for", profile)
+        logger.warning(f"Failed to retrieve the IPA account of {profile}", extra={"fields": {"user_id": profile.user_id, "ipa_username": ipa_username}})
         return False
 
     if not "ipasshpubkey" in ipa_account:
-        print("No SSH key for", profile)
+        logger.info(f"No SSH key for {profile}", extra={"fields": {"user_id": profile.user_id, "ipa_username": ipa_username}})
         return False
 
-    print("Valid user", profile)
+    logger.debug(f"Valid collaborator {profile}", extra={"fields": {"user_id": profile.user_id, "ipa_username": ipa_username}})
     return True
 
 
@@ -49,6 +56,10 @@ def find_invalid_collaborators(profiles: list[UserProfile]) -> list[UserProfile]
     Assumes ipa_username is set for all provided collaborators
     """
     accounts: list[dict] = user_get_many_users([p.ipa_username for p in profiles])
+    if accounts is None:
+        logger.warning("Failed to retrieve collaborators from LibLaaS, skipping validation", extra={"fields": {"collaborators": len(profiles)}})
+        return []
+
     failed = []
     for a in accounts:
         if not "ipasshpubkey" in a:
@@ -57,8 +68,7 @@ def find_invalid_collaborators(profiles: list[UserProfile]) -> list[UserProfile]
     return failed
 
 # Returns whether the user has linked their ipa account. If not, determines how it needs to be linked.
-def get_ipa_status(dashboard_user: User) -> str:
-    profile = UserProfile.objects.get(user=dashboard_user)
+def get_ipa_status(profile: UserProfile) -> str:
     if profile == None:
         return "n/a"
 
@@ -67,7 +77,7 @@ def get_ipa_status(dashboard_user: User) -> str:
         return "n/a"
     
     # Basic info
-    dashboard_username = str(dashboard_user)
+    dashboard_username = str(profile.user)
     dashboard_email = profile.email_addr
     ipa_user = user_get_user(dashboard_username)
 
@@ -81,3 +91,54 @@ def get_ipa_status(dashboard_user: User) -> str:
 
     # Conflict case
     return "conflict"
+
+
+def get_booking_instance_ids(agg_id: str) -> list[str] | None:
+    """
+    Returns the instance ids of the given aggregate, or None if LibLaaS couldn't be reached.
+    Instances don't change during a booking, so these are cached for BOOKING_INSTANCES_CACHE_TIMEOUT seconds.
+    """
+    key = f"liblaas:instances:{agg_id}"
+    instance_ids = caches["liblaas"].get(key)
+    if instance_ids is None:
+        status = booking_booking_status(agg_id)
+        if not status:
+            return None
+        instance_ids = list(status.get("instances", {}).keys())
+        caches["liblaas"].set(key, instance_ids, BOOKING_INSTANCES_CACHE_TIMEOUT)
+    return instance_ids
+
+
+def power_state_key(instance_id: str) -> str:
+    return f"liblaas:power:{instance_id}"
+
+
+def forget_power_state(instance_id: str):
+    caches["liblaas"].delete(power_state_key(instance_id))
+
+
+def get_power_states(instance_ids: list[str]) -> dict[str, dict]:
+    """
+    Returns the IPMI power status of each of the given instances, as returned by LibLaaS.
+    Instances that could not be queried map to None.
+
+    Statuses are cached for IPMI_STATUS_CACHE_TIMEOUT seconds and shared between everyone viewing the booking,
+    so the BMCs are queried at most once per timeout however many pages are polling. Cache misses are looked up in parallel.
+    """
+    keys = {power_state_key(instance_id): instance_id for instance_id in instance_ids}
+    cached = caches["liblaas"].get_many(keys.keys())
+    states = {keys[key]: state for key, state in cached.items()}
+
+    missing = [instance_id for instance_id in instance_ids if instance_id not in states]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), IPMI_STATUS_MAX_WORKERS)) as executor:
+            fetched = dict(zip(missing, executor.map(booking_ipmi_getpower, missing)))
+
+        # failures aren't cached so that the next poll tries again
+        caches["liblaas"].set_many(
+            {power_state_key(instance_id): state for instance_id, state in fetched.items() if state is not None},
+            IPMI_STATUS_CACHE_TIMEOUT,
+        )
+        states.update(fetched)
+
+    return states
@@ -10,199 +10,268 @@
 # Unauthenticated requests to liblaas. If a call makes it to here, it is assumed to be authenticated
 # Responses that return json will return the unwrapped json data, otherwise it will return whether the request was successful or not
 
+from contextvars import ContextVar
 from datetime import datetime
 from email.utils import format_datetime
+from functools import wraps
 import requests
 import json
-from laas_dashboard.settings import LIBLAAS_BASE_URL
+import logging
+import time
+from laas_dashboard.metrics import LIBLAAS_REQUEST_DURATION, LIBLAAS_REQUESTS
+from laas_dashboard.settings import LIBLAAS_BASE_URL, LIBLAAS_TIMEOUT
+from laas_dashboard.timing import timed
+from laas_dashboard.tracing import current_span, span
+
+logger = logging.getLogger(__name__)
 
 base = LIBLAAS_BASE_URL
 post_headers = {'Content-Type': 'application/json'}
 
+# Outcome and status code of the last request made through send(), read by liblaas_call()
+_outcome = ContextVar("liblaas_outcome", default=None)
+
+
+def liblaas_call(function):
+    """
+    Times the calls below for the current request (laas_dashboard.timing), records them as spans of the current trace
+    (laas_dashboard.tracing), and counts them, their latency and their outcome per endpoint (laas_dashboard.metrics).
+    Every call is logged at debug level. Endpoints are named after the function.
+    A call that raised before getting a response counts as a connection error.
+    """
+    endpoint = function.__name__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _outcome.set(None)
+        begin = time.perf_counter()
+        try:
+            with timed("liblaas"), span(f"liblaas {endpoint}", "client"):
+                return function(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - begin
+            outcome, status = _outcome.get() or ("connection_error", None)
+            LIBLAAS_REQUEST_DURATION.labels(endpoint).observe(duration)
+            LIBLAAS_REQUESTS.labels(endpoint, outcome).inc()
+            logger.debug(
+                f"LibLaaS {endpoint}: {outcome}",
+                extra={"fields": {"endpoint": endpoint, "outcome": outcome, "status": status, "duration_ms": round(duration * 1000, 2)}},
+            )
+            _outcome.reset(token)
+    return wrapper
+
+
+def send(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Makes a request to LibLaaS, passing the trace on, and notes its outcome for liblaas_call().
+    The calls below catch the errors, so the span is marked as failed here.
+    Requests are given up on after LIBLAAS_TIMEOUT seconds, unless a timeout is passed.
+    """
+    kwargs.setdefault("timeout", LIBLAAS_TIMEOUT)
+    current = current_span()
+    if current is not None:
+        kwargs["headers"] = {**kwargs.get("headers", {}), "traceparent": current.traceparent}
+        current.set({"http.method": method, "http.url": url})
+    try:
+        response = requests.request(method, url, **kwargs)
+    except requests.RequestException as e:
+        if current is not None:
+            current.fail(e)
+        raise
+
+    _outcome.set(("ok" if response.ok else "http_error", response.status_code))
+    if current is not None:
+        current.set({"http.status_code": response.status_code})
+        if not response.ok:
+            current.fail(f"HTTP {response.status_code}")
+    return response
+
+
+@liblaas_call
 def liblaas_docs():
     endpoint = f'docs'
     url = f'{base}{endpoint}'
     try:
-        response = requests.get(url)
+        response = send("GET", url)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 ### BOOKING
 
 # DELETE
-def booking_end_booking(agg_id: str) -> dict:
+@liblaas_call
+def booking_end_booking(agg_id: str, idempotency_key: str = None) -> dict:
     endpoint = f'booking/{agg_id}/end'
     url = f'{base}{endpoint}'
     try:
-        response = requests.delete(url)
+        response = send("DELETE", url, headers=idempotency_headers(idempotency_key))
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # GET
+@liblaas_call
 def booking_booking_status(agg_id: str) -> dict:
     endpoint = f'booking/{agg_id}/status'
     url = f'{base}{endpoint}'
     try:
-        response = requests.get(url)
+        response = send("GET", url)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None 
 
 # POST
-def booking_create_booking(booking_blob: dict) -> str:
+@liblaas_call
+def booking_create_booking(booking_blob: dict, idempotency_key: str = None) -> str:
     endpoint = f'booking/create'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps(booking_blob), headers=post_headers)
+        response = send("POST", url, data=json.dumps(booking_blob), headers=idempotency_headers(idempotency_key, post_headers))
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # POST
+@liblaas_call
 def booking_ipmi_setpower(host_id: str, command: dict) -> dict:
     endpoint = f'booking/ipmi/{host_id}/setpower'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps(command), headers=post_headers)
+        response = send("POST", url, data=json.dumps(command), headers=post_headers)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # GET
+@liblaas_call
 def booking_ipmi_getpower(host_id: str) -> dict:
     endpoint = f'booking/ipmi/{host_id}/powerstatus'
     url = f'{base}{endpoint}'
     try:
-        response = requests.get(url)
+        response = send("GET", url)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # GET
+@liblaas_call
 def booking_ipmi_fqdn(host_id: str) -> dict:
     endpoint = f'booking/ipmi/{host_id}/getfqdn'
     url = f'{base}{endpoint}'
     try:
-        response = requests.get(url)
+        response = send("GET", url)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # POST
-def booking_notify_aggregate_expiring(agg_id: str, end_date: datetime) -> bool:
+@liblaas_call
+def booking_notify_aggregate_expiring(agg_id: str, end_date: datetime, idempotency_key: str = None) -> bool:
     endpoint = f'booking/{agg_id}/notify/expiring'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps(format_datetime(end_date)), headers=post_headers)
+        response = send("POST", url, data=json.dumps(format_datetime(end_date)), headers=idempotency_headers(idempotency_key, post_headers))
         return response.status_code == 200
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return False
 
 # POST
-def booking_request_extension(agg_id: str, reason: str, date: str) -> bool:
+@liblaas_call
+def booking_request_extension(agg_id: str, reason: str, date: str, idempotency_key: str = None) -> bool:
     endpoint = f'booking/{agg_id}/request-extension'
     url = f'{base}{endpoint}'
 
     try:
-        response = requests.post(url, data=json.dumps({
+        response = send("POST", url, data=json.dumps({
             "reason": reason,
             "date": date
-        }), headers=post_headers)
+        }), headers=idempotency_headers(idempotency_key, post_headers))
         return response.status_code == 200
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return False
 
 # POST
-def booking_set_image(instance_key: str, image: dict) -> dict:
+@liblaas_call
+def booking_set_image(instance_key: str, image: dict, idempotency_key: str = None) -> dict:
     endpoint = f'booking/{instance_key}/reimage'
     url = f'{base}{endpoint}'
     try:
         output = {}
-        response = requests.post(url, data=json.dumps(image), headers=post_headers)
+        response = send("POST", url, data=json.dumps(image), headers=idempotency_headers(idempotency_key, post_headers))
         if response.status_code == 200:
             output["code"] = 200
         else:
             output["code"] = 500
         return output
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 ### FLAVOR
 
 # GET
+@liblaas_call
 def flavor_list_flavors(project: str) -> list[dict]:
     endpoint = f'flavor/{project}'
     url = f'{base}{endpoint}'
     try:
-        response = requests.get(url)
+        response = send("GET", url)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # GET
+@liblaas_call
 def flavor_list_hosts(project: str) -> list[dict]:
     endpoint = f'flavor/{project}/hosts'
     url = f'{base}{endpoint}'
     try:
-        response = requests.get(url)
+        response = send("GET", url)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 ### TEMPLATE
 
 # GET
+@liblaas_call
 def template_list_templates(uid: str, project: str) -> list[dict]:
     endpoint = f'template/list/{project}/{uid}'
     url = f'{base}{endpoint}'
     try:
-        response = requests.get(url)
+        response = send("GET", url)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # DELETE
+@liblaas_call
 def template_delete_template(template_id: str) -> bool:
     endpoint = f'template/{template_id}'
     url = f'{base}{endpoint}'
     try:
-        response = requests.delete(url)
+        response = send("DELETE", url)
         return response.status_code == 200
 
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 #POST
+@liblaas_call
 def template_make_template(template_blob: dict) -> str:
 
     project = template_blob["lab_name"]
@@ -210,16 +279,16 @@ def template_make_template(template_blob: dict) -> str:
     endpoint = f'template/{project}/create'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps(template_blob), headers=post_headers)
+        response = send("POST", url, data=json.dumps(template_blob), headers=post_headers)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 ### USER
 
 # GET
+@liblaas_call
 def user_get_user(uid: str) -> dict:
     """
     uid: ipa username of user to fetch.
@@ -228,74 +297,74 @@ def user_get_user(uid: str) -> dict:
     endpoint = f'user/{uid}'
     url = f'{base}{endpoint}'
     try:
-        response = requests.get(url)
+        response = send("GET", url)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # POST
+@liblaas_call
 def user_get_many_users(uids: list[str]) -> list[dict]:
     endpoint = f'user/many'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps(uids), headers=post_headers)
+        response = send("POST", url, data=json.dumps(uids), headers=post_headers)
         return response.json()
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # POST
+@liblaas_call
 def user_create_user(user_blob: dict) -> bool:
     endpoint = f'user/create'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps(user_blob), headers=post_headers)
+        response = send("POST", url, data=json.dumps(user_blob), headers=post_headers)
         return response.status_code == 200
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # POST
+@liblaas_call
 def user_set_ssh(uid: str, keys: list) -> bool:
     endpoint = f'user/{uid}/ssh'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps(clean_ssh_keys(keys)), headers=post_headers)
+        response = send("POST", url, data=json.dumps(clean_ssh_keys(keys)), headers=post_headers)
         return response.status_code == 200
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # POST
+@liblaas_call
 def user_set_company(uid: str, company: str) -> bool:
     endpoint = f'user/{uid}/company'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps(company), headers=post_headers)
+        response = send("POST", url, data=json.dumps(company), headers=post_headers)
         return response.status_code == 200
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 # POST
+@liblaas_call
 def user_set_email(uid: str, email: str) -> bool:
     endpoint = f'user/{uid}/email'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps(email), headers=post_headers)
+        response = send("POST", url, data=json.dumps(email), headers=post_headers)
         return response.status_code == 200
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
     
-def user_add_users(agg_id: str, users: list[str]) -> list[str]:
+@liblaas_call
+def user_add_users(agg_id: str, users: list[str], idempotency_key: str = None) -> list[str]:
     """
     Adds collaborators to the user list for an aggregate and grants VPN access
     Returns list of all aggregate collabs if successful.
@@ -305,19 +374,31 @@ def user_add_users(agg_id: str, users: list[str]) -> list[str]:
     endpoint = f'user/{agg_id}/addusers'
     url = f'{base}{endpoint}'
     try:
-        response = requests.post(url, data=json.dumps({'users': users}), headers=post_headers)
+        response = send("POST", url, data=json.dumps({'users': users}), headers=idempotency_headers(idempotency_key, post_headers))
         if response.status_code == 200:
             return response.json()
         else:
-            print(response.json())
+            logger.warning(
+                f"LibLaaS didn't add users to {agg_id}",
+                extra={"fields": {"aggregate_id": agg_id, "status": response.status_code, "response": response.text[:1000]}},
+            )
             return None
     except Exception as e:
-        print(f"Error at {url}")
-        print(e)
+        logger.warning(f"LibLaaS call to {url} failed: {e}", extra={"fields": {"url": url, "error": str(e)}})
         return None
 
 
 # utils
+def idempotency_headers(idempotency_key: str, headers: dict = {}) -> dict:
+    """
+    Returns a copy of headers with the Idempotency-Key header set, if a key was given.
+    Calls delivered through the outbox always pass a key, so LibLaaS can drop redelivered requests.
+    """
+    headers = dict(headers)
+    if idempotency_key:
+        headers['Idempotency-Key'] = str(idempotency_key)
+    return headers
+
 def clean_ssh_keys(ssh_key_list: list[str]) -> list[str]:
     cleaned = []
     for key in ssh_key_list:
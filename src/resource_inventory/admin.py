@@ -9,3 +9,7 @@
 
 
 from django.contrib import admin
+
+from resource_inventory.models import FlavorAllocation
+
+admin.site.register(FlavorAllocation)
@@ -0,0 +1,224 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+# Free capacity per flavor, now and over the coming days.
+# LibLaaS knows which hosts exist and which are allocated right now, the dashboard knows when its bookings end.
+# Every booking holds its hosts from creation until it ends, so the number of free hosts of a flavor only goes up
+# over time, stepping up at each booking end date.
+
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from django.core.cache import caches
+from django.db.models import Sum
+from django.utils import timezone
+
+from laas_dashboard.settings import AVAILABILITY_HOSTS_CACHE_TIMEOUT, PROJECT
+from liblaas.views import flavor_list_flavors, flavor_list_hosts, template_list_templates
+from resource_inventory.models import FlavorAllocation
+
+
+def flavor_counts(flavors: list[str]) -> dict[str, int]:
+    """
+    Returns the number of hosts needed of each flavor, given one flavor id per host.
+    """
+    return dict(Counter(flavors))
+
+
+def template_flavor_counts(template_id: str, ipa_username: str) -> dict[str, int] | None:
+    """
+    Returns the number of hosts of each flavor in the given template, or None if the template couldn't be found.
+    """
+    for template in template_list_templates(ipa_username, PROJECT) or []:
+        if template.get("id") == template_id:
+            return flavor_counts([host["flavor"] for host in template.get("host_list", [])])
+    return None
+
+
+def record_allocations(booking, counts: dict[str, int]) -> list[FlavorAllocation]:
+    """
+    Records the hosts the given booking holds. Call this in the transaction that creates the booking.
+    """
+    return FlavorAllocation.objects.bulk_create([
+        FlavorAllocation(booking=booking, flavor_id=flavor_id, count=count, end=booking.end, released=booking.complete)
+        for flavor_id, count in counts.items()
+    ])
+
+
+def get_hosts() -> list[dict] | None:
+    """
+    Returns the hosts of this project from LibLaaS, cached for AVAILABILITY_HOSTS_CACHE_TIMEOUT seconds.
+    """
+    hosts = caches["liblaas"].get("availability:hosts")
+    if hosts is None:
+        hosts = flavor_list_hosts(PROJECT)
+        if hosts is None:
+            return None
+        caches["liblaas"].set("availability:hosts", hosts, AVAILABILITY_HOSTS_CACHE_TIMEOUT)
+    return hosts
+
+
+def get_flavor_names() -> dict[str, str]:
+    names = caches["liblaas"].get("availability:flavors")
+    if names is None:
+        names = {flavor["flavor_id"]: flavor["name"] for flavor in flavor_list_flavors(PROJECT) or []}
+        if names:
+            caches["liblaas"].set("availability:flavors", names, AVAILABILITY_HOSTS_CACHE_TIMEOUT)
+    return names
+
+
+def host_counts(hosts: list[dict]) -> dict[str, dict]:
+    """
+    Counts the hosts of each flavor, and how many of them are in maintenance or allocated.
+    """
+    counts = defaultdict(lambda: {"total": 0, "maintenance": 0, "allocated": 0})
+    for host in hosts:
+        entry = counts[host["flavor"]]
+        entry["total"] += 1
+        if host.get("allocation") == "maintenance":
+            entry["maintenance"] += 1
+        elif host.get("allocation") is not None:
+            entry["allocated"] += 1
+    return dict(counts)
+
+
+class FlavorTimeline:
+    """
+    The free hosts of one flavor over time.
+
+    releases are the (end, count) pairs of the bookings currently holding hosts of the flavor, sorted by end.
+    Hosts that LibLaaS reports as allocated but no booking accounts for (bookings from before allocations were recorded,
+    or made outside this dashboard) are assumed to stay allocated.
+    """
+
+    def __init__(self, usable: int, allocated: int, releases: list[tuple[datetime, int]]):
+        self.usable = usable
+        self.ends = [end for end, _ in releases]
+        counts = [count for _, count in releases]
+        # held_after[i] is what is still held once the first i bookings have ended
+        self.held_after = list(accumulate(reversed(counts), initial=0))[::-1]
+        self.untracked = max(allocated - self.held_after[0], 0)
+
+    def free_at(self, when: datetime) -> int:
+        held = self.untracked + self.held_after[bisect_right(self.ends, when)]
+        return max(self.usable - held, 0)
+
+    def free_from(self, needed: int, now: datetime) -> datetime | None:
+        """
+        Returns the earliest time from now that needed hosts are free, or None if that never happens.
+        """
+        if self.free_at(now) >= needed:
+            return now
+        for i in range(bisect_right(self.ends, now), len(self.ends)):
+            if self.usable - self.untracked - self.held_after[i + 1] >= needed:
+                return self.ends[i]
+        return None
+
+
+def get_timelines(counts: dict[str, dict], now: datetime, flavor_ids: list[str] = None) -> dict[str, FlavorTimeline]:
+    """
+    Builds a timeline for every flavor in counts (see host_counts), or only the given ones.
+    """
+    allocations = FlavorAllocation.objects.filter(released=False, end__gt=now)
+    if flavor_ids is not None:
+        counts = {flavor_id: entry for flavor_id, entry in counts.items() if flavor_id in flavor_ids}
+        allocations = allocations.filter(flavor_id__in=flavor_ids)
+
+    releases = defaultdict(list)
+    for row in allocations.values("flavor_id", "end").annotate(count=Sum("count")).order_by("flavor_id", "end"):
+        releases[row["flavor_id"]].append((row["end"], row["count"]))
+
+    return {
+        flavor_id: FlavorTimeline(entry["total"] - entry["maintenance"], entry["allocated"], releases[flavor_id])
+        for flavor_id, entry in counts.items()
+    }
+
+
+def day_starts(now: datetime, days: int) -> list[datetime]:
+    midnight = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    return [now] + [midnight + timedelta(days=day) for day in range(1, days)]
+
+
+def calendar(days: int, now: datetime = None) -> list[dict] | None:
+    """
+    Returns the availability calendar of every flavor: its host counts, the hosts free now,
+    when held hosts are released, and the hosts free for the whole of each of the next days.
+    Returns None if LibLaaS couldn't be reached.
+    """
+    now = now or timezone.now()
+    hosts = get_hosts()
+    if hosts is None:
+        return None
+
+    counts = host_counts(hosts)
+    timelines = get_timelines(counts, now)
+    names = get_flavor_names()
+    starts = day_starts(now, days)
+    horizon = starts[-1] + timedelta(days=1)
+
+    flavors = []
+    for flavor_id, timeline in timelines.items():
+        flavors.append({
+            "flavor_id": flavor_id,
+            "name": names.get(flavor_id, flavor_id),
+            **counts[flavor_id],
+            "free": timeline.free_at(now),
+            "releases": [
+                {"end": end.isoformat(), "count": timeline.held_after[i] - timeline.held_after[i + 1]}
+                for i, end in enumerate(timeline.ends) if end < horizon
+            ],
+            # free hosts only go up during a day, so the start of the day is the least free
+            "calendar": [
+                {"date": timezone.localtime(start).date().isoformat(), "free": timeline.free_at(start)}
+                for start in starts
+            ],
+        })
+
+    return sorted(flavors, key=lambda flavor: flavor["name"])
+
+
+def check(counts: dict[str, int], now: datetime = None) -> dict | None:
+    """
+    Checks whether the given number of hosts of each flavor are free now.
+    Each flavor that is short says when enough of its hosts are expected to be free, if ever,
+    and available_from is when all of them are. Returns None if LibLaaS couldn't be reached.
+    """
+    now = now or timezone.now()
+    hosts = get_hosts()
+    if hosts is None:
+        return None
+
+    timelines = get_timelines(host_counts(hosts), now, list(counts.keys()))
+
+    shortages = []
+    latest = now
+    for flavor_id, needed in counts.items():
+        timeline = timelines.get(flavor_id, FlavorTimeline(0, 0, []))
+        free = timeline.free_at(now)
+        if free >= needed:
+            continue
+        free_from = timeline.free_from(needed, now)
+        shortages.append({
+            "flavor_id": flavor_id,
+            "needed": needed,
+            "free": free,
+            "available_from": free_from.isoformat() if free_from else None,
+        })
+        if free_from is None or latest is None:
+            latest = None
+        else:
+            latest = max(latest, free_from)
+
+    return {
+        "available": not shortages,
+        "available_from": latest.isoformat() if latest else None,
+        "shortages": shortages,
+    }
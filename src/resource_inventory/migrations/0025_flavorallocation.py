@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-19 13:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0017_booking_updated'),
+        ('resource_inventory', '0024_auto_20230608_1913'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlavorAllocation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flavor_id', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField()),
+                ('end', models.DateTimeField()),
+                ('released', models.BooleanField(default=False)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flavor_allocations', to='booking.booking')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['flavor_id', 'released', 'end'], name='resource_in_flavor__dd85e9_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='flavorallocation',
+            constraint=models.UniqueConstraint(fields=('booking', 'flavor_id'), name='unique_booking_flavor'),
+        ),
+    ]
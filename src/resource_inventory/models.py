@@ -28,7 +28,10 @@ import re
 from collections import Counter
 
 from account.models import Lab
+from booking.models import Booking
 from dashboard.utils import AbstractModelQuery
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 
 # Keep for now until migrations are made, otherwise django will get angry
 def get_default_remote_info():
@@ -36,3 +39,41 @@ def get_default_remote_info():
 
 def get_sentinal_opnfv_role():
     pass
+
+
+class FlavorAllocation(models.Model):
+    """
+    The number of hosts of one flavor held by a booking.
+
+    end and released mirror the booking, so the hosts held at any point in time can be read from the
+    (flavor_id, released, end) index without joining bookings. They are kept in sync when the booking is saved.
+    """
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name="flavor_allocations")
+    flavor_id = models.CharField(max_length=100)
+    count = models.PositiveIntegerField()
+    end = models.DateTimeField()
+    released = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["booking", "flavor_id"], name="unique_booking_flavor"),
+        ]
+        indexes = [
+            models.Index(fields=["flavor_id", "released", "end"]),
+        ]
+
+    def __str__(self):
+        return f"{self.count} x {self.flavor_id} for booking {self.booking_id}"
+
+
+@receiver(post_save, sender=Booking)
+def on_booking_save_update_allocations(sender, instance, created, **kwargs):
+    """
+    Moves the booking's allocations to its new end date when it is extended, and releases them when it ends.
+    """
+    if created:
+        return
+
+    FlavorAllocation.objects.filter(booking_id=instance.id).exclude(
+        end=instance.end, released=instance.complete
+    ).update(end=instance.end, released=instance.complete)
@@ -0,0 +1,140 @@
+##############################################################################
+# Copyright (c) 2018 Sawyer Bergeron, Parker Berberian, and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Apache License, Version 2.0
+# which accompanies this distribution, and is available at
+# http://www.apache.org/licenses/LICENSE-2.0
+##############################################################################
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase
+
+from booking.models import Booking
+from resource_inventory.availability import FlavorTimeline, calendar, check, record_allocations
+from resource_inventory.models import FlavorAllocation
+
+T0 = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+
+
+def hosts(flavor, total, allocated=0, maintenance=0):
+    allocations = ["maintenance"] * maintenance + [{"id": "a"}] * allocated
+    allocations += [None] * (total - len(allocations))
+    return [{"name": f"{flavor}-{i}", "arch": "x86_64", "flavor": flavor, "allocation": a} for i, a in enumerate(allocations)]
+
+
+class FlavorTimelineTests(TestCase):
+
+    def test_free_steps_up_at_each_end(self):
+        timeline = FlavorTimeline(5, 4, [(T0 + timedelta(days=1), 1), (T0 + timedelta(days=3), 3)])
+
+        self.assertEqual(timeline.free_at(T0), 1)
+        self.assertEqual(timeline.free_at(T0 + timedelta(days=1)), 2)
+        self.assertEqual(timeline.free_at(T0 + timedelta(days=3)), 5)
+
+    def test_untracked_allocations_are_held(self):
+        # LibLaaS reports 4 allocated hosts, but bookings only account for 1
+        timeline = FlavorTimeline(5, 4, [(T0 + timedelta(days=1), 1)])
+
+        self.assertEqual(timeline.free_at(T0 + timedelta(days=30)), 2)
+
+    def test_free_from(self):
+        timeline = FlavorTimeline(4, 4, [(T0 + timedelta(days=1), 1), (T0 + timedelta(days=2), 2), (T0 + timedelta(days=5), 1)])
+
+        self.assertEqual(timeline.free_from(0, T0), T0)
+        self.assertEqual(timeline.free_from(2, T0), T0 + timedelta(days=2))
+        self.assertEqual(timeline.free_from(4, T0), T0 + timedelta(days=5))
+        self.assertIsNone(timeline.free_from(5, T0))
+
+
+class AvailabilityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@email.com", "testpassword")
+
+    def setUp(self):
+        caches["liblaas"].clear()
+        patcher = patch("resource_inventory.availability.flavor_list_flavors", return_value=[{"flavor_id": "small", "name": "Small"}])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def book(self, days, counts):
+        booking = Booking.objects.create(owner=self.owner, start=T0, end=T0 + timedelta(days=days), purpose="test", project="anuket")
+        record_allocations(booking, counts)
+        return booking
+
+    def test_allocations_follow_booking(self):
+        booking = self.book(2, {"small": 2})
+
+        booking.end = T0 + timedelta(days=4)
+        booking.save()
+        self.assertEqual(FlavorAllocation.objects.get(booking=booking).end, booking.end)
+
+        booking.complete = True
+        booking.save()
+        self.assertTrue(FlavorAllocation.objects.get(booking=booking).released)
+
+    @patch("resource_inventory.availability.flavor_list_hosts", return_value=hosts("small", 4, allocated=3))
+    def test_calendar(self, _):
+        self.book(1, {"small": 1})
+        self.book(3, {"small": 2})
+
+        flavor, = calendar(5, now=T0)
+
+        self.assertEqual(flavor["name"], "Small")
+        self.assertEqual(flavor["free"], 1)
+        # the bookings end at noon, so they still hold their hosts at the start of that day
+        self.assertEqual([day["free"] for day in flavor["calendar"]], [1, 1, 2, 2, 4])
+        self.assertEqual([release["count"] for release in flavor["releases"]], [1, 2])
+
+    @patch("resource_inventory.availability.flavor_list_hosts", return_value=hosts("small", 4, allocated=3))
+    def test_ended_and_extended_bookings(self, _):
+        self.book(1, {"small": 1}).delete()
+        booking = self.book(3, {"small": 3})
+        booking.end = T0 + timedelta(days=10)
+        booking.save()
+
+        flavor, = calendar(5, now=T0)
+        self.assertEqual([day["free"] for day in flavor["calendar"]], [1, 1, 1, 1, 1])
+
+        booking.complete = True
+        booking.save()
+        self.assertEqual(check({"small": 2}, now=T0)["shortages"][0]["available_from"], None)
+
+    @patch("resource_inventory.availability.flavor_list_hosts", return_value=hosts("small", 3, allocated=2, maintenance=1))
+    def test_check(self, _):
+        self.book(2, {"small": 2})
+
+        self.assertTrue(check({"small": 0}, now=T0)["available"])
+
+        result = check({"small": 2}, now=T0)
+        self.assertFalse(result["available"])
+        self.assertEqual(result["available_from"], (T0 + timedelta(days=2)).isoformat())
+        self.assertEqual(result["shortages"], [{
+            "flavor_id": "small",
+            "needed": 2,
+            "free": 0,
+            "available_from": (T0 + timedelta(days=2)).isoformat(),
+        }])
+
+        # only 2 of the 3 hosts can ever be used
+        self.assertIsNone(check({"small": 3}, now=T0)["available_from"])
+        self.assertIsNone(check({"large": 1}, now=T0)["available_from"])
+
+    @patch("resource_inventory.availability.flavor_list_hosts", return_value=hosts("small", 2))
+    def test_availability_view(self, _):
+        response = self.client.get("/resource/availability/", {"flavor": ["small", "small", "small"]})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["flavors"][0]["free"], 2)
+        self.assertFalse(data["check"]["available"])
+
+    @patch("resource_inventory.availability.flavor_list_hosts", return_value=None)
+    def test_availability_view_without_liblaas(self, _):
+        self.assertEqual(self.client.get("/resource/availability/").status_code, 503)
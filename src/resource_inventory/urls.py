@@ -10,9 +10,10 @@
 
 from django.urls import path
 
-from resource_inventory.views import host_list_view, profile_view
+from resource_inventory.views import host_list_view, profile_view, availability_view
 app_name = 'resource'
 urlpatterns = [
     path('list/', host_list_view, name='host-list'),
     path('profile/<str:resource_id>', profile_view),
+    path('availability/', availability_view, name='availability'),
 ]
\ No newline at end of file
@@ -10,10 +10,26 @@
 import json
 import os
 from django.shortcuts import render
-from django.http import HttpResponse
-from laas_dashboard.settings import PROJECT
+from django.http import HttpResponse, JsonResponse
+from laas_dashboard.settings import PROJECT, AVAILABILITY_DAYS, AVAILABILITY_MAX_DAYS
 
 from liblaas.views import flavor_list_hosts, flavor_list_flavors
+from booking.instances import active_host_bookings
+from resource_inventory.availability import calendar, check, flavor_counts
+
+
+def availability_context() -> dict:
+    """
+    Context for the resource/availability.html table. Empty if LibLaaS couldn't be reached.
+    """
+    flavors = calendar(AVAILABILITY_DAYS)
+    if not flavors:
+        return {}
+    return {
+        "availability": flavors,
+        "availability_dates": [day["date"] for day in flavors[0]["calendar"]],
+    }
+
 
 def host_list_view(request):
     if request.method != "GET":
@@ -32,10 +48,15 @@ def host_list_view(request):
         name = flavor_map[id]
         host["flavor"] = {"id": id, "name": name}
 
+    held_by = active_host_bookings([host["name"] for host in host_list])
+    for host in host_list:
+        host["booking"] = held_by.get(host["name"])
+
     template = "dashboard/table.html"
     context = {
         "hosts": host_list,
-        "flavor_map": flavor_map
+        "flavor_map": flavor_map,
+        **availability_context(),
     }
     return render(request, template, context)
 
@@ -52,8 +73,40 @@ def profile_view(request, resource_id):
             selected_flavor = flavor
             break
 
+    availability = availability_context()
     template = "resource/hostprofile_detail.html"
     context = {
-        "flavor": selected_flavor
+        "flavor": selected_flavor,
+        "availability": [f for f in availability.get("availability", []) if f["flavor_id"] == resource_id],
+        "availability_dates": availability.get("availability_dates", []),
     }
     return render(request, template, context)
+
+
+def availability_view(request):
+    """
+    The availability calendar of every flavor, see resource_inventory.availability.
+
+    Query parameters:
+        days - how many days the calendar covers, defaults to AVAILABILITY_DAYS
+        flavor - a flavor id, once per host needed. If given, the response also says whether those hosts are free now
+    """
+    if request.method != "GET":
+        return HttpResponse(status=405)
+
+    try:
+        days = int(request.GET.get("days", AVAILABILITY_DAYS))
+    except ValueError:
+        return JsonResponse(status=400, data={"message": "days must be a number"})
+    days = max(1, min(days, AVAILABILITY_MAX_DAYS))
+
+    flavors = calendar(days)
+    if flavors is None:
+        return JsonResponse(status=503, data={"message": "Unable to reach LibLaaS"})
+
+    data = {"flavors": flavors}
+    needed = request.GET.getlist("flavor")
+    if needed:
+        data["check"] = check(flavor_counts(needed))
+
+    return JsonResponse(data)
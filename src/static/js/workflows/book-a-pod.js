@@ -125,10 +125,38 @@ class BookingWorkflow extends Workflow {
         this.bookingBlob.template_id = null;
         if (isAvailable) {
             this.bookingBlob.template_id = template.id
+        } else {
+            this.showExpectedAvailability(template, available_elem);
         }
 
     }
 
+    /** Asks the dashboard when the hosts of an unavailable template are expected to be free, and adds it to the availability message */
+    showExpectedAvailability(template, available_elem) {
+        $.ajax({
+            url: '/resource/availability/',
+            data: {days: 1, flavor: template.host_list.map(host => host.flavor)},
+            traditional: true,
+            dataType: 'json',
+            timeout: 10000,
+        }).done((data) => {
+            // the user may have picked another template in the meantime
+            if (this.bookingBlob.template_id !== null || document.getElementById("template-header").textContent != template.pod_name) {
+                return;
+            }
+            const check = data.check;
+            if (!check || check.available) {
+                return;
+            }
+            if (check.available_from) {
+                const date = new Date(check.available_from);
+                available_elem.textContent = 'Resources Unavailable, expected to be free from ' + date.toLocaleString();
+            } else {
+                available_elem.textContent = 'Resources Unavailable, no date can be estimated';
+            }
+        });
+    }
+
     add_collaborator(username) {
         for (const c of this.bookingBlob.allowed_users) {
             if (c == username) {
@@ -295,13 +323,33 @@ class GUI {
 
         this.added_items = new Set();
 
-        for( let e of ["show_from_noentry", "show_x_results", "results_scrollable", "selectable_limit", "placeholder"] )
+        for( let e of ["show_from_noentry", "show_x_results", "results_scrollable", "selectable_limit", "placeholder", "search_url"] )
         {
             this[e] = format_vars[e];
         }
 
+        // state for server side search, see remote_search()
+        this.search_timer = null;
+        this.remote_query = "";
+        this.remote_page = 1;
+        this.remote_has_next = false;
+        this.remote_results = {};
+
         this.search_field_init();
 
+        if( this.search_url )
+        {
+            // load the next page of results when the user scrolls to the bottom of the dropdown
+            document.getElementById("drop_results").addEventListener("scroll", (event) => {
+                const drop = event.target;
+                if( this.remote_has_next && drop.scrollTop + drop.clientHeight >= drop.scrollHeight - 10 )
+                {
+                    this.remote_has_next = false;
+                    this.fetch_page(this.remote_query, this.remote_page + 1);
+                }
+            });
+        }
+
         if( this.show_from_noentry )
         {
             this.search("");
@@ -384,6 +432,12 @@ class GUI {
 
     search(input)
     {
+        if( this.search_url )
+        {
+            this.remote_search(input);
+            return;
+        }
+
         if( input.length == 0 && !this.show_from_noentry){
             this.dropdown([]);
             return;
@@ -406,6 +460,54 @@ class GUI {
         }
     }
 
+    remote_search(input)
+    {
+        /*
+        queries the server for matching items instead of searching the local tries.
+        requests are debounced so that one is only sent once the user pauses typing
+        */
+        clearTimeout(this.search_timer);
+
+        if( input.length == 0 && !this.show_from_noentry )
+        {
+            this.dropdown([]);
+            return;
+        }
+
+        this.search_timer = setTimeout(() => this.fetch_page(input, 1), 250);
+    }
+
+    async fetch_page(input, page)
+    {
+        const url = this.search_url + "?" + new URLSearchParams({"q": input, "page": page});
+        const response = await fetch(url);
+        if( !response.ok )
+        {
+            return;
+        }
+
+        const data = await response.json();
+
+        // the user has kept typing since this request was sent, so its results are stale
+        if( input != document.getElementById("user_field").value )
+        {
+            return;
+        }
+
+        const results = page == 1 ? {} : this.remote_results;
+        for( const item of data.items )
+        {
+            this.items[item.id] = item;
+            results[item.id] = item;
+        }
+
+        this.remote_query = input;
+        this.remote_page = page;
+        this.remote_has_next = data.has_next;
+        this.remote_results = results;
+        this.dropdown(results);
+    }
+
     getSubtree(input, given_trie)
     {
         /*
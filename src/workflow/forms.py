@@ -36,6 +36,7 @@ class SearchableSelectMultipleWidget(widgets.SelectMultiple):
         self.placeholder = attrs['placeholder']
         self.name = attrs['name']
         self.initial = attrs.get("initial", [])
+        self.search_url = attrs.get("search_url")
 
         super(SearchableSelectMultipleWidget, self).__init__()
 
@@ -54,6 +55,7 @@ class SearchableSelectMultipleWidget(widgets.SelectMultiple):
             'selectable_limit': self.selectable_limit,
             'placeholder': self.placeholder,
             'initial': self.initial,
+            'search_url': self.search_url,
         }
 
 
@@ -61,7 +63,7 @@ class SearchableSelectMultipleField(forms.Field):
     def __init__(self, *args, required=True, widget=None, label=None, disabled=False,
                  items=None, queryset=None, show_from_noentry=True, show_x_results=-1,
                  results_scrollable=False, selectable_limit=-1, placeholder="search here",
-                 name="searchable_select", initial=[], **kwargs):
+                 name="searchable_select", initial=[], search_url=None, **kwargs):
         """
         From the documentation.
 
@@ -88,6 +90,9 @@ class SearchableSelectMultipleField(forms.Field):
         #             is its widget is shown in the form but not editable.
         # label_suffix -- Suffix to be added to the label. Overrides
         #                 form's label_suffix.
+
+        If search_url is given, the widget queries it as the user types instead of
+        searching the preloaded items, so items only needs to hold the initial selection.
         """
         self.widget = widget
         if self.widget is None:
@@ -101,7 +106,8 @@ class SearchableSelectMultipleField(forms.Field):
                     'selectable_limit': selectable_limit,
                     'placeholder': placeholder,
                     'name': name,
-                    'disabled': disabled
+                    'disabled': disabled,
+                    'search_url': search_url,
                 }
             )
         self.disabled = disabled
@@ -129,9 +135,12 @@ class SearchableSelectMultipleField(forms.Field):
             if len(data_as_list) > self.selectable_limit:
                 raise ValidationError("Too many items were selected")
 
-        items = []
-        for elem in data_as_list:
-            items.append(self.queryset.get(id=elem))
+        # resolve all selections in one query, keeping the order they were picked in
+        try:
+            found = self.queryset.in_bulk(data_as_list)
+            items = [found[int(elem)] for elem in data_as_list]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError("Invalid selection")
 
         return items
 
@@ -244,7 +253,7 @@ class BookingMetaForm(forms.Form):
         self.fields['users'] = SearchableSelectMultipleField(
             queryset=UserProfile.objects.select_related('user').exclude(user=owner),
             initial=user_initial,
-            items=get_user_items(exclude=owner),
+            items=get_user_items(exclude=owner, ids=[up.id for up in user_initial]),
             required=False,
             **get_user_field_opts()
         )
\ No newline at end of file
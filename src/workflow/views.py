@@ -12,7 +12,6 @@ from laas_dashboard.settings import PROJECT, SUB_PROJECTS
 from django.http import HttpResponse, HttpRequest
 from liblaas.views import user_get_user
 from workflow.forms import BookingMetaForm
-from account.models import UserProfile
 from liblaas.views import template_list_templates
 
 
@@ -26,7 +25,7 @@ def design_a_pod_view(request):
     if not request.user.is_authenticated:
         return login(request)
 
-    profile = UserProfile.objects.get(user=request.user)
+    profile = request.user_profile
 
     if (not profile or profile.ipa_username == None):
         return redirect("dashboard:index")
@@ -50,7 +49,7 @@ def book_a_pod_view(request: HttpRequest):
     if not request.user.is_authenticated:
         return login(request)
 
-    profile = UserProfile.objects.get(user=request.user)
+    profile = request.user_profile
 
     if (not profile or profile.ipa_username == None):
         return redirect("dashboard:index")
@@ -64,7 +63,7 @@ def book_a_pod_view(request: HttpRequest):
     }
 
     
-    template_list = template_list_templates(request.user.userprofile.ipa_username, PROJECT)
+    template_list = template_list_templates(profile.ipa_username, PROJECT)
     
     if not template_list:
         return HttpResponse(status=500)
@@ -77,7 +76,7 @@ def book_a_pod_view(request: HttpRequest):
     }
 
     for template in template_list:
-        if template.get("owner") == request.user.userprofile.ipa_username:
+        if template.get("owner") == profile.ipa_username:
             templates["private"].append(template)
         else:
             templates["public"].append(template)
@@ -7,6 +7,14 @@
 # which accompanies this distribution, and is available at
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
+
+# Metrics of every gunicorn worker, and of the celery worker container, are kept in METRICS_VOLUME if it is set
+if [ -n "$METRICS_VOLUME" ]; then
+    export PROMETHEUS_MULTIPROC_DIR="$METRICS_VOLUME/web"
+    export METRICS_DIRS="${METRICS_DIRS:-$METRICS_VOLUME/web,$METRICS_VOLUME/worker}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 python manage.py migrate && \
 python manage.py collectstatic --no-input && \
-gunicorn laas_dashboard.wsgi -b 0.0.0.0:8000
+gunicorn laas_dashboard.wsgi -c laas_dashboard/gunicorn.conf.py
@@ -8,4 +8,10 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 ##############################################################################
 
+# Metrics of the celery processes are kept in METRICS_VOLUME if it is set, the web container serves them
+if [ -n "$METRICS_VOLUME" ]; then
+    export PROMETHEUS_MULTIPROC_DIR="$METRICS_VOLUME/worker"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 celery -A laas_dashboard worker -l info -B --schedule=/home/celery/schedule